@@ -28,7 +28,10 @@ class AppSelector(Gtk.VBox):
             self.load_from_settings(settings_module)
     
     def load_from_settings(self, settings_module):
-        [self._model.append((False, app,)) for app in settings_module.INSTALLED_APPS]
+        self.load_apps(settings_module.INSTALLED_APPS)
+    
+    def load_apps(self, apps):
+        [self._model.append((False, app,)) for app in apps]
     
     def get_selected(self, short_names=True):
         selected = []
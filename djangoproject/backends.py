@@ -0,0 +1,156 @@
+import pipes
+import logging
+from collections import OrderedDict
+from cache import cache_path, load_json, save_json
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+def application_path(project, setting, module):
+    """
+    Return the 'module:callable' of the project's WSGI or ASGI application
+    from setting, or guess it as module next to the settings module.
+    """
+    path = project.get_info(setting)
+    if not path:
+        package = (project.get_info('settings_module') or '').rpartition('.')[0]
+        path = "%s.%s.application" % (package, module) if package else \
+               "%s.application" % module
+    module, dot, name = path.rpartition('.')
+    return "%s:%s" % (module, name)
+
+
+class ServerBackend(object):
+    """
+    A way of serving the project in the Django Server panel. Subclasses set
+    the name and label and must define get_command(project), returning the
+    command line which serves project built from the configurable options:
+    workers is the number of worker processes and reload restarts the server
+    when code changes. When wrapper is set to a
+    Python script the server is run through it, as in
+    'python wrapper manage.py runserver' or 'python wrapper -m gunicorn'.
+    """
+    name = None
+    label = None
+    supports_workers = True
+    supports_reload = True
+
+    def __init__(self, host='127.0.0.1', port=8000, workers=1, reload=True):
+        if not callable(getattr(self, 'get_command', None)):
+            raise TypeError("%s must define get_command() to serve the "
+                            "project" % type(self).__name__)
+        # configurable options
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.reload = reload
+        self.wrapper = None
+
+    def get_address(self):
+        return (self.host, self.port)
+
+    def get_settings(self):
+        return {'host': self.host, 'port': self.port, 'workers': self.workers,
+                'reload': self.reload}
+
+    def set_settings(self, settings):
+        for key in ('host', 'port', 'workers', 'reload'):
+            if key in settings:
+                setattr(self, key, settings[key])
+
+    def _run(self, project, target):
+        """ Return the command line running target with project's python. """
+        python = pipes.quote(project.get_python())
+        if self.wrapper:
+            python += " " + pipes.quote(self.wrapper)
+        return "%s %s" % (python, target)
+
+
+class RunserverBackend(ServerBackend):
+    """ Django's single process development server, manage.py runserver. """
+    name = 'runserver'
+    label = "_runserver"
+    supports_workers = False
+
+    def get_command(self, project):
+        command = self._run(project, "manage.py runserver")
+        if not self.reload:
+            command += " --noreload"
+        return "%s %s:%d" % (command, self.host, self.port)
+
+
+class GunicornBackend(ServerBackend):
+    """ gunicorn serving the WSGI application with several workers. """
+    name = 'gunicorn'
+    label = "_gunicorn (WSGI)"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('workers', 4)
+        kwargs.setdefault('reload', False)
+        ServerBackend.__init__(self, **kwargs)
+
+    def get_command(self, project):
+        command = self._run(project, "-m gunicorn --workers %d --bind %s:%d "
+                            "--access-logfile -" % (self.workers, self.host, 
+                                                    self.port))
+        if self.reload:
+            command += " --reload"
+        return "%s %s" % (command, application_path(project, 'wsgi_application',
+                                                      'wsgi'))
+
+
+class UvicornBackend(ServerBackend):
+    """
+    uvicorn serving the ASGI application. uvicorn cannot reload with more
+    than one worker, so reload runs a single worker.
+    """
+    name = 'uvicorn'
+    label = "_uvicorn (ASGI)"
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('workers', 4)
+        kwargs.setdefault('reload', False)
+        ServerBackend.__init__(self, **kwargs)
+
+    def get_command(self, project):
+        command = self._run(project, "-m uvicorn --host %s --port %d" % (
+                            self.host, self.port))
+        if self.reload:
+            command += " --reload"
+        else:
+            command += " --workers %d" % self.workers
+        return "%s %s" % (command, application_path(project, 'asgi_application',
+                                                      'asgi'))
+
+
+class DaphneBackend(ServerBackend):
+    """ daphne serving the ASGI application in a single process. """
+    name = 'daphne'
+    label = "_daphne (ASGI)"
+    supports_workers = False
+    supports_reload = False
+
+    def get_command(self, project):
+        return self._run(project, "-m daphne --bind %s --port %d %s" % (
+                         self.host, self.port,
+                         application_path(project, 'asgi_application', 'asgi')))
+
+
+BACKENDS = (RunserverBackend, GunicornBackend, UvicornBackend, DaphneBackend)
+
+def load_backends():
+    """ Return an OrderedDict of backends by name with their saved settings. """
+    saved = load_json(cache_path('server-backends.json'), {})
+    backends = OrderedDict()
+    for cls in BACKENDS:
+        backend = cls()
+        backend.set_settings(saved.get(cls.name, {}))
+        backends[cls.name] = backend
+    return backends
+
+def save_backends(backends):
+    save_json(cache_path('server-backends.json'),
+              dict((name, backend.get_settings())
+                   for name, backend in backends.items()))
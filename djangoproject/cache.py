@@ -0,0 +1,46 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from gi.repository import GLib
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+CACHE_DIR = os.path.join(GLib.get_user_cache_dir(), 'gedit-django-project')
+
+def cache_path(*parts):
+    """
+    Return a path within the plugin's cache directory, creating the parent
+    directories as needed.
+    """
+    path = os.path.join(CACHE_DIR, *parts)
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    return path
+
+def project_key(path):
+    """ Return a key which identifies a project path in cache file names. """
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+def load_json(filename, default=None):
+    """ Load a JSON file returning default if it is missing or invalid. """
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def save_json(filename, data):
+    """ Atomically replace filename with data as JSON. """
+    try:
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(filename))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(temp, filename)
+    except (IOError, OSError) as e:
+        logger.warn("Could not write %s: %s" % (filename, e))
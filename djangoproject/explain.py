@@ -0,0 +1,145 @@
+import re
+from gi.repository import Gtk, Pango
+
+EXPENSIVE_SHARE = 0.2 # of the total, for a node to be highlighted
+EXPENSIVE_NODES = 3
+MISESTIMATE_FACTOR = 10
+EXPENSIVE_COLOR = '#C00000'
+MISESTIMATE_COLOR = '#C06000'
+
+_word_re = re.compile(r'[a-z_]+')
+_writes = frozenset(('insert', 'update', 'delete', 'merge'))
+
+(COL_NODE, COL_DETAIL, COL_ESTIMATED, COL_ACTUAL, COL_LOOPS, COL_COST,
+ COL_TIME, COL_SHARE, COL_WEIGHT, COL_FOREGROUND) = range(10)
+
+def is_read_only(sql):
+    """
+    Return True if sql is a query which doesn't write, as far as its
+    keywords tell: a SELECT, VALUES or TABLE, or a WITH query without
+    INSERT, UPDATE, DELETE or MERGE in it.
+    """
+    words = _word_re.findall(sql.lower())
+    if not words:
+        return False
+    if words[0] == 'with':
+        return not _writes.intersection(words)
+    return words[0] in ('select', 'values', 'table')
+
+def _value(value):
+    return "" if value is None else str(value)
+
+def own_weight(node, key):
+    """
+    Return what a plan node spent itself on key, 'time' or 'cost', which
+    are inclusive of its children.
+    """
+    total = node.get(key) or 0.0
+    children = sum(child.get(key) or 0.0 for child in node['children'])
+    return max(total - children, 0.0)
+
+def misestimated(node):
+    """ Return True if the planner was off by MISESTIMATE_FACTOR or more. """
+    estimated, actual = node.get('estimated_rows'), node.get('actual_rows')
+    if estimated is None or actual is None:
+        return False
+    # both are per loop
+    low, high = sorted((max(estimated, 1), max(actual, 1)))
+    return high >= low * MISESTIMATE_FACTOR
+
+
+class PlanView(Gtk.VBox):
+    """
+    A query plan as sent by the djp_explain.py helper, shown as a tree with
+    the estimated and actual rows, cost and time of each node.
+
+    The share of a node is the time it took itself, excluding its children,
+    or the cost when the statement was not analyzed. Nodes with the largest
+    shares are highlighted in red, and nodes whose row estimate was off by
+    MISESTIMATE_FACTOR or more in orange.
+    """
+    __gtype_name__ = "DjangoProjectPlanView"
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self._model = Gtk.TreeStore(str, str, str, str, str, str, str, float,
+                                    int, str)
+        self._label = Gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        self._label.set_selectable(True)
+        self._label.set_ellipsize(Pango.EllipsizeMode.END)
+        self._label.set_padding(3, 3)
+        self.pack_start(self._label, False, False, 0)
+
+        self._view = Gtk.TreeView.new_with_model(self._model)
+        self._view.set_rules_hint(True)
+        for title, index in (("Node", COL_NODE), ("Est. Rows", COL_ESTIMATED),
+                             ("Rows", COL_ACTUAL), ("Loops", COL_LOOPS),
+                             ("Cost", COL_COST), ("Time (ms)", COL_TIME),
+                             ("Share", COL_SHARE), ("Detail", COL_DETAIL)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index,
+                                        weight=COL_WEIGHT,
+                                        foreground=COL_FOREGROUND)
+            if index == COL_SHARE:
+                column.set_cell_data_func(cell, self._format_share, index)
+            if index not in (COL_NODE, COL_DETAIL):
+                cell.set_alignment(1.0, 0.5)
+            if index == COL_DETAIL:
+                cell.set_property("ellipsize", Pango.EllipsizeMode.END)
+                column.set_expand(True)
+            column.set_resizable(True)
+            self._view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(self._view)
+        self.pack_start(scrolled, True, True, 0)
+        self.show_all()
+
+    def load(self, data):
+        """ Show a plan as sent by the djp_explain.py helper. """
+        plan = data['plan']
+        key = 'time' if data.get('analyze') and plan.get('time') else 'cost'
+        nodes = []
+        def walk(node):
+            nodes.append(node)
+            for child in node['children']:
+                walk(child)
+        walk(plan)
+        weights = dict((id(node), own_weight(node, key)) for node in nodes)
+        total = sum(weights.values())
+        ranked = sorted(nodes, key=lambda node: weights[id(node)], reverse=True)
+        expensive = set(id(node) for node in ranked[:EXPENSIVE_NODES]
+                        if total and weights[id(node)] >= total * EXPENSIVE_SHARE)
+
+        self._label.set_text("%s%s, %.1f ms: %s" % (data.get('vendor'),
+                             " (analyzed)" if data.get('analyze') else "",
+                             (data.get('time') or 0.0) * 1000,
+                             " ".join(data.get('sql', '').split())))
+        self._view.set_model(None)
+        self._model.clear()
+        def add(parent, node):
+            share = weights[id(node)] / float(total) if total else 0.0
+            color = None
+            if id(node) in expensive:
+                color = EXPENSIVE_COLOR
+            elif misestimated(node):
+                color = MISESTIMATE_COLOR
+            elapsed = node.get('time')
+            it = self._model.append(parent, (node['label'], node['detail'],
+                    _value(node.get('estimated_rows')),
+                    _value(node.get('actual_rows')), _value(node.get('loops')),
+                    _value(node.get('cost')),
+                    "" if elapsed is None else "%.3f" % (elapsed * 1000),
+                    share, Pango.Weight.BOLD if color else Pango.Weight.NORMAL,
+                    color))
+            for child in node['children']:
+                add(it, child)
+        add(None, plan)
+        self._view.set_model(self._model)
+        self._view.expand_all()
+
+    def _format_share(self, column, cell, model, it, index):
+        share = model.get_value(it, index)
+        cell.set_property("text", "%.1f%%" % (share * 100) if share else "")
@@ -0,0 +1,120 @@
+"""
+Shared start up code for the helper scripts the gedit Django Project plugin
+runs with the project's Python interpreter. Helper scripts are run from the
+project directory with DJANGO_SETTINGS_MODULE set in the environment.
+
+The helpers only depend on the standard library and Django and work with both
+Python 2 and Python 3.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+
+
+def setup_path():
+    """ Make the project importable ahead of the helpers directory. """
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+
+
+def setup_django():
+    """ Make the project importable and set up Django. Returns django. """
+    setup_path()
+    import django
+    if hasattr(django, 'setup'):
+        django.setup()
+    return django
+
+
+def source_file(filename):
+    """ Return the .py file for a module's __file__ which may be a .pyc. """
+    if filename and filename.endswith(('.pyc', '.pyo')):
+        filename = filename[:-1]
+    return filename
+
+
+def watch_files():
+    """
+    Return the settings file and the models modules of the installed apps,
+    the files which invalidate a bootstrapped Django when they change.
+    Models packages are returned as directories.
+    """
+    from django.conf import settings
+    modules = [sys.modules.get(settings.SETTINGS_MODULE)]
+    try:
+        from django.apps import apps
+        modules += [config.models_module for config in apps.get_app_configs()]
+    except ImportError:
+        from django.db import models
+        modules += models.get_apps()
+    files = []
+    for module in modules:
+        filename = source_file(getattr(module, '__file__', None))
+        if not filename:
+            continue
+        if os.path.basename(filename) == '__init__.py':
+            filename = os.path.dirname(filename)
+        files.append(os.path.abspath(filename))
+    return files
+
+
+def parse_options(args):
+    """
+    Return the args and options of a command line, parsed with the command's
+    parser when call_command() won't parse option strings itself: before
+    Django 1.8 and for commands still using optparse before 1.10.
+    """
+    import django
+    if django.VERSION >= (1, 10) or not args:
+        return args, {}
+    from django.core.management import get_commands, load_command_class
+    from django.core.management.base import BaseCommand
+    name = args[0]
+    try:
+        app_name = get_commands()[name]
+    except KeyError:
+        return args, {} # call_command reports the unknown command
+    if isinstance(app_name, BaseCommand):
+        command = app_name
+    else:
+        command = load_command_class(app_name, name)
+    if getattr(command, 'use_argparse', False):
+        return args, {}
+    parser = command.create_parser('manage.py', name)
+    options, positional = parser.parse_args(list(args[1:]))
+    return [name] + positional, vars(options)
+
+
+def dump(data, out=None):
+    """ Write data as a single line of JSON. """
+    out = out or sys.stdout
+    out.write(json.dumps(data) + "\n")
+    out.flush()
+
+
+def progress(fraction, text):
+    """ Report progress, fraction is from 0.0 to 1.0 or None if unknown. """
+    dump({"event": "progress", "fraction": fraction, "text": text})
+
+
+def message(text, tag='info'):
+    """ Show a message in the output panel. """
+    dump({"event": "message", "text": text, "tag": tag})
+
+
+def result(data):
+    """ Send the result of the helper to the plugin. """
+    dump({"event": "result", "data": data})
+
+
+def event(name, data):
+    """ Send an event of the helper's own, such as a test result. """
+    dump({"event": name, "data": data})
+
+
+def exit_on_sigterm():
+    """ Turn SIGTERM into SystemExit so finally blocks get to clean up. """
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
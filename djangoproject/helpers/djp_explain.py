@@ -0,0 +1,166 @@
+"""
+Explain a SQL statement for the gedit Django Project plugin.
+
+    djp_explain.py [--analyze [--allow-writes]] [--database ALIAS] STATEMENT
+
+The statement is explained through the project's database connection and the
+plan is sent as the result, a tree of nodes:
+
+    {"vendor": "postgresql", "analyze": true, "sql": "...", "time": 0.02,
+     "plan": {"label", "detail", "estimated_rows", "actual_rows", "loops",
+              "cost", "time", "children": [...]}}
+
+PostgreSQL plans come from EXPLAIN (FORMAT JSON), with ANALYZE if asked for.
+SQLite only has EXPLAIN QUERY PLAN which gives neither rows nor costs, with
+--analyze the statement is run and its row count and time are set on the
+root. With ANALYZE the statement runs in a transaction which is rolled back,
+so changes it makes are not kept.
+"""
+from __future__ import print_function
+import re
+import sys
+import json
+import time
+
+from djp_bootstrap import setup_django, progress, result, exit_on_sigterm
+
+SQLITE_PLAN_TREE = (3, 24, 0) # EXPLAIN QUERY PLAN returns parent ids
+
+_word_re = re.compile(r'[a-z_]+')
+_writes = frozenset(('insert', 'update', 'delete', 'merge'))
+
+
+def is_read_only(sql):
+    """
+    Return True if sql is a query which doesn't write, as far as its
+    keywords tell: a SELECT, VALUES or TABLE, or a WITH query without
+    INSERT, UPDATE, DELETE or MERGE in it.
+    """
+    words = _word_re.findall(sql.lower())
+    if not words:
+        return False
+    if words[0] == 'with':
+        return not _writes.intersection(words)
+    return words[0] in ('select', 'values', 'table')
+
+
+def node(label, detail="", estimated_rows=None, actual_rows=None, loops=None,
+         cost=None, time=None):
+    return {'label': label, 'detail': detail, 'estimated_rows': estimated_rows,
+            'actual_rows': actual_rows, 'loops': loops, 'cost': cost,
+            'time': time, 'children': []}
+
+
+def postgresql_node(plan):
+    details = []
+    for key in ('Relation Name', 'Index Name', 'Join Type', 'Hash Cond',
+                'Index Cond', 'Filter', 'Sort Key'):
+        if key in plan:
+            value = plan[key]
+            if isinstance(value, list):
+                value = ", ".join(value)
+            details.append("%s: %s" % (key, value))
+    loops = plan.get('Actual Loops')
+    elapsed = plan.get('Actual Total Time')
+    if elapsed is not None:
+        # per loop in milliseconds, report the total in seconds
+        elapsed = elapsed * (loops or 1) / 1000.0
+    result_node = node(plan.get('Node Type', '?'), "; ".join(details),
+                       plan.get('Plan Rows'), plan.get('Actual Rows'), loops,
+                       plan.get('Total Cost'), elapsed)
+    for child in plan.get('Plans', []):
+        result_node['children'].append(postgresql_node(child))
+    return result_node
+
+
+def explain_postgresql(cursor, sql, analyze):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cursor.execute("EXPLAIN (%s) %s" % (options, sql))
+    data = cursor.fetchone()[0]
+    if not isinstance(data, list):
+        data = json.loads(data)
+    return postgresql_node(data[0]['Plan'])
+
+
+def explain_sqlite(cursor, sql, analyze):
+    import sqlite3
+    # (id, parent, notused, detail) since 3.24, before that the rows are
+    # (selectid, order, from, detail) and are shown flat under the root
+    nested = sqlite3.sqlite_version_info >= SQLITE_PLAN_TREE
+    cursor.execute("EXPLAIN QUERY PLAN %s" % sql)
+    root = node("Query")
+    nodes = {0: root}
+    for row in cursor.fetchall():
+        if nested:
+            node_id, parent, detail = row[0], row[1], row[3]
+        else:
+            node_id, parent, detail = None, 0, row[-1]
+        label, sep, rest = detail.partition(" ")
+        item = node(label, rest)
+        nodes.setdefault(parent, root)['children'].append(item)
+        if node_id is not None:
+            nodes[node_id] = item
+    if analyze:
+        started = time.time()
+        cursor.execute(sql)
+        rows = len(cursor.fetchall()) if cursor.description else cursor.rowcount
+        root['time'] = time.time() - started
+        root['actual_rows'] = rows
+    return root
+
+
+def explain_other(cursor, sql, analyze):
+    cursor.execute("EXPLAIN %s" % sql)
+    columns = [column[0] for column in cursor.description or []]
+    root = node("Query")
+    for row in cursor.fetchall():
+        root['children'].append(node(" ".join(str(value) for value in row[:1]),
+                                     ", ".join("%s: %s" % item for item in
+                                               zip(columns[1:], row[1:]))))
+    return root
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    analyze = False
+    alias = 'default'
+    allow_writes = False
+    while len(args) > 1 and args[0] in ('--analyze', '--allow-writes',
+                                        '--database'):
+        option = args.pop(0)
+        if option == '--analyze':
+            analyze = True
+        elif option == '--allow-writes':
+            allow_writes = True
+        else:
+            alias = args.pop(0)
+    sql = " ".join(args).strip().rstrip(';').strip()
+    if not sql:
+        print("No SQL statement to explain.", file=sys.stderr)
+        sys.exit(2)
+    if analyze and not allow_writes and not is_read_only(sql):
+        print("Not analyzing a statement which may write, pass --allow-writes "
+              "to run it anyway.", file=sys.stderr)
+        sys.exit(2)
+    setup_django()
+    from django.db import connections, transaction
+    connection = connections[alias]
+    progress(None, "Explaining on %s (%s)..." % (alias, connection.vendor))
+    explain = {'postgresql': explain_postgresql,
+               'sqlite': explain_sqlite}.get(connection.vendor, explain_other)
+    started = time.time()
+    with transaction.atomic(using=alias):
+        cursor = connection.cursor()
+        try:
+            plan = explain(cursor, sql, analyze)
+        finally:
+            cursor.close()
+            # never keep what an analyzed statement changed
+            transaction.set_rollback(True, using=alias)
+    result({'vendor': connection.vendor, 'analyze': analyze, 'sql': sql,
+            'time': time.time() - started, 'plan': plan})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Streaming fixture dumps and loads for the gedit Django Project plugin.
+
+    djp_fixtures.py dump OUTPUT [APP ...]
+    djp_fixtures.py load [--batch-size N] FIXTURE [FIXTURE ...]
+
+dump streams dumpdata straight into OUTPUT in the format and compressed
+according to its extensions (e.g. .json, .xml or .yaml and .gz, .bz2 or .xz),
+reporting bytes and objects per second as it goes. The file is written as OUTPUT.part and renamed once complete.
+
+load passes the fixtures to a single loaddata by default, so they may refer
+to each other. With a batch size N, JSON fixtures, compressed or not, are
+instead read incrementally and saved N objects at a time so a huge fixture
+is never parsed in one piece, reporting progress per file. Other fixtures
+are passed to loaddata one at a time. Everything is loaded in a single
+transaction with constraint checks deferred until all fixtures are in, so a
+failure leaves the database as it was.
+"""
+from __future__ import print_function
+import os
+import io
+import sys
+import bz2
+import json
+import time
+import zlib
+import codecs
+
+from djp_bootstrap import setup_django, progress, message, exit_on_sigterm
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+BLOCK_SIZE = 1048576
+PROGRESS_INTERVAL = 0.5 # seconds
+DEFAULT_BATCH_SIZE = 0
+SEPARATORS = u' \t\r\n,'
+# what starts each object in a dump, by format
+OBJECT_MARKERS = {'json': '"model":', 'xml': '<object ', 'yaml': '- model:'}
+
+
+def compression(filename):
+    """ Return the compression of filename from its extension, or None. """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.gz', '.bz2', '.xz'):
+        if ext == '.xz' and lzma is None:
+            raise IOError("xz compression needs the lzma module")
+        return ext[1:]
+
+
+def fixture_format(filename):
+    """ Return the serialization format of filename, e.g. 'json'. """
+    name = filename
+    if compression(filename):
+        name = os.path.splitext(filename)[0]
+    return os.path.splitext(name)[1].lower().lstrip('.')
+
+
+def human_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    return "%.1f %s" % (size, unit)
+
+
+class DumpWriter(object):
+    """
+    A file-like object for dumpdata's stdout which writes to a compressed or
+    plain binary file, counting bytes and objects and reporting the rate.
+    """
+    def __init__(self, filename, marker=OBJECT_MARKERS['json']):
+        kind = compression(filename)
+        if kind == 'gz':
+            import gzip
+            self._file = gzip.GzipFile(filename, 'wb')
+        elif kind == 'bz2':
+            self._file = bz2.BZ2File(filename, 'wb')
+        elif kind == 'xz':
+            self._file = lzma.LZMAFile(filename, 'wb')
+        else:
+            self._file = io.open(filename, 'wb')
+        self.bytes = 0
+        self.objects = 0
+        self._marker = marker
+        self._tail = ''
+        self._started = self._reported = time.time()
+
+    def write(self, text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self._file.write(text)
+        self.bytes += len(text)
+        # count objects by their marker, keeping a tail for markers split
+        # across writes
+        data = self._tail + text.decode('utf-8', 'ignore')
+        self.objects += data.count(self._marker)
+        self._tail = data[-(len(self._marker) - 1):]
+        if time.time() - self._reported >= PROGRESS_INTERVAL:
+            self.report()
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        self._file.close()
+
+    def report(self):
+        self._reported = time.time()
+        elapsed = max(self._reported - self._started, 0.001)
+        progress(None, "Dumped %s, %d objects (%s/s, %d objects/s)" % (
+                 human_size(self.bytes), self.objects,
+                 human_size(self.bytes / elapsed), self.objects / elapsed))
+
+
+def dump(output, apps):
+    from django.core.management import call_command
+    from django.core import serializers
+    format = fixture_format(output) or 'json'
+    if format not in serializers.get_serializer_formats():
+        print("Cannot dump to %s, '%s' is not a serialization format." % (
+              output, format), file=sys.stderr)
+        sys.exit(1)
+    part = output + '.part'
+    writer = DumpWriter(part, OBJECT_MARKERS.get(format, '"model":'))
+    try:
+        try:
+            call_command('dumpdata', *apps, format=format, stdout=writer)
+        finally:
+            writer.close()
+        os.rename(part, output)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    elapsed = time.time() - writer._started
+    message("Dumped %d objects (%s, %s on disk) to %s in %.2fs\n" % (
+            writer.objects, human_size(writer.bytes),
+            human_size(os.path.getsize(output)), output, elapsed))
+
+
+class DecompressingReader(object):
+    """ Read a compressed file, keeping track of the compressed position. """
+    def __init__(self, filename):
+        self.raw = io.open(filename, 'rb')
+        kind = compression(filename)
+        if kind == 'gz':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif kind == 'bz2':
+            self._decompressor = bz2.BZ2Decompressor()
+        elif kind == 'xz':
+            self._decompressor = lzma.LZMADecompressor()
+        else:
+            self._decompressor = None
+        self._buffer = b''
+
+    def read(self, size=-1):
+        if self._decompressor is None:
+            return self.raw.read(size)
+        while size < 0 or len(self._buffer) < size:
+            data = self.raw.read(BLOCK_SIZE)
+            if not data:
+                break
+            self._buffer += self._decompressor.decompress(data)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self.raw.close()
+
+
+def iter_objects(stream):
+    """ Yield the objects of a JSON array read incrementally from stream. """
+    decoder = json.JSONDecoder()
+    reader = codecs.getreader('utf-8')(stream)
+    buf = u''
+    pos = 0
+    started = eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in SEPARATORS:
+            pos += 1
+        if pos < len(buf) and not started:
+            if buf[pos] != u'[':
+                raise ValueError("Fixture is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if pos < len(buf) and buf[pos] == u']':
+            return
+        if pos < len(buf):
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+                yield obj
+                continue
+            except ValueError:
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("Unexpected end of fixture")
+        # the next object is incomplete, read some more
+        data = reader.read(BLOCK_SIZE)
+        eof = not data
+        buf = buf[pos:] + data
+        pos = 0
+
+
+def load_batches(filename, batch_size, report, connection, models):
+    """
+    Save the objects of a JSON fixture batch_size at a time, adding their
+    models to the set models.
+    """
+    from django.core import serializers
+    reader = DecompressingReader(filename)
+    size = max(os.path.getsize(filename), 1)
+    loaded = 0
+    batch = []
+
+    def flush():
+        for obj in serializers.deserialize('json', json.dumps(batch),
+                                           using=connection.alias):
+            obj.save(using=connection.alias)
+            models.add(type(obj.object))
+        report(float(reader.raw.tell()) / size, loaded)
+        del batch[:]
+
+    try:
+        for obj in iter_objects(reader):
+            batch.append(obj)
+            loaded += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        reader.close()
+    return loaded
+
+
+def reset_sequences(connection, models):
+    """ Move the sequences of models past the primary keys loaded. """
+    from django.core.management.color import no_style
+    statements = connection.ops.sequence_reset_sql(no_style(), list(models))
+    if statements:
+        cursor = connection.cursor()
+        try:
+            for sql in statements:
+                cursor.execute(sql)
+        finally:
+            cursor.close()
+
+
+def load_files(fixtures, batch_size, connection):
+    """
+    Load the fixtures, JSON ones in batches, returning the number of objects
+    loaded in batches and the set of their models.
+    """
+    from django.core.management import call_command
+    total = 0
+    models = set()
+    for index, filename in enumerate(fixtures):
+        name = os.path.basename(filename)
+        file_started = time.time()
+
+        def report(fraction, objects):
+            elapsed = max(time.time() - file_started, 0.001)
+            progress((index + fraction) / len(fixtures),
+                     "Loading %s (%d of %d): %d objects (%d objects/s)" % (
+                     name, index + 1, len(fixtures), objects, objects / elapsed))
+
+        report(0.0, 0)
+        if fixture_format(filename) == 'json':
+            count = load_batches(filename, batch_size, report, connection,
+                                 models)
+            message("Loaded %d objects from %s in %.2fs\n" % (count, name,
+                    time.time() - file_started))
+            total += count
+        else:
+            call_command('loaddata', filename)
+            message("Loaded %s in %.2fs\n" % (name, time.time() - file_started))
+    return total, models
+
+
+def load(fixtures, batch_size):
+    from django.core.management import call_command
+    started = time.time()
+    if not batch_size:
+        progress(None, "Loading %d fixtures..." % len(fixtures))
+        call_command('loaddata', *fixtures)
+        message("Loaded %d fixtures in %.2fs\n" % (len(fixtures),
+                time.time() - started))
+        return
+    from django.db import connection, transaction
+    atomic = getattr(transaction, 'atomic', None) or \
+             transaction.commit_on_success
+    with atomic(using=connection.alias):
+        with connection.constraint_checks_disabled():
+            count, models = load_files(fixtures, batch_size, connection)
+        progress(None, "Checking constraints...")
+        connection.check_constraints(table_names=[model._meta.db_table
+                                                  for model in models])
+        reset_sequences(connection, models)
+    message("Loaded %d fixtures (%d objects in batches) in %.2fs\n" % (
+            len(fixtures), count, time.time() - started))
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    if not args or args[0] not in ('dump', 'load'):
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    mode = args.pop(0)
+    setup_django()
+    if mode == 'dump':
+        dump(args[0], args[1:])
+    else:
+        batch_size = DEFAULT_BATCH_SIZE
+        if args and args[0] == '--batch-size':
+            batch_size = int(args[1])
+            args = args[2:]
+        load(args, batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Profile the imports of the project's Django start up for the gedit Django
+Project plugin.
+
+    djp_importtime.py
+
+Django is set up in a child interpreter run with -X importtime on Python 3.7
+and later. Older interpreters, Python 2 included, set up Django here with an
+__import__ hook timing each import instead, where importing a.b.c counts as
+the single module a.b.c.
+
+The modules are sent as the result in the order they were imported, each
+with the index of the module which imported it, its own and cumulative time
+in seconds and the group it belongs to, the top level package, and whether
+that is part of the project, third-party or the standard library:
+
+    {"method": "importtime", "total": 0.8,
+     "modules": [{"name", "file", "self", "cumulative", "parent", "group",
+                  "kind"}]}
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import subprocess
+import sysconfig
+
+from djp_bootstrap import setup_django, progress, result, source_file
+
+IMPORTTIME_PREFIX = "import time:"
+# the level __import__ is called with when it is left out
+DEFAULT_LEVEL = -1 if sys.version_info[0] < 3 else 0
+CHILD_SCRIPT = """
+import os, sys, json
+sys.path.insert(0, os.getcwd())
+import django
+django.setup()
+files = dict((name, getattr(module, '__file__', None))
+             for name, module in list(sys.modules.items()) if module)
+sys.stdout.write(json.dumps(files))
+"""
+
+
+class Classifier(object):
+    """ Tell project, third-party and standard library modules apart. """
+    def __init__(self):
+        self.project = os.getcwd() + os.sep
+        paths = sysconfig.get_paths()
+        self.stdlib = [paths[name] + os.sep for name in ('stdlib', 'platstdlib')
+                       if paths.get(name)]
+
+    def kind(self, filename):
+        if not filename:
+            return 'stdlib' # built in
+        filename = os.path.abspath(filename)
+        if 'site-packages' in filename or 'dist-packages' in filename:
+            return 'third-party'
+        if filename.startswith(self.project):
+            return 'project'
+        if any(filename.startswith(path) for path in self.stdlib):
+            return 'stdlib'
+        return 'third-party'
+
+
+def flatten(roots, files):
+    """ Return the module trees as a list in import order with parents. """
+    classifier = Classifier()
+    modules = []
+    def add(node, parent):
+        name = node['name']
+        filename = source_file(files.get(name))
+        kind = classifier.kind(filename)
+        modules.append({'name': name, 'file': filename, 'self': node['self'],
+                        'cumulative': node['cumulative'], 'parent': parent,
+                        'group': 'stdlib' if kind == 'stdlib' else
+                                 name.split('.')[0],
+                        'kind': kind})
+        index = len(modules) - 1
+        for child in node['children']:
+            add(child, index)
+    for root in roots:
+        add(root, None)
+    return modules
+
+
+def parse_importtime(lines):
+    """
+    Return the trees of modules from -X importtime output, which lists each
+    module after the modules it imported, indented two spaces a level.
+    """
+    pending = {}
+    for line in lines:
+        if not line.startswith(IMPORTTIME_PREFIX):
+            continue
+        fields = line[len(IMPORTTIME_PREFIX):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue # the header
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        node = {'name': name.strip(), 'self': int(fields[0]) / 1e6,
+                'cumulative': int(fields[1]) / 1e6,
+                'children': pending.pop(depth + 1, [])}
+        pending.setdefault(depth, []).append(node)
+    return pending.get(0, [])
+
+
+def profile_importtime():
+    progress(None, "Setting up Django with -X importtime...")
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                                CHILD_SCRIPT], stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    out, err = process.communicate()
+    if process.returncode != 0:
+        lines = [line for line in err.splitlines()
+                 if not line.startswith(IMPORTTIME_PREFIX)]
+        sys.stderr.write("\n".join(lines) + "\n")
+        sys.exit(process.returncode)
+    return parse_importtime(err.splitlines()), json.loads(out)
+
+
+def profile_hook():
+    """ Set up Django here, timing imports with an __import__ hook. """
+    try:
+        import builtins
+    except ImportError:
+        import __builtin__ as builtins
+    progress(None, "Setting up Django with an import hook...")
+    original = builtins.__import__
+    roots = []
+    stack = []
+    def resolve(name, globals, level):
+        """ Return the absolute name of an import, for display only. """
+        if not level or not globals:
+            return name
+        package = globals.get('__package__') or globals.get('__name__', '')
+        if '__path__' not in globals and not globals.get('__package__'):
+            package = package.rpartition('.')[0]
+        if level < 0:
+            # an implicit relative import of Python 2, tried within the
+            # package first, which leaves None in sys.modules if it isn't
+            relative = "%s.%s" % (package, name) if package else name
+            return relative if sys.modules.get(relative) is not None else name
+        for i in range(level - 1):
+            package = package.rpartition('.')[0]
+        return "%s.%s" % (package, name) if name else package
+    def timed_import(name, *args, **kwargs):
+        # the arguments are passed on as given, as Python 2 leaves out the
+        # level of implicit relative imports
+        globals = args[0] if args else kwargs.get('globals')
+        level = args[3] if len(args) > 3 else kwargs.get('level',
+                                                         DEFAULT_LEVEL)
+        if sys.modules.get(resolve(name, globals, level)) is not None:
+            return original(name, *args, **kwargs)
+        node = {'name': name, 'self': 0.0, 'cumulative': 0.0, 'children': []}
+        (stack[-1]['children'] if stack else roots).append(node)
+        stack.append(node)
+        started = time.time()
+        try:
+            return original(name, *args, **kwargs)
+        finally:
+            node['name'] = resolve(name, globals, level)
+            stack.pop()
+            node['cumulative'] = time.time() - started
+            node['self'] = node['cumulative'] - sum(child['cumulative']
+                                                    for child in node['children'])
+    builtins.__import__ = timed_import
+    try:
+        setup_django()
+    finally:
+        builtins.__import__ = original
+    files = dict((name, getattr(module, '__file__', None))
+                 for name, module in list(sys.modules.items()) if module)
+    return roots, files
+
+
+def main():
+    if sys.version_info >= (3, 7):
+        method = 'importtime'
+        roots, files = profile_importtime()
+    else:
+        method = 'hook'
+        roots, files = profile_hook()
+    modules = flatten(roots, files)
+    result({'method': method, 'total': sum(root['cumulative'] for root in roots),
+            'modules': modules})
+
+
+if __name__ == "__main__":
+    main()
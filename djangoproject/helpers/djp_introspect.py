@@ -0,0 +1,92 @@
+"""
+Introspect a Django project for the gedit Django Project plugin.
+
+Run from the project directory with the path to manage.py as the argument.
+manage.py is loaded the same way Django's command line does, so that it sets
+DJANGO_SETTINGS_MODULE, then the settings are loaded and a description of the
+project is written to stdout as JSON.
+"""
+from __future__ import print_function
+import os
+import sys
+import runpy
+
+from djp_bootstrap import setup_path, source_file, watch_files, dump
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def load_manage(manage):
+    """ Run manage.py --version returning what it printed. """
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    argv = sys.argv
+    sys.argv = [manage, '--version']
+    try:
+        runpy.run_path(manage, run_name='__main__')
+    except SystemExit:
+        pass
+    finally:
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+        sys.argv = argv
+    return output.strip()
+
+
+def main():
+    manage = os.path.abspath(sys.argv[1])
+    setup_path()
+    version = load_manage(manage)
+    # settings is used if neither the user nor manage.py set it
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    settings_module = os.environ['DJANGO_SETTINGS_MODULE']
+    module = __import__(settings_module, {}, {}, ['__name__'])
+
+    import django
+    info = {
+        'python': sys.executable,
+        'python_version': '.'.join([str(v) for v in sys.version_info[:3]]),
+        'django_version': version or django.get_version(),
+        'manage_file': manage,
+        'settings_module': settings_module,
+        'settings_file': os.path.abspath(source_file(module.__file__)),
+        'installed_apps': list(getattr(module, 'INSTALLED_APPS', [])),
+        'databases': {},
+        'apps': [],
+        'watch': [],
+    }
+    for alias, database in getattr(module, 'DATABASES', {}).items():
+        info['databases'][alias] = {
+            'engine': database.get('ENGINE', ''),
+            'name': str(database.get('NAME', '')),
+        }
+    for name in ('ROOT_URLCONF', 'WSGI_APPLICATION', 'ASGI_APPLICATION'):
+        info[name.lower()] = getattr(module, name, None)
+
+    # the app list needs Django set up, settings alone are still useful
+    try:
+        if hasattr(django, 'setup'):
+            django.setup()
+        info['watch'] = watch_files()
+        try:
+            from django.apps import apps
+            configs = apps.get_app_configs()
+        except ImportError:
+            configs = []
+        for config in configs:
+            info['apps'].append({
+                'name': config.name,
+                'label': config.label,
+                'path': config.path,
+            })
+    except Exception as e:
+        info['setup_error'] = "%s: %s" % (e.__class__.__name__, e)
+
+    dump(info)
+
+
+if __name__ == "__main__":
+    main()
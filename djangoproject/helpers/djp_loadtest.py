@@ -0,0 +1,182 @@
+"""
+A small HTTP load generator for the gedit Django Project plugin.
+
+    djp_loadtest.py URL [--concurrency N] [--duration SECONDS] [--timeout SECONDS]
+                    [--allow-host HOST]
+
+Requests URL from N threads, each on its own keep-alive connection, for the
+given number of seconds and reports the request rate, latency percentiles
+and errors. It does not need Django and only uses the standard library.
+
+Only URLs on a loopback address or on HOST, the address the development
+server listens on, are load tested.
+"""
+from __future__ import print_function, division
+import sys
+import time
+import threading
+from collections import Counter
+
+from djp_bootstrap import progress, message, result, exit_on_sigterm
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection
+    from urllib.parse import urlsplit
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection
+    from urlparse import urlsplit
+
+PROGRESS_INTERVAL = 0.5 # seconds
+LOOPBACK_HOSTS = ('localhost', '::1')
+
+
+def is_local(url, hosts=()):
+    """ Return whether url is on a loopback address or one of hosts. """
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if parts.scheme not in ('http', 'https') or not host:
+        return False
+    if host in LOOPBACK_HOSTS or host in hosts:
+        return True
+    fields = host.split('.')
+    return len(fields) == 4 and fields[0] == '127' and \
+           all(field.isdigit() for field in fields)
+
+
+class Worker(threading.Thread):
+    """ Requests the URL until the deadline, recording each request. """
+    def __init__(self, url, deadline, timeout):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        parts = urlsplit(url)
+        self.cls = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        self.netloc = parts.netloc
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.deadline = deadline
+        self.timeout = timeout
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def run(self):
+        connection = None
+        while time.time() < self.deadline:
+            if connection is None:
+                connection = self.cls(self.netloc, timeout=self.timeout)
+            started = time.time()
+            try:
+                connection.request('GET', self.path,
+                                   headers={'User-Agent': 'djp-loadtest'})
+                response = connection.getresponse()
+                response.read()
+            except Exception as e:
+                self.errors[e.__class__.__name__] += 1
+                connection.close()
+                connection = None
+                continue
+            self.latencies.append(time.time() - started)
+            self.statuses[response.status] += 1
+            if response.getheader('connection', '').lower() == 'close' or \
+               response.version < 11:
+                connection.close()
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def count(self):
+        return len(self.latencies) + sum(self.errors.values())
+
+
+def percentile(values, fraction):
+    """ Return the nearest-rank percentile of sorted values. """
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def run(url, concurrency, duration, timeout):
+    started = time.time()
+    deadline = started + duration
+    workers = [Worker(url, deadline, timeout) for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(PROGRESS_INTERVAL)
+        elapsed = time.time() - started
+        count = sum(worker.count() for worker in workers)
+        progress(min(elapsed / duration, 1.0), "%d requests, %.1f requests/s" %
+                 (count, count / max(elapsed, 0.001)))
+    elapsed = time.time() - started
+
+    latencies = sorted(l for worker in workers for l in worker.latencies)
+    statuses = Counter()
+    errors = Counter()
+    for worker in workers:
+        statuses.update(worker.statuses)
+        errors.update(worker.errors)
+    server_errors = sum(n for status, n in statuses.items() if status >= 500)
+    report = {
+        'url': url,
+        'concurrency': concurrency,
+        'duration': elapsed,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1] if latencies else 0.0,
+        'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'statuses': dict((str(k), v) for k, v in statuses.items()),
+        'errors': dict(errors),
+        'server_errors': server_errors,
+    }
+
+    message("Load test of %s, %d connections for %.1fs\n" % (url, concurrency,
+            elapsed), 'bold')
+    print("Requests:      %d (%.1f requests/s)" % (report['requests'],
+                                                  report['rps']))
+    print("Latency (ms):  p50 %.1f  p95 %.1f  p99 %.1f  max %.1f  mean %.1f" % (
+          report['p50'] * 1000, report['p95'] * 1000, report['p99'] * 1000,
+          report['max'] * 1000, report['mean'] * 1000))
+    print("Status codes:  %s" % ", ".join("%s: %d" % item for item in
+                                          sorted(statuses.items())))
+    sys.stdout.flush()
+    if server_errors or errors:
+        message("Errors:        %d server errors, %d failed requests %s\n" % (
+                server_errors, sum(errors.values()),
+                dict(errors) if errors else ""), 'error')
+    result(report)
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    options = {'--concurrency': 10, '--duration': 10.0, '--timeout': 10.0,
+               '--allow-host': ''}
+    url = None
+    while args:
+        arg = args.pop(0)
+        if arg in options:
+            options[arg] = type(options[arg])(args.pop(0))
+        elif url is None:
+            url = arg
+        else:
+            url = None
+            break
+    if not url:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    hosts = [options['--allow-host'].strip('[]').lower()]
+    if not is_local(url, hosts):
+        print("Only the development server can be load tested, %s is not on "
+              "a loopback address." % url, file=sys.stderr)
+        sys.exit(2)
+    run(url, max(1, options['--concurrency']), options['--duration'],
+        options['--timeout'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Analyze and time the pending migrations for the gedit Django Project plugin.
+
+    djp_migrations.py [--time] [--database ALIAS] [APP]
+
+The SQL of each pending migration, of APP or of all apps, is collected as
+sqlmigrate would show it and every statement is checked for operations which
+rewrite or lock a table, such as adding a NOT NULL column with a default,
+building an index without CONCURRENTLY or changing a column type. The rows in
+the table are looked up so that risks on big tables stand out.
+
+With --time the migrations are then applied, one at a time, to a copy of the
+database and timed. SQLite databases are copied to a temporary file and
+PostgreSQL databases are copied with CREATE DATABASE ... TEMPLATE, which needs
+the CREATEDB privilege and no other connections to the database. The copy is
+removed afterwards and the project's database is never migrated.
+
+    {"vendor": "postgresql", "timed": true,
+     "migrations": [{"app", "name", "file", "time", "error",
+                     "statements": [{"sql", "table", "rows", "risks",
+                                     "level"}]}]}
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import traceback
+
+from djp_bootstrap import setup_django, progress, message, result, \
+                          exit_on_sigterm, source_file
+
+BIG_TABLE_ROWS = 100000
+RISKS = [
+    (re.compile(r'\bADD COLUMN\b.*\bDEFAULT\b.*\bNOT NULL\b|'
+                r'\bADD COLUMN\b.*\bNOT NULL\b.*\bDEFAULT\b', re.I | re.S),
+     "Adding a NOT NULL column with a default rewrites the table on "
+     "PostgreSQL before 11 and MySQL before 8.0"),
+    (re.compile(r'\bCREATE\s+(UNIQUE\s+)?INDEX\s+(?!CONCURRENTLY)', re.I),
+     "Building an index without CONCURRENTLY blocks writes to the table"),
+    (re.compile(r'\bALTER COLUMN\b.*\bTYPE\b|\bMODIFY\b', re.I | re.S),
+     "Changing a column type rewrites the table under an exclusive lock"),
+    (re.compile(r'\bSET NOT NULL\b', re.I),
+     "Setting NOT NULL scans the whole table under an exclusive lock"),
+    (re.compile(r'\bADD CONSTRAINT\b(?!.*\bNOT VALID\b)', re.I | re.S),
+     "Adding a constraint checks every row under a lock, unless NOT VALID"),
+    (re.compile(r'\bCREATE TABLE\s+"new__', re.I),
+     "SQLite copies the whole table to alter it"),
+    (re.compile(r'^--.*(CANNOT BE WRITTEN AS SQL|Raw Python operation)',
+                re.I | re.M),
+     "Runs Python code, which may go through every row"),
+]
+TABLE_RES = [
+    re.compile(r'\bCREATE TABLE\s+"new__(\w+)"', re.I),
+    re.compile(r'\bALTER TABLE\s+(?:ONLY\s+)?[`"]?([\w.]+)', re.I),
+    re.compile(r'\bINDEX\s+(?:CONCURRENTLY\s+)?\S+\s+ON\s+[`"]?([\w.]+)', re.I),
+]
+
+
+def pending_plan(executor, app):
+    """ Return the plan to migrate app, or all apps if app is None. """
+    targets = executor.loader.graph.leaf_nodes()
+    if app:
+        targets = [key for key in targets if key[0] == app]
+        if not targets:
+            raise SystemExit("App '%s' does not have migrations." % app)
+    return targets, executor.migration_plan(targets)
+
+
+def count_rows(connection, table):
+    """ Return the (estimated) number of rows in a table, None if missing. """
+    from django.db import DatabaseError
+    cursor = connection.cursor()
+    try:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class "
+                           "WHERE relname = %s AND relkind = 'r'", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute("SELECT table_rows FROM information_schema.tables "
+                           "WHERE table_schema = DATABASE() "
+                           "AND table_name = %s", [table])
+        else:
+            cursor.execute("SELECT COUNT(*) FROM %s" %
+                           connection.ops.quote_name(table))
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except DatabaseError:
+        return None
+    finally:
+        cursor.close()
+
+
+def analyze_statement(connection, sql, counts):
+    risks = [text for pattern, text in RISKS if pattern.search(sql)]
+    table = None
+    for pattern in TABLE_RES:
+        match = pattern.search(sql)
+        if match:
+            table = match.group(1).split('.')[-1]
+            break
+    rows = None
+    if risks and table:
+        if table not in counts:
+            counts[table] = count_rows(connection, table)
+        rows = counts[table]
+    level = None
+    if risks:
+        level = 'high' if rows and rows >= BIG_TABLE_ROWS else 'low'
+    return {'sql': sql, 'table': table, 'rows': rows, 'risks': risks,
+            'level': level}
+
+
+def analyze(executor, plan):
+    """ Return the SQL of each migration in plan with the risks found. """
+    connection = executor.connection
+    migrations = []
+    counts = {}
+    for i, (migration, backwards) in enumerate(plan):
+        progress(float(i) / len(plan), "Analyzing %s.%s..." % (
+                 migration.app_label, migration.name))
+        module = sys.modules.get(type(migration).__module__)
+        item = {'app': migration.app_label, 'name': migration.name,
+                'file': source_file(getattr(module, '__file__', None)),
+                'time': None, 'error': None, 'statements': []}
+        try:
+            statements = executor.collect_sql([(migration, backwards)])
+        except Exception as e:
+            item['error'] = "Could not collect the SQL: %s" % e
+            statements = []
+        for sql in statements:
+            item['statements'].append(analyze_statement(connection, sql,
+                                                        counts))
+        migrations.append(item)
+    return migrations
+
+
+class CopyError(Exception):
+    pass
+
+
+class DatabaseCopy(object):
+    """
+    A copy of a database which the connection is pointed at while the copy
+    is in use, as a context manager. CopyError is raised when the database
+    can't be copied.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.settings = connection.settings_dict
+        self.name = self.settings['NAME']
+        self.copy = None
+
+    def __enter__(self):
+        vendor = self.connection.vendor
+        self.connection.close()
+        if vendor == 'sqlite':
+            if not self.name or self.name == ':memory:' or \
+               'mode=memory' in str(self.name):
+                raise CopyError("An in-memory database cannot be copied.")
+            fd, copy = tempfile.mkstemp(prefix="djp-migrate-",
+                                        suffix=".sqlite3")
+            os.close(fd)
+            try:
+                shutil.copyfile(self.name, copy)
+            except (IOError, OSError) as e:
+                os.remove(copy)
+                raise CopyError(str(e))
+            self.copy = copy
+        elif vendor == 'postgresql':
+            copy = "%s_djp_migrate_%d" % (self.name, os.getpid())
+            try:
+                self._execute_on_postgres("CREATE DATABASE %s TEMPLATE %s" % (
+                    self.connection.ops.quote_name(copy),
+                    self.connection.ops.quote_name(self.name)))
+            except Exception as e:
+                raise CopyError("%s (the database cannot be copied while "
+                                "the server, the worker or a shell is "
+                                "connected to it)" % str(e).strip())
+            self.copy = copy
+        else:
+            raise CopyError("Timing migrations needs a SQLite or PostgreSQL "
+                            "database, not %s." % vendor)
+        self.settings['NAME'] = self.copy
+        return self.copy
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+        self.settings['NAME'] = self.name
+        if self.copy is None:
+            return
+        if self.connection.vendor == 'sqlite':
+            os.remove(self.copy)
+        else:
+            self._execute_on_postgres("DROP DATABASE %s" %
+                self.connection.ops.quote_name(self.copy))
+
+    def _execute_on_postgres(self, sql):
+        # a database cannot be copied or dropped while connected to it
+        self.settings['NAME'] = 'postgres'
+        try:
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(sql)
+            finally:
+                cursor.close()
+        finally:
+            self.connection.close()
+            self.settings['NAME'] = self.name
+
+
+def time_migrations(connection, app, migrations):
+    """ Apply the pending migrations to a copy of the database, timing each. """
+    from django.db.migrations.executor import MigrationExecutor
+    items = dict(((m['app'], m['name']), m) for m in migrations)
+    started = [None]
+    def callback(action, migration=None, fake=False):
+        if action == 'apply_start':
+            item = items.get((migration.app_label, migration.name))
+            done = migrations.index(item) if item else 0
+            progress(float(done) / len(migrations), "Applying %s.%s..." % (
+                     migration.app_label, migration.name))
+            started[0] = time.time()
+        elif action == 'apply_success':
+            item = items.get((migration.app_label, migration.name))
+            if item:
+                item['time'] = time.time() - started[0]
+    progress(None, "Copying the database...")
+    try:
+        with DatabaseCopy(connection):
+            executor = MigrationExecutor(connection, callback)
+            targets, plan = pending_plan(executor, app)
+            try:
+                executor.migrate(targets, plan)
+            except Exception as e:
+                for item in migrations:
+                    if item['time'] is None:
+                        item['error'] = "%s: %s" % (type(e).__name__, e)
+                        break
+                traceback.print_exc()
+    except CopyError as e:
+        # the analysis is still sent, untimed
+        print("Could not copy the database: %s" % e, file=sys.stderr)
+        for item in migrations:
+            if item['error'] is None:
+                item['error'] = "Not timed, could not copy the database: %s" % e
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    timed = False
+    alias = 'default'
+    while args and args[0] in ('--time', '--database'):
+        if args.pop(0) == '--time':
+            timed = True
+        else:
+            alias = args.pop(0)
+    app = args[0] if args else None
+    setup_django()
+    from django.db import connections
+    from django.db.migrations.executor import MigrationExecutor
+    connection = connections[alias]
+    progress(None, "Loading migrations...")
+    executor = MigrationExecutor(connection)
+    plan = pending_plan(executor, app)[1]
+    if not plan:
+        message("No migrations to apply.\n")
+    migrations = analyze(executor, plan)
+    if timed and migrations:
+        time_migrations(connection, app, migrations)
+    risky = sum(1 for m in migrations for s in m['statements'] if s['risks'])
+    message("%d pending migrations, %d risky statements.\n" % (
+            len(migrations), risky))
+    result({'vendor': connection.vendor, 'timed': timed,
+            'migrations': migrations})
+
+
+if __name__ == "__main__":
+    main()
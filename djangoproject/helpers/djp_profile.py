@@ -0,0 +1,163 @@
+"""
+Profile a management command or a request for the gedit Django Project plugin.
+
+    djp_profile.py OUTPUT [--sampler auto|cprofile|py-spy] COMMAND [ARG ...]
+    djp_profile.py OUTPUT [--sampler ...] /PATH
+
+A COMMAND is run with call_command and a /PATH is requested with Django's
+test client. With cProfile the statistics are saved to OUTPUT as a .prof file
+for pstats, snakeviz and the like. py-spy, a sampling profiler which adds
+far less overhead, runs the command as manage.py in a child process and saves
+its samples in collapsed stack format next to OUTPUT, with a .txt extension.
+auto uses py-spy for commands when it is installed.
+
+The top functions by cumulative and by own time are sent as the result:
+
+    {"filename": OUTPUT, "profiler": "cprofile", "total": 1.5,
+     "functions": [{"file", "line", "function", "calls", "own", "cumulative"}]}
+"""
+from __future__ import print_function, division
+import os
+import re
+import sys
+import subprocess
+import traceback
+
+from djp_bootstrap import setup_django, progress, message, result, \
+                          exit_on_sigterm, parse_options
+
+TOP_FUNCTIONS = 500
+SAMPLE_RATE = 250 # per second
+FRAME_RE = re.compile(r'^(?P<function>.*) \((?P<file>.*):(?P<line>\d+)\)$')
+
+
+def find_py_spy():
+    """ Return the path of py-spy next to the interpreter or on PATH. """
+    candidates = [os.path.join(os.path.dirname(sys.executable), 'py-spy')]
+    candidates += [os.path.join(path, 'py-spy') for path in
+                   os.environ.get('PATH', '').split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+
+
+def top_functions(functions):
+    """ Return the union of the top functions by cumulative and own time. """
+    top = sorted(functions, key=lambda f: f['cumulative'], reverse=True)
+    top = top[:TOP_FUNCTIONS]
+    seen = set(id(f) for f in top)
+    for f in sorted(functions, key=lambda f: f['own'], reverse=True)[:TOP_FUNCTIONS]:
+        if id(f) not in seen:
+            top.append(f)
+    return top
+
+
+def run_target(target):
+    """ Run a command or request a path, returning the exit code. """
+    if target[0].startswith('/'):
+        from django.test import Client
+        response = Client().get(target[0], HTTP_HOST='localhost')
+        print("%s %s, %d bytes" % (target[0], response.status_code,
+                                   len(response.content)))
+        return 0 if response.status_code < 500 else 1
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    try:
+        args, options = parse_options(target)
+        call_command(*args, **options)
+    except CommandError as e:
+        sys.stderr.write("CommandError: %s\n" % e)
+        return 1
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(bool(e.code))
+    return 0
+
+
+def profile_cprofile(output, target):
+    import cProfile
+    import pstats
+    setup_django()
+    progress(None, "Profiling %s with cProfile..." % " ".join(target))
+    profiler = cProfile.Profile()
+    try:
+        code = profiler.runcall(run_target, target)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    profiler.dump_stats(output)
+    stats = pstats.Stats(output)
+    functions = []
+    for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items():
+        functions.append({'file': filename, 'line': line, 'function': name,
+                          'calls': nc, 'own': tt, 'cumulative': ct})
+    result({'filename': output, 'profiler': 'cprofile',
+            'total': stats.total_tt, 'functions': top_functions(functions)})
+    return code
+
+
+def profile_py_spy(output, target, py_spy):
+    progress(None, "Profiling %s with py-spy..." % " ".join(target))
+    output = os.path.splitext(output)[0] + '.txt'
+    args = [py_spy, 'record', '--format', 'raw', '--function', '--rate',
+            str(SAMPLE_RATE), '--output', output, '--',
+            sys.executable, 'manage.py'] + target
+    code = subprocess.call(args)
+    if not os.path.exists(output):
+        return None
+    functions = {}
+    total = 0
+    with open(output) as f:
+        for line in f:
+            stack, sep, count = line.rstrip('\n').rpartition(' ')
+            if not sep or not count.isdigit():
+                continue
+            count = int(count)
+            total += count
+            frames = []
+            for frame in stack.split(';'):
+                match = FRAME_RE.match(frame)
+                if match:
+                    frames.append((match.group('file'), int(match.group('line')),
+                                   match.group('function')))
+            for i, frame in enumerate(frames):
+                entry = functions.setdefault(frame, {'file': frame[0],
+                        'line': frame[1], 'function': frame[2], 'calls': 0,
+                        'own': 0.0, 'cumulative': 0.0})
+                # recursive functions count once per sample
+                if frame not in frames[:i]:
+                    entry['calls'] += count
+                    entry['cumulative'] += count / SAMPLE_RATE
+            if frames:
+                functions[frames[-1]]['own'] += count / SAMPLE_RATE
+    result({'filename': output, 'profiler': 'py-spy',
+            'total': total / SAMPLE_RATE,
+            'functions': top_functions(list(functions.values()))})
+    return code
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    sampler = 'auto'
+    if len(args) > 2 and args[1] == '--sampler':
+        sampler = args.pop(2)
+        args.pop(1)
+    if len(args) < 2:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    output, target = args[0], args[1:]
+    py_spy = None
+    if sampler != 'cprofile' and not target[0].startswith('/'):
+        py_spy = find_py_spy()
+        if sampler == 'py-spy' and not py_spy:
+            message("py-spy was not found, using cProfile.\n", 'error')
+    if py_spy:
+        code = profile_py_spy(output, target, py_spy)
+        if code is not None:
+            sys.exit(code)
+        message("py-spy failed, using cProfile.\n", 'error')
+    sys.exit(profile_cprofile(output, target))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Run a development server with SQL query capture for the gedit Django Project
+plugin.
+
+    djp_serve.py [manage.py] runserver [ARG ...]
+    djp_serve.py -m gunicorn [ARG ...]
+
+The server is run as it would be from the command line, after hooking every
+database connection with an execute wrapper. The queries of each request are
+appended as a JSON line to the file named by $DJP_QUERY_LOG:
+
+    {"method": "GET", "path": "/polls/", "time": 0.1, "pid": 123,
+     "queries": [{"sql": "SELECT ...", "time": 0.001, "many": false,
+                  "where": ["/project/polls/views.py", 12, "index"]}]}
+
+The log is emptied before a request would grow it past $DJP_QUERY_LOG_MAX
+bytes (by default 10 MB), the reader notices it shrank and starts over.
+
+"where" is the code which ran the query, the innermost frame in the project
+or failing that the innermost frame outside Django, the standard library and
+this script. The argv[0] of the server is this script so runserver's
+autoreloader runs the child through it as well.
+
+Queries are only captured with Django 2.0 and later, which have execute
+wrappers, and in threads serving a request.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import runpy
+import threading
+import sysconfig
+
+from djp_bootstrap import setup_path
+
+DEFAULT_LOG_MAX = 10485760
+
+_local = threading.local()
+_ignore = []
+_project = os.getcwd() + os.sep
+
+
+def ignored(filename):
+    return not filename or filename.startswith('<') or \
+           any(filename.startswith(path) for path in _ignore)
+
+
+def caller():
+    """ Return [file, line, function] of the code which ran a query. """
+    frame = sys._getframe(2)
+    where = None
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        if not ignored(code.co_filename):
+            if filename.startswith(_project) and \
+               'site-packages' not in filename:
+                return [filename, frame.f_lineno, code.co_name]
+            if where is None:
+                where = [filename, frame.f_lineno, code.co_name]
+        frame = frame.f_back
+    return where
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    started = time.time()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries = getattr(_local, 'queries', None)
+        if queries is not None:
+            queries.append({'sql': sql, 'time': time.time() - started,
+                            'many': many, 'where': caller()})
+
+
+def on_connection_created(sender, connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def on_request_started(sender, environ=None, **kwargs):
+    environ = environ or {}
+    _local.queries = []
+    _local.request = {'method': environ.get('REQUEST_METHOD', ''),
+                      'path': environ.get('PATH_INFO', ''),
+                      'started': time.time()}
+
+
+def on_request_finished(sender, **kwargs):
+    queries = getattr(_local, 'queries', None)
+    request = getattr(_local, 'request', None)
+    _local.queries = _local.request = None
+    if request is None or not queries:
+        return
+    record = {'method': request['method'], 'path': request['path'],
+              'time': time.time() - request['started'], 'pid': os.getpid(),
+              'queries': queries}
+    line = (json.dumps(record) + "\n").encode('utf-8')
+    # a single O_APPEND write keeps lines from several workers apart
+    fd = os.open(os.environ['DJP_QUERY_LOG'],
+                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        limit = int(os.environ.get('DJP_QUERY_LOG_MAX') or DEFAULT_LOG_MAX)
+        if os.fstat(fd).st_size + len(line) > limit:
+            os.ftruncate(fd, 0)
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def install():
+    import django
+    from django.core import signals
+    from django.db.backends.signals import connection_created
+    _ignore.append(os.path.dirname(django.__file__))
+    _ignore.append(os.path.dirname(os.path.abspath(__file__)))
+    for name in ('stdlib', 'platstdlib'):
+        path = sysconfig.get_paths().get(name)
+        if path:
+            _ignore.append(path)
+    _ignore.append(os.path.dirname(os.__file__))
+    if django.VERSION < (2, 0):
+        print("SQL query capture needs Django 2.0 or later.", file=sys.stderr)
+        return
+    connection_created.connect(on_connection_created, weak=False)
+    signals.request_started.connect(on_request_started, weak=False)
+    signals.request_finished.connect(on_request_finished, weak=False)
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    setup_path()
+    if os.environ.get('DJP_QUERY_LOG'):
+        install()
+    if args[0] == '-m':
+        sys.argv = [sys.argv[0]] + args[2:]
+        runpy.run_module(args[1], run_name='__main__', alter_sys=True)
+    else:
+        script = 'manage.py'
+        if args[0].endswith('.py') and os.path.isfile(args[0]):
+            script = args.pop(0)
+        # manage.py reads its arguments from argv[1:], the reloader runs
+        # argv again so the script is left out for the default
+        sys.argv = [sys.argv[0]] + args
+        runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+An interactive Python shell for the gedit Django Project plugin.
+
+    djp_shell.py [--plain]
+
+Like manage.py shell, but the models of all installed apps are in the
+namespace, as ModelName or app_label_ModelName when two apps have a model of
+the same name, and a breakdown of where the start up time went is printed
+first: importing Django, the settings, setting up Django and, for each app,
+importing the app, importing its models and running its ready(). The apps
+are listed slowest first.
+
+IPython is used when it is installed, unless --plain is given.
+"""
+from __future__ import print_function
+import sys
+import time
+from collections import OrderedDict
+
+from djp_bootstrap import setup_path
+
+SLOWEST_APPS = 10
+LISTED_MODELS = 50
+
+
+def timed_setup():
+    """
+    Set up Django timing each step, returns a list of (step, seconds) and an
+    OrderedDict of app label to {'import', 'models', 'ready'} seconds.
+    """
+    steps = []
+    apps = OrderedDict()
+    started = time.time()
+    import django
+    steps.append(("import django", time.time() - started))
+
+    started = time.time()
+    from django.conf import settings
+    settings.INSTALLED_APPS
+    steps.append(("settings", time.time() - started))
+
+    try:
+        from django.apps import AppConfig
+    except ImportError:
+        # no app registry before Django 1.7, models load on first use
+        from django.db.models.loading import get_models
+        started = time.time()
+        get_models()
+        steps.append(("models", time.time() - started))
+        return steps, apps
+
+    # the descriptors, to leave the class exactly as it was
+    create = AppConfig.__dict__['create']
+    import_models = AppConfig.__dict__['import_models']
+    def timed_create(cls, entry):
+        started = time.time()
+        config = create.__get__(None, cls)(entry)
+        times = apps.setdefault(config.label, {'import': 0.0, 'models': 0.0,
+                                               'ready': 0.0})
+        times['import'] = time.time() - started
+        ready = config.ready
+        def timed_ready():
+            started = time.time()
+            try:
+                return ready()
+            finally:
+                times['ready'] = time.time() - started
+        config.ready = timed_ready
+        return config
+    def timed_import_models(self, *args):
+        started = time.time()
+        try:
+            return import_models.__get__(self)(*args)
+        finally:
+            if self.label in apps:
+                apps[self.label]['models'] = time.time() - started
+    AppConfig.create = classmethod(timed_create)
+    AppConfig.import_models = timed_import_models
+    started = time.time()
+    try:
+        django.setup()
+    finally:
+        AppConfig.create = create
+        AppConfig.import_models = import_models
+    steps.append(("django.setup()", time.time() - started))
+    return steps, apps
+
+
+def print_breakdown(steps, apps, out=sys.stdout):
+    total = sum(seconds for step, seconds in steps)
+    print("Started in %.3fs" % total, file=out)
+    for step, seconds in steps:
+        print("  %-24s %8.3fs" % (step, seconds), file=out)
+    if not apps:
+        return
+    registry = sum(sum(times.values()) for times in apps.values())
+    print("  %-24s %8.3fs  import / models / ready" % ("  apps", registry),
+          file=out)
+    slowest = sorted(apps.items(), key=lambda item: sum(item[1].values()),
+                     reverse=True)
+    for label, times in slowest[:SLOWEST_APPS]:
+        print("    %-22s %8.3fs  %.3f / %.3f / %.3f" % (label,
+              sum(times.values()), times['import'], times['models'],
+              times['ready']), file=out)
+    if len(slowest) > SLOWEST_APPS:
+        print("    ... %d more apps" % (len(slowest) - SLOWEST_APPS),
+              file=out)
+
+
+def model_namespace():
+    """ Return the models of all installed apps by name. """
+    try:
+        from django.apps import apps
+        models = apps.get_models()
+    except ImportError:
+        from django.db.models.loading import get_models
+        models = get_models()
+    namespace = {}
+    for model in models:
+        name = model.__name__
+        if name in namespace:
+            name = "%s_%s" % (model._meta.app_label, name)
+        namespace[name] = model
+    return namespace
+
+
+def interact(namespace, banner, plain):
+    if not plain:
+        try:
+            from IPython import start_ipython
+        except ImportError:
+            pass
+        else:
+            print(banner)
+            start_ipython(argv=[], user_ns=namespace)
+            return
+    import code
+    try:
+        import readline
+        import rlcompleter
+        readline.set_completer(rlcompleter.Completer(namespace).complete)
+        readline.parse_and_bind("tab: complete")
+    except ImportError:
+        pass
+    code.interact(banner=banner, local=namespace)
+
+
+def main():
+    plain = '--plain' in sys.argv[1:]
+    setup_path()
+    steps, apps = timed_setup()
+    print_breakdown(steps, apps)
+    from django.conf import settings
+    namespace = model_namespace()
+    names = sorted(namespace)
+    banner = "%d models imported" % len(names)
+    if len(names) <= LISTED_MODELS:
+        banner += ": %s" % ", ".join(names)
+    namespace['settings'] = settings
+    interact(namespace, banner, plain)
+
+
+if __name__ == "__main__":
+    main()
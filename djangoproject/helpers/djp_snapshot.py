@@ -0,0 +1,282 @@
+"""
+Save and restore named snapshots of the project's database for the gedit
+Django Project plugin.
+
+    djp_snapshot.py save NAME DIR [--database ALIAS] [--terminate]
+    djp_snapshot.py restore NAME DIR [--database ALIAS] [--terminate]
+    djp_snapshot.py delete NAME DIR [--database ALIAS]
+
+SQLite databases are saved to a file in DIR with VACUUM INTO, or copied when
+SQLite is older than 3.27, and restored by copying the file back over the
+database. PostgreSQL databases are saved as a database created with the
+project's database as its template and restored by creating the project's
+database again from the snapshot. Making or using a template needs the
+CREATEDB privilege and no other connections to the database. When there
+are others, they are listed and the helper exits with status 3, unless
+--terminate is given to close them.
+
+The snapshots are listed in DIR/snapshots.json by name:
+
+    {"initial": {"vendor": "sqlite", "database": "/project/db.sqlite3",
+                 "location": "DIR/initial.sqlite3", "created": 1400000000.0,
+                 "size": 1048576}}
+
+The snapshot and the time the operation took are sent as the result.
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from djp_bootstrap import setup_django, progress, message, result
+
+INDEX = 'snapshots.json'
+EXIT_OTHER_SESSIONS = 3
+SQLITE_VACUUM_INTO = (3, 27, 0)
+
+
+def load_index(directory):
+    try:
+        with open(os.path.join(directory, INDEX)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_index(directory, index):
+    fd, temp = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.rename(temp, os.path.join(directory, INDEX))
+
+
+def replace_file(source, target):
+    """ Copy source over target so that target is never partly written. """
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target)))
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp)
+        os.rename(temp, target)
+    except (IOError, OSError):
+        os.remove(temp)
+        raise
+
+
+class SQLiteSnapshots(object):
+    def __init__(self, connection, directory):
+        self.connection = connection
+        self.directory = directory
+        self.database = os.path.abspath(connection.settings_dict['NAME'])
+
+    def location(self, name):
+        return os.path.join(self.directory, name + '.sqlite3')
+
+    def save(self, name):
+        location = self.location(name)
+        if os.path.exists(location):
+            os.remove(location)
+        import sqlite3
+        if sqlite3.sqlite_version_info >= SQLITE_VACUUM_INTO:
+            # a consistent copy even while the database is in use
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute("VACUUM INTO %s", [location])
+            finally:
+                cursor.close()
+        else:
+            self.connection.close()
+            replace_file(self.database, location)
+        return location
+
+    def restore(self, name, location):
+        self.connection.close()
+        replace_file(location, self.database)
+        for suffix in ('-wal', '-shm', '-journal'):
+            if os.path.exists(self.database + suffix):
+                os.remove(self.database + suffix)
+
+    def delete(self, name, location):
+        if os.path.exists(location):
+            os.remove(location)
+
+
+class OtherSessions(Exception):
+    """ Other sessions are connected to a database which is to be copied. """
+    def __init__(self, database, sessions):
+        Exception.__init__(self, database)
+        self.database = database
+        self.sessions = sessions
+
+
+class PostgreSQLSnapshots(object):
+    def __init__(self, connection, directory):
+        self.connection = connection
+        self.directory = directory
+        self.database = connection.settings_dict['NAME']
+        self.terminate = False # close other sessions rather than refuse
+
+    def location(self, name):
+        # database names are at most 63 bytes
+        digest = hashlib.sha1((self.database + '\0' + name).encode('utf-8'))
+        safe = re.sub(r'\W', '_', name)[:30]
+        return "%s_snap_%s_%s" % (self.database[:20], safe,
+                                  digest.hexdigest()[:8])
+
+    def _execute(self, *statements):
+        """
+        Run statements connected to the postgres database, returning the rows
+        of the last one.
+        """
+        settings = self.connection.settings_dict
+        self.connection.close()
+        settings['NAME'] = 'postgres'
+        try:
+            cursor = self.connection.cursor()
+            try:
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+                return cursor.fetchall() if cursor.description else []
+            finally:
+                cursor.close()
+        finally:
+            self.connection.close()
+            settings['NAME'] = self.database
+
+    def _check_sessions(self, database):
+        """
+        Raise OtherSessions if other sessions are connected to database, or
+        close them if terminate is set.
+        """
+        if self.terminate:
+            self._execute(("SELECT pg_terminate_backend(pid) FROM "
+                           "pg_stat_activity WHERE datname = %s AND "
+                           "pid <> pg_backend_pid()", [database]))
+            return
+        sessions = self._execute(("SELECT pid, usename, application_name, "
+                                  "client_addr, state FROM pg_stat_activity "
+                                  "WHERE datname = %s AND "
+                                  "pid <> pg_backend_pid()", [database]))
+        if sessions:
+            raise OtherSessions(database, sessions)
+
+    def _quote(self, name):
+        return self.connection.ops.quote_name(name)
+
+    def _copy(self, source, target):
+        """
+        Replace the database target with a copy of source. The copy is made
+        under a temporary name first, so target is kept if copying fails.
+        """
+        temp = "%s_tmp_%d" % (target[:40], os.getpid())
+        self._check_sessions(source)
+        self._check_sessions(target)
+        self._execute(("CREATE DATABASE %s TEMPLATE %s" % (self._quote(temp),
+                       self._quote(source)), None))
+        try:
+            self._check_sessions(target)
+        except OtherSessions:
+            # a session connected while copying
+            self._execute(("DROP DATABASE %s" % self._quote(temp), None))
+            raise
+        try:
+            self._execute(("DROP DATABASE IF EXISTS %s" % self._quote(target),
+                           None),
+                          ("ALTER DATABASE %s RENAME TO %s" % (
+                           self._quote(temp), self._quote(target)), None))
+        except Exception:
+            print("The copy was left as the database %s." % temp,
+                  file=sys.stderr)
+            raise
+
+    def save(self, name):
+        location = self.location(name)
+        self._copy(self.database, location)
+        return location
+
+    def restore(self, name, location):
+        self._copy(location, self.database)
+
+    def delete(self, name, location):
+        self._execute(("DROP DATABASE IF EXISTS %s" % self._quote(location),
+                       None))
+
+
+def main():
+    args = sys.argv[1:]
+    alias = 'default'
+    terminate = '--terminate' in args
+    if terminate:
+        args.remove('--terminate')
+    if '--database' in args:
+        i = args.index('--database')
+        alias = args[i + 1]
+        del args[i:i + 2]
+    if len(args) != 3 or args[0] not in ('save', 'restore', 'delete'):
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
+    action, name, directory = args
+    if not re.match(r'^\w[\w.-]*$', name):
+        print("Snapshot names are letters, digits, '_', '.' and '-'.",
+              file=sys.stderr)
+        sys.exit(2)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    setup_django()
+    from django.db import connections
+    connection = connections[alias]
+    snapshots = {'sqlite': SQLiteSnapshots,
+                 'postgresql': PostgreSQLSnapshots}.get(connection.vendor)
+    if snapshots is None:
+        print("Snapshots need a SQLite or PostgreSQL database, not %s." %
+              connection.vendor, file=sys.stderr)
+        sys.exit(1)
+    snapshots = snapshots(connection, directory)
+    if terminate and connection.vendor == 'postgresql':
+        snapshots.terminate = True
+    index = load_index(directory)
+    snapshot = index.get(name)
+    if action != 'save' and snapshot is None:
+        print("There is no snapshot named '%s'." % name, file=sys.stderr)
+        sys.exit(1)
+    started = time.time()
+    try:
+        if action == 'save':
+            progress(None, "Saving snapshot %s..." % name)
+            location = snapshots.save(name)
+        elif action == 'restore':
+            progress(None, "Restoring snapshot %s..." % name)
+            snapshots.restore(name, snapshot['location'])
+        else:
+            snapshots.delete(name, snapshot['location'])
+    except OtherSessions as e:
+        print("Other sessions are connected to the database %s:" % e.database,
+              file=sys.stderr)
+        for pid, user, application, address, state in e.sessions:
+            print("  pid %s, %s, %s from %s (%s)" % (pid, user,
+                  application or "unknown application", address or "local",
+                  state), file=sys.stderr)
+        sys.exit(EXIT_OTHER_SESSIONS)
+    if action == 'save':
+        snapshot = {'vendor': connection.vendor, 'database': snapshots.database,
+                    'location': location, 'created': time.time(),
+                    'size': os.path.getsize(location)
+                            if os.path.isfile(location) else None}
+        index[name] = snapshot
+    elif action == 'delete':
+        del index[name]
+    save_index(directory, index)
+    elapsed = time.time() - started
+    message("%s snapshot %s in %.2fs\n" % ({'save': "Saved",
+            'restore': "Restored", 'delete': "Deleted"}[action], name,
+            elapsed))
+    result({'action': action, 'name': name, 'snapshot': snapshot,
+            'time': elapsed})
+
+
+if __name__ == "__main__":
+    main()
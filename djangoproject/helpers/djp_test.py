@@ -0,0 +1,171 @@
+"""
+Run the project's tests for the gedit Django Project plugin.
+
+    djp_test.py [--parallel N] [--keepdb] [--failfast] [LABEL ...]
+
+The tests are run with the project's TEST_RUNNER, as manage.py test would,
+and each test is sent as a "test" event as soon as its result is known:
+
+    {"event": "test", "data": {"test": "polls.tests.QuestionTests.test_str",
+                               "status": "pass", "time": 0.01,
+                               "message": null}}
+
+The status is one of pass, fail, error, skip, xfail and xpass. With --parallel
+the results of a worker arrive when it finishes a test case class, and the
+time of each test is measured in the worker. The number of failed tests and
+the time the run took are sent as the result:
+
+    {"failed": 2, "time": 14.2}
+"""
+from __future__ import print_function
+import sys
+import time
+import unittest
+import traceback
+
+from djp_bootstrap import setup_django, progress, event, result, exit_on_sigterm
+
+STATUS = {'addSuccess': 'pass', 'addFailure': 'fail', 'addError': 'error',
+          'addSkip': 'skip', 'addExpectedFailure': 'xfail',
+          'addUnexpectedSuccess': 'xpass'}
+
+
+def summary(err):
+    """ Return the last line of an exception, or a skip reason. """
+    if isinstance(err, tuple) and len(err) == 3:
+        lines = "".join(traceback.format_exception_only(err[0], err[1]))
+        lines = lines.strip().splitlines()
+        return lines[-1] if lines else None
+    return str(err) if err is not None else None
+
+
+def streaming_result(base, total):
+    """ Return a subclass of the result class base which sends each test. """
+    class StreamingResult(base):
+        def startTest(self, test):
+            self._flush()
+            self._record = {'test': test.id(), 'status': 'pass',
+                            'time': None, 'message': None}
+            self._started = time.time()
+            base.startTest(self, test)
+
+        def stopTest(self, test):
+            base.stopTest(self, test)
+            # a parallel run sends the time measured in the worker next
+            self._pending = self._record
+            self._pending['time'] = time.time() - self._started
+            self._record = None
+
+        def stopTestRun(self):
+            self._flush()
+            base.stopTestRun(self)
+
+        def djpDuration(self, test, seconds):
+            if getattr(self, '_pending', None):
+                self._pending['time'] = seconds
+                self._flush()
+
+        def addSubTest(self, test, subtest, err):
+            base.addSubTest(self, test, subtest, err)
+            record = getattr(self, '_record', None)
+            if err is not None and record and record['status'] == 'pass':
+                failure = issubclass(err[0], test.failureException)
+                record['status'] = 'fail' if failure else 'error'
+                record['message'] = summary(err)
+
+        def _flush(self):
+            record = getattr(self, '_pending', None)
+            self._pending = None
+            if record:
+                event('test', record)
+                if record['status'] in ('fail', 'error'):
+                    self._failed = getattr(self, '_failed', 0) + 1
+                done = self.testsRun
+                progress(float(done) / total if total else None,
+                         "%d of %d tests, %d failed" % (done, total,
+                         getattr(self, '_failed', 0)))
+
+    def status_method(name):
+        method = getattr(base, name)
+        def add(self, test, *args):
+            method(self, test, *args)
+            record = getattr(self, '_record', None)
+            if record is None or record['test'] != test.id():
+                # errors in setUpClass and the like are not in a test
+                self._flush()
+                self._pending = {'test': test.id(), 'status': STATUS[name],
+                                 'time': 0.0, 'message': None}
+                record = self._pending
+            else:
+                record['status'] = STATUS[name]
+            if args:
+                record['message'] = summary(args[0])
+        return add
+    for name in STATUS:
+        setattr(StreamingResult, name, status_method(name))
+    return StreamingResult
+
+
+def time_parallel_tests():
+    """
+    Have the workers of a parallel run time each test, and send the time
+    along with the test's other events to the main process.
+    """
+    from django.test import runner
+    remote = getattr(runner, 'RemoteTestResult', None)
+    if remote is None:
+        return
+    start_test, stop_test = remote.startTest, remote.stopTest
+    def startTest(self, test):
+        self._djp_started = time.time()
+        start_test(self, test)
+    def stopTest(self, test):
+        stop_test(self, test)
+        self.events.append(('djpDuration', self.test_index,
+                            time.time() - self._djp_started))
+    remote.startTest = startTest
+    remote.stopTest = stopTest
+
+
+def streaming_runner(base):
+    """ Return a subclass of the test runner class base using the result. """
+    class StreamingRunner(base):
+        def run_suite(self, suite, **kwargs):
+            if hasattr(self, 'get_test_runner_kwargs'):
+                options = self.get_test_runner_kwargs()
+            else:
+                options = {'verbosity': self.verbosity,
+                           'failfast': self.failfast}
+            resultclass = options.get('resultclass') or unittest.TextTestResult
+            options['resultclass'] = streaming_result(resultclass,
+                                                      suite.countTestCases())
+            test_runner = getattr(self, 'test_runner', unittest.TextTestRunner)
+            return test_runner(**options).run(suite)
+    return StreamingRunner
+
+
+def main():
+    exit_on_sigterm()
+    args = sys.argv[1:]
+    options = {'verbosity': 1, 'interactive': False, 'parallel': 1,
+               'keepdb': False, 'failfast': False}
+    while args and args[0] in ('--parallel', '--keepdb', '--failfast'):
+        option = args.pop(0)
+        if option == '--parallel':
+            options['parallel'] = int(args.pop(0))
+        else:
+            options[option[2:]] = True
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import get_runner
+    time_parallel_tests()
+    progress(None, "Setting up the test databases...")
+    runner = streaming_runner(get_runner(settings))(**options)
+    started = time.time()
+    failed = runner.run_tests(args)
+    result({'failed': failed, 'time': time.time() - started})
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Long-lived worker process for the gedit Django Project plugin.
+
+Django is set up once and management commands are then read as JSON lines on
+stdin and run with call_command. Their output is written back as JSON lines on
+stdout:
+
+    <- {"ready": true, "watch": ["/path/to/settings.py", ...]}
+    -> {"id": 1, "args": ["sqlall", "polls"]}
+    <- {"id": 1, "stream": "stdout", "data": "BEGIN;\n..."}
+    <- {"id": 1, "exit": 0}
+
+Commands run with /dev/null as their stdin, so one which prompts reads the
+end of file instead of the next request, and with stderr as their file
+descriptor 1, so output which bypasses sys.stdout can't corrupt the
+protocol.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import json
+import traceback
+
+from djp_bootstrap import setup_django, watch_files, dump, parse_options
+
+FLUSH_SIZE = 65536
+FLUSH_INTERVAL = 0.1 # seconds
+
+
+class FrameWriter(object):
+    """
+    A file-like object which sends what is written to it as output frames of
+    the current command, batched by size and time.
+    """
+    def __init__(self, out, stream):
+        self.out = out
+        self.stream = stream
+        self.id = None
+        self._chunks = []
+        self._size = 0
+        self._flushed = time.time()
+
+    def write(self, data):
+        if not data:
+            return
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        self._chunks.append(data)
+        self._size += len(data)
+        if (self._size >= FLUSH_SIZE or
+                time.time() - self._flushed >= FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self):
+        self._flushed = time.time()
+        if not self._chunks:
+            return
+        data = "".join(self._chunks)
+        self._chunks = []
+        self._size = 0
+        dump({"id": self.id, "stream": self.stream, "data": data}, self.out)
+
+    def isatty(self):
+        return False
+
+
+def run_command(args, stdout, stderr):
+    """ Run a management command returning its exit code. """
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    try:
+        args, options = parse_options(args)
+        options.update(stdout=stdout, stderr=stderr)
+        call_command(*args, **options)
+    except CommandError as e:
+        stderr.write("CommandError: %s\n" % e)
+        return 1
+    except SystemExit as e:
+        code = e.code
+        if code is None:
+            return 0
+        if not isinstance(code, int):
+            stderr.write("%s\n" % code)
+            return 1
+        return code
+    except Exception:
+        stderr.write(traceback.format_exc())
+        return 1
+    return 0
+
+
+def main():
+    # the protocol owns a copy of the real stdout, anything printed goes to a
+    # command and writes to fd 1 itself, from C extensions or subprocesses,
+    # to stderr
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    stdout = FrameWriter(out, 'stdout')
+    stderr = FrameWriter(out, 'stderr')
+    sys.stdout = stdout
+    # and stdin, commands which prompt read end of file rather than requests
+    requests = os.fdopen(os.dup(sys.stdin.fileno()), 'r')
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, sys.stdin.fileno())
+    os.close(null)
+    sys.stdin = open(os.devnull)
+
+    setup_django()
+    dump({"ready": True, "watch": watch_files()}, out)
+
+    from django.db import connections
+    while True:
+        line = requests.readline()
+        if not line:
+            break
+        request = json.loads(line)
+        stdout.id = stderr.id = request["id"]
+        sys.stderr = stderr
+        try:
+            code = run_command(request["args"], stdout, stderr)
+        finally:
+            sys.stderr = sys.__stderr__
+            for connection in connections.all():
+                connection.close()
+        stdout.flush()
+        stderr.flush()
+        dump({"id": request["id"], "exit": code}, out)
+
+
+if __name__ == "__main__":
+    main()
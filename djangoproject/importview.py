@@ -0,0 +1,115 @@
+import os
+from gi.repository import GObject, Gtk, Pango
+
+TOP_OFFENDERS = 10
+OFFENDER_COLOR = '#C00000'
+
+(COL_NAME, COL_SELF, COL_CUMULATIVE, COL_KIND, COL_FILE, COL_WEIGHT,
+ COL_FOREGROUND) = range(7)
+
+class ImportView(Gtk.VBox):
+    """
+    The module imports of the project's start up as sent by the
+    djp_importtime.py helper, grouped by top level package: each app of the
+    project, each third-party package and the standard library. Within a
+    group the modules are nested under the module of the group which imported
+    them. The columns can be sorted by clicking their headers.
+
+    The TOP_OFFENDERS modules with the most own import time are highlighted.
+    Connect to the "open-location" signal to be notified with the filename of
+    a module which was double-clicked.
+    """
+    __gtype_name__ = "DjangoProjectImportView"
+    __gsignals__ = {
+        "open-location":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self._total = 0.0
+        self._model = Gtk.TreeStore(str, float, float, str, str, int, str)
+        self._sorted = Gtk.TreeModelSort(model=self._model)
+        self._sorted.set_sort_column_id(COL_SELF, Gtk.SortType.DESCENDING)
+        self._label = Gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        self._label.set_padding(3, 3)
+        self.pack_start(self._label, False, False, 0)
+
+        self._view = Gtk.TreeView.new_with_model(self._sorted)
+        self._view.set_rules_hint(True)
+        self._view.connect("row-activated", self.on_row_activated)
+        for title, index in (("Module", COL_NAME), ("Self (ms)", COL_SELF),
+                             ("Cumulative (ms)", COL_CUMULATIVE),
+                             ("Kind", COL_KIND)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index,
+                                        weight=COL_WEIGHT,
+                                        foreground=COL_FOREGROUND)
+            if index in (COL_SELF, COL_CUMULATIVE):
+                cell.set_alignment(1.0, 0.5)
+                column.set_cell_data_func(cell, self._format_time, index)
+            elif index == COL_NAME:
+                cell.set_property("ellipsize", Pango.EllipsizeMode.END)
+                column.set_expand(True)
+            column.set_sort_column_id(index)
+            column.set_resizable(True)
+            self._view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(self._view)
+        self.pack_start(scrolled, True, True, 0)
+        self.show_all()
+
+    def load(self, data):
+        """ Show the imports as sent by the djp_importtime.py helper. """
+        modules = data.get('modules', [])
+        self._total = data.get('total') or 0.0
+        ranked = sorted(range(len(modules)), key=lambda i: modules[i]['self'],
+                        reverse=True)
+        offenders = set(ranked[:TOP_OFFENDERS])
+        groups = {}
+        for module in modules:
+            group = groups.setdefault(module['group'], [module['kind'], 0.0])
+            group[1] += module['self']
+
+        self._view.set_model(None)
+        self._model.clear()
+        group_rows = {}
+        for name, (kind, seconds) in groups.items():
+            group_rows[name] = self._model.append(None, (name, seconds, seconds,
+                                                  kind, None, Pango.Weight.BOLD,
+                                                  None))
+        rows = []
+        for i, module in enumerate(modules):
+            # nest under the closest importer in the same group
+            parent = module['parent']
+            while parent is not None and \
+                  modules[parent]['group'] != module['group']:
+                parent = modules[parent]['parent']
+            parent_row = rows[parent] if parent is not None else \
+                         group_rows[module['group']]
+            offender = i in offenders
+            rows.append(self._model.append(parent_row, (module['name'],
+                        module['self'], module['cumulative'], module['kind'],
+                        module['file'],
+                        Pango.Weight.BOLD if offender else Pango.Weight.NORMAL,
+                        OFFENDER_COLOR if offender else None)))
+        slowest = sorted(groups.items(), key=lambda item: item[1][1],
+                         reverse=True)[:3]
+        self._label.set_text("%d modules imported in %.3fs (%s), slowest: %s"
+                             % (len(modules), self._total, data.get('method'),
+                             ", ".join("%s %.3fs" % (name, group[1])
+                                       for name, group in slowest)))
+        self._view.set_model(self._sorted)
+
+    def _format_time(self, column, cell, model, it, index):
+        cell.set_property("text", "%.1f" % (model.get_value(it, index) * 1000))
+
+    def on_row_activated(self, view, path, column, data=None):
+        model = view.get_model()
+        filename = model[path][COL_FILE]
+        if filename and os.path.isfile(filename):
+            self.emit("open-location", filename, 0)
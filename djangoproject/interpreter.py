@@ -0,0 +1,146 @@
+import os
+import logging
+from cache import cache_path, load_json, save_json
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+VENV_NAMES = ('.venv', 'venv', 'env', '.env')
+DEFAULT_PYTHON = "python"
+
+def get_cache_file():
+    return cache_path('interpreters.json')
+
+def is_virtualenv(path):
+    """
+    Return True if path is a virtual environment, either a venv with a
+    pyvenv.cfg or a classic virtualenv with bin/activate_this.py.
+    """
+    return (os.path.isfile(os.path.join(path, 'pyvenv.cfg')) or
+            os.path.isfile(os.path.join(path, 'bin', 'activate_this.py')))
+
+def get_venv_python(venv):
+    """ Return the Python interpreter of a virtual environment or None. """
+    for name in ('python', 'python3', 'python2'):
+        python = os.path.join(venv, 'bin', name)
+        if os.access(python, os.X_OK):
+            return python
+
+def get_python_venv(python):
+    """ Return the virtual environment python belongs to or None. """
+    if python and os.path.isabs(python):
+        venv = os.path.dirname(os.path.dirname(python))
+        if is_virtualenv(venv):
+            return venv
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def find_virtualenv(path):
+    """
+    Look for the virtual environment of the project at path. Checks are made
+    in order of likelihood using a fixed number of stats per directory:
+
+    1. $VIRTUAL_ENV of the environment Gedit was started from.
+    2. The project directory or one of its parents being a virtual environment
+       or containing one named .venv, venv, env or .env.
+    3. Any virtual environment directly within the project directory or its
+       parent, which needs a directory listing each.
+    """
+    venv = os.environ.get('VIRTUAL_ENV')
+    if venv and is_virtualenv(venv):
+        return venv
+
+    path = os.path.abspath(path)
+    parent = path
+    while True:
+        if is_virtualenv(parent):
+            return parent
+        for name in VENV_NAMES:
+            venv = os.path.join(parent, name)
+            if is_virtualenv(venv):
+                return venv
+        if os.path.dirname(parent) == parent:
+            break
+        parent = os.path.dirname(parent)
+
+    for parent in (path, os.path.dirname(path)):
+        try:
+            names = os.listdir(parent)
+        except OSError:
+            continue
+        for name in names:
+            venv = os.path.join(parent, name)
+            if is_virtualenv(venv):
+                return venv
+
+def find_interpreter(path):
+    """
+    Return the Python interpreter for the project at path. A configured
+    interpreter (see set_configured_interpreter) comes first, then the result
+    of a previous discovery if the interpreter has not changed since, then a
+    new discovery. Falls back to "python" found on the PATH.
+    """
+    path = os.path.abspath(path)
+    cache = load_json(get_cache_file(), {})
+    entry = cache.get(path, {})
+
+    configured = entry.get('configured')
+    if configured and os.access(configured, os.X_OK):
+        return configured
+
+    # a found interpreter is valid while it is unchanged, not finding one is
+    # valid until something is added to or removed from the project directory
+    python = entry.get('python')
+    stamp = entry.get('stamp')
+    if python and stamp and entry.get('mtime') is not None and \
+            _mtime(stamp) == entry.get('mtime'):
+        logger.debug("Using cached interpreter: %s" % python)
+        return python
+
+    venv = find_virtualenv(path)
+    python = get_venv_python(venv) if venv else None
+    if python:
+        logger.debug("Found virtual environment: %s" % venv)
+        stamp = python
+    else:
+        logger.debug("Virtual environment not found.")
+        python = DEFAULT_PYTHON
+        stamp = path
+    entry.update({'python': python, 'stamp': stamp, 'mtime': _mtime(stamp)})
+    cache[path] = entry
+    save_json(get_cache_file(), cache)
+    return python
+
+def set_configured_interpreter(path, python):
+    """
+    Set the Python interpreter to use for the project at path, or clear it
+    when python is None.
+    """
+    path = os.path.abspath(path)
+    cache = load_json(get_cache_file(), {})
+    entry = cache.setdefault(path, {})
+    if python:
+        entry['configured'] = python
+    else:
+        entry.pop('configured', None)
+    save_json(get_cache_file(), cache)
+
+def get_environ(python, env=None):
+    """
+    Return a copy of env (defaults to os.environ) set up to run commands with
+    python, activating its virtual environment if it belongs to one.
+    """
+    env = dict(os.environ if env is None else env)
+    venv = get_python_venv(python)
+    if venv:
+        env['VIRTUAL_ENV'] = venv
+        env['PATH'] = os.pathsep.join([os.path.join(venv, 'bin'),
+                                       env.get('PATH', os.defpath)])
+        env.pop('PYTHONHOME', None)
+    return env
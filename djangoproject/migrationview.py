@@ -0,0 +1,112 @@
+import os
+from gi.repository import GObject, Gtk, GLib, Pango
+
+RISK_COLORS = {'high': '#C00000', 'low': '#C06000'}
+SQL_DISPLAY_LENGTH = 300
+
+(COL_TEXT, COL_TIME, COL_ROWS, COL_RISK, COL_TOOLTIP, COL_FILE, COL_WEIGHT,
+ COL_FOREGROUND) = range(8)
+
+class MigrationView(Gtk.VBox):
+    """
+    The pending migrations as analyzed by the djp_migrations.py helper, each
+    with its SQL statements and the time it took to apply to a copy of the
+    database when timed.
+
+    Statements which rewrite or lock a table are flagged with the risk, in red
+    when the table is big. Connect to the "open-location" signal to be
+    notified with the filename of a migration which was double-clicked.
+    """
+    __gtype_name__ = "DjangoProjectMigrationView"
+    __gsignals__ = {
+        "open-location":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self._model = Gtk.TreeStore(str, str, str, str, str, str, int, str)
+        self._label = Gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        self._label.set_padding(3, 3)
+        self.pack_start(self._label, False, False, 0)
+
+        self._view = Gtk.TreeView.new_with_model(self._model)
+        self._view.set_rules_hint(True)
+        self._view.set_tooltip_column(COL_TOOLTIP)
+        self._view.connect("row-activated", self.on_row_activated)
+        for title, index in (("Migration / Statement", COL_TEXT),
+                             ("Time (s)", COL_TIME), ("Rows", COL_ROWS),
+                             ("Risk", COL_RISK)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index,
+                                        weight=COL_WEIGHT,
+                                        foreground=COL_FOREGROUND)
+            if index in (COL_TEXT, COL_RISK):
+                cell.set_property("ellipsize", Pango.EllipsizeMode.END)
+                column.set_expand(True)
+            else:
+                cell.set_alignment(1.0, 0.5)
+            column.set_resizable(True)
+            self._view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(self._view)
+        self.pack_start(scrolled, True, True, 0)
+        self.show_all()
+
+    def load(self, data):
+        """ Show the migrations as sent by the djp_migrations.py helper. """
+        migrations = data.get('migrations', [])
+        risky = high = 0
+        total = 0.0
+        self._view.set_model(None)
+        self._model.clear()
+        for migration in migrations:
+            levels = [s['level'] for s in migration['statements'] if s['level']]
+            level = None
+            if 'high' in levels:
+                level = 'high'
+            elif levels:
+                level = 'low'
+            elapsed = migration.get('time')
+            total += elapsed or 0.0
+            if migration.get('error'):
+                risk, color = migration['error'], RISK_COLORS['high']
+            else:
+                risk = "%d risky statements" % len(levels) if levels else ""
+                color = RISK_COLORS.get(level)
+            parent = self._model.append(None, (
+                "%s.%s" % (migration['app'], migration['name']),
+                "" if elapsed is None else "%.3f" % elapsed, "", risk,
+                GLib.markup_escape_text(migration.get('error') or ""),
+                migration.get('file'),
+                Pango.Weight.BOLD, color))
+            for statement in migration['statements']:
+                rows = statement.get('rows')
+                self._model.append(parent, (
+                    " ".join(statement['sql'].split())[:SQL_DISPLAY_LENGTH],
+                    "", "" if rows is None else str(rows),
+                    "; ".join(statement['risks']),
+                    GLib.markup_escape_text("\n".join([statement['sql']] + 
+                                                      statement['risks'])),
+                    migration.get('file'),
+                    Pango.Weight.BOLD if statement['level'] else
+                    Pango.Weight.NORMAL,
+                    RISK_COLORS.get(statement['level'])))
+            risky += len(levels)
+            high += levels.count('high')
+        self._label.set_text("%d pending migrations on %s, %d risky statements"
+                             ", %d on big tables%s" % (len(migrations),
+                             data.get('vendor'), risky, high,
+                             ", %.3fs on a copy of the database" % total
+                             if data.get('timed') else ""))
+        self._view.set_model(self._model)
+        self._view.expand_all()
+
+    def on_row_activated(self, view, path, column, data=None):
+        filename = self._model[path][COL_FILE]
+        if filename and os.path.isfile(filename):
+            self.emit("open-location", filename, 0)
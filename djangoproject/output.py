@@ -1,31 +1,70 @@
 import os
-import subprocess
 import shlex
 import logging
-from gi.repository import GObject, Gtk, GLib, Pango
+import codecs
+import tempfile
+from collections import deque
+from gi.repository import GObject, Gtk, GLib, Gio, Pango
+from process import Process
+from progress import ProgressBar
 
 logging.basicConfig()
 LOG_LEVEL = logging.ERROR
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
+FLUSH_INTERVAL = 16 # ms, about once per frame
+TRIM_SLACK = 1.1 # trim only once a limit is exceeded by 10%, in bulk
+LOAD_CHUNK_SIZE = 262144
+
 class OutputBox(Gtk.HBox):
     """
     A widget to display the output of running django commands.    
+    
+    Connect to the "command-finished" signal to be notified with the return
+    code each time a command run with run() exits.
     """
     __gtype_name__ = "DjangoProjectOutputBox"
+    __gsignals__ = {
+        "command-finished": 
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, 
+            (GObject.TYPE_PYOBJECT,)),
+    }
     
     def __init__(self):
         Gtk.HBox.__init__(self, homogeneous=False, spacing=4) 
         # configurable options
         self.cwd = None
+        self.env = None
+        self.max_lines = 10000 # scrollback limits, None for unlimited
+        self.max_chars = 2000000
+        self.save_transcript = True # full output of last command to temp file
+        self.spill_threshold = 1048576 # keep stdout up to this size in memory
+        self._transcript = None
+        self._trimmed = False
         self._last_output = None
+        self._last_output_file = None
+        self._spill = None
+        self._loaders = {} # BufferLoader: filename, for files being loaded
+        self._stdout_size = 0
+        self._process = None
+        self._queue = deque()
+        self._callback = None
+        self._stdout = self._stderr = None
+        self._pending = []
+        self._flush_id = 0
+        vbox = Gtk.VBox(homogeneous=False, spacing=0)
+        self._progress = ProgressBar()
+        vbox.pack_start(self._progress, False, False, 0)
         scrolled = Gtk.ScrolledWindow()
         self._view = self._create_view()
         scrolled.add(self._view)
-        self.pack_start(scrolled, True, True, 0)
+        vbox.pack_start(scrolled, True, True, 0)
+        self.pack_start(vbox, True, True, 0)
         self.set_font("monospace 10")
+        self.connect("destroy", self.on_destroy)
         self.show_all()
+        self._progress.hide()
     
     def _create_view(self):
         """ Create the gtk.TextView used for shell output """
@@ -35,53 +74,395 @@ class OutputBox(Gtk.HBox):
         buff.create_tag('bold', foreground='#7F7F7F', weight=Pango.Weight.BOLD)
         buff.create_tag('info', foreground='#7F7F7F', style=Pango.Style.OBLIQUE)
         buff.create_tag('error', foreground='red')
+        buff.create_mark('end', buff.get_end_iter(), False)
         return view
     
+    def get_progress(self):
+        """ Return the ProgressBar shown above the output. """
+        return self._progress
+    
+    def get_transcript_filename(self):
+        """ 
+        Return the temp file holding the full output of the most recent 
+        command, or None if save_transcript is off.
+        """
+        if self._transcript:
+            return self._transcript.name
+    
     def get_last_output(self):
+        """
+        Return the stdout of the most recent command as a string, or None if
+        there was none or it was spilled to disk, see get_last_output_filename().
+        """
         return self._last_output
+    
+    def get_last_output_filename(self):
+        """
+        Return the temp file holding the stdout of the most recent command if
+        it exceeded spill_threshold, otherwise None.
+        """
+        return self._last_output_file
+    
+    def has_last_output(self):
+        return bool(self._last_output or self._last_output_file)
+    
+    def load_last_output(self, buff, callback=None):
+        """
+        Load the stdout spilled to get_last_output_filename() into buff with a
+        BufferLoader, returned already started. The file is kept until it is
+        loaded, even if another command runs in the meantime.
+        """
+        filename = self._last_output_file
+        def finished(loader, error):
+            del self._loaders[loader]
+            if filename != self._last_output_file and \
+               filename not in self._loaders.values():
+                self._remove_file(filename)
+            if callback:
+                callback(loader, error)
+        loader = BufferLoader(filename, buff, finished)
+        self._loaders[loader] = filename
+        loader.start()
+        return loader
+    
+    def get_selected_text(self):
+        """ Return the text selected in the output, or None. """
+        buff = self._view.get_buffer()
+        bounds = buff.get_selection_bounds()
+        if bounds:
+            return buff.get_text(bounds[0], bounds[1], False)
         
     def set_font(self, font_name):
         font_desc = Pango.FontDescription(font_name)
         self._view.modify_font(font_desc)
         
-    def run(self, command, cwd=None):
-        """ Run a command inserting output into the gtk.TextView """
-        self.insert("Running: ", 'info')
-        self.insert("%s\n" % command, 'bold')
-        args = shlex.split(command)
-        output = None
+    def is_running(self):
+        return self._process is not None
+        
+    def run(self, command, cwd=None, callback=None):
+        """
+        Run a command streaming its output into the gtk.TextView.
+        
+        The output is read as it arrives, so the Gtk main loop keeps running
+        while the command does. Commands started while another one is still
+        running are queued. When a command exits the "command-finished" signal
+        is emitted and callback(returncode, error), if given, is called with 
+        the text the command wrote to stderr.
+        """
         if cwd is None:
             cwd = self.cwd
         logger.debug(cwd)
-        process = subprocess.Popen(args, 0, 
-                                   shell=False, 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE, 
-                                   cwd=cwd)
-        output = process.communicate()
-        if output[0]:
-            self.insert(output[0])
-            self._last_output = output[0]
-        if output[1]:
-            self.insert(output[1], 'error')
-        
+        process = Process(shlex.split(command), cwd, self.env)
+        self.run_process(process, command, callback)
+    
+    def run_process(self, process, title, callback=None):
+        """
+        Run process, an object with the "output" and "exited" signals and the
+        start() method of a Process, the same way run() runs a command. Output
+        of streams other than 'stdout' and 'stderr' is shown with the tag of 
+        the same name, such as 'info' or 'bold'.
+        """
+        self._queue.append((process, title, callback))
+        if not self.is_running():
+            self._run_next()
+    
+    def _run_next(self):
+        if not self._queue:
+            return
+        process, title, callback = self._queue.popleft()
+        self._open_transcript()
+        self.insert("Running: ", 'info')
+        self.insert("%s\n" % title, 'bold')
+        self._last_output = None
+        self._remove_last_output_file()
+        self._stdout = []
+        self._stdout_size = 0
+        self._stderr = []
+        self._callback = callback
+        self._process = process
+        self._process.connect("output", self.on_process_output)
+        self._process.connect("exited", self.on_process_exited)
+        try:
+            self._process.start()
+        except OSError as e:
+            self._stderr.append(str(e))
+            self.insert("%s\n" % e, 'error')
+            self.on_process_exited(self._process, None)
+    
+    def on_process_output(self, process, text, stream):
+        if stream == 'stdout':
+            self._append_stdout(text)
+            # spilled stdout is only written to the spill file
+            self.insert(text, transcript=self._spill is None)
+        elif stream == 'stderr':
+            self._stderr.append(text)
+            self.insert(text, 'error')
+        else:
+            # status messages such as 'info' are shown but not kept as output
+            self.insert(text, stream)
+    
+    def on_process_exited(self, process, returncode):
+        self._process = None
+        if self._spill:
+            self._spill.close()
+            self._last_output_file = self._spill.name
+            self._spill = None
+        elif self._stdout:
+            self._last_output = "".join(self._stdout)
+        error = "".join(self._stderr)
+        self._stdout = self._stderr = None
         self.insert("\nExit: ", 'info')
-        self.insert("%s\n\n" % process.returncode, 'bold')
+        self.insert("%s\n\n" % returncode, 'bold')
+        if self._transcript:
+            self._transcript.close()
+            self.flush()
+            if self._trimmed:
+                self.insert("Output trimmed, full output saved to: ", 'info')
+                self.insert("%s\n" % self._transcript.name, 'bold')
+                if self._last_output_file:
+                    self.insert("and the rest of stdout to: ", 'info')
+                    self.insert("%s\n" % self._last_output_file, 'bold')
+                self.insert("\n")
         
-        if output[1] and process.returncode <> 0:
-            raise Exception(output[1])
+        callback = self._callback
+        self._callback = None
+        self.emit("command-finished", returncode)
+        if callback:
+            callback(returncode, error)
+        self._run_next()
     
-    def insert(self, text, tag_name=None):
-        """ Insert text, apply tag, and scroll to end iter """
+    def _append_stdout(self, text):
+        """
+        Keep the stdout of the running command in memory until it grows past
+        spill_threshold, then move it into a temp file and append to that.
+        """
+        if self._spill:
+            self._spill.write(text.encode('utf-8'))
+            return
+        self._stdout.append(text)
+        self._stdout_size += len(text)
+        if not self.spill_threshold or self._stdout_size <= self.spill_threshold:
+            return
+        try:
+            self._spill = tempfile.NamedTemporaryFile(prefix="django-output-",
+                                                      suffix=".txt",
+                                                      delete=False)
+        except (IOError, OSError) as e:
+            logger.error("Could not create output file: %s" % e)
+            self.spill_threshold = None
+            return
+        for chunk in self._stdout:
+            self._spill.write(chunk.encode('utf-8'))
+        self._stdout = []
+        if self._transcript and not self._transcript.closed:
+            self._transcript.write(("\n[stdout continues in %s]\n" % 
+                                    self._spill.name).encode('utf-8'))
+    
+    def _remove_last_output_file(self):
+        filename, self._last_output_file = self._last_output_file, None
+        if filename and filename not in self._loaders.values():
+            self._remove_file(filename)
+    
+    def _remove_file(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+    
+    def insert(self, text, tag_name=None, transcript=True):
+        """ 
+        Queue text to be appended to the buffer with the given tag. Queued 
+        text is merged per tag and flushed at most once per frame. It is
+        also written to the transcript unless transcript is False.
+        """
+        text = "%s" % text
+        if not text:
+            return
+        if transcript and self._transcript and not self._transcript.closed:
+            if not isinstance(text, bytes):
+                self._transcript.write(text.encode('utf-8'))
+            else:
+                self._transcript.write(text)
+        if self._pending and self._pending[-1][0] == tag_name:
+            self._pending[-1][1].append(text)
+        else:
+            self._pending.append((tag_name, [text]))
+        if not self._flush_id:
+            self._flush_id = GLib.timeout_add(FLUSH_INTERVAL, self.on_flush_timeout)
+    
+    def flush(self):
+        """ Append all queued text to the buffer and scroll to the end once. """
+        if self._flush_id:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = 0
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
         buff = self._view.get_buffer()
-        end_iter = buff.get_end_iter()
-        buff.insert(end_iter, "%s" % text)
-        if tag_name:
-            offset = buff.get_char_count() - len(text)
-            start_iter = buff.get_iter_at_offset(offset)
-            end_iter = buff.get_end_iter()
-            buff.apply_tag_by_name(tag_name, start_iter, end_iter)
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-        self._view.scroll_to_iter(buff.get_end_iter(), 0.0, True, 0.0, 0.0)
-        
+        for tag_name, chunks in pending:
+            if tag_name:
+                buff.insert_with_tags_by_name(buff.get_end_iter(), 
+                                              "".join(chunks), tag_name)
+            else:
+                buff.insert(buff.get_end_iter(), "".join(chunks))
+        self._trim(buff)
+        self._view.scroll_to_mark(buff.get_mark('end'), 0.0, True, 0.0, 0.0)
+    
+    def _trim(self, buff):
+        """
+        Delete the oldest lines from the head of the buffer once it exceeds
+        max_lines or max_chars. Trimming is done in bulk, back down to the 
+        limits, so it only happens every so often.
+        """
+        end_iter = None
+        lines = buff.get_line_count()
+        if self.max_lines and lines > self.max_lines * TRIM_SLACK:
+            end_iter = buff.get_iter_at_line(lines - self.max_lines)
+        chars = buff.get_char_count()
+        if self.max_chars and chars > self.max_chars * TRIM_SLACK:
+            char_iter = buff.get_iter_at_offset(chars - self.max_chars)
+            if not char_iter.starts_line():
+                char_iter.forward_line()
+            if end_iter is None or char_iter.compare(end_iter) > 0:
+                end_iter = char_iter
+        if end_iter is None:
+            return
+        # the text keeps its tags, so whatever remains is still tagged properly
+        buff.delete(buff.get_start_iter(), end_iter)
+        self._trimmed = True
+    
+    def _open_transcript(self):
+        """ Replace the previous command's transcript with a new temp file. """
+        self._remove_transcript()
+        self._trimmed = False
+        if not self.save_transcript:
+            return
+        try:
+            self._transcript = tempfile.NamedTemporaryFile(prefix="django-output-",
+                                                           suffix=".log", 
+                                                           delete=False)
+        except (IOError, OSError) as e:
+            logger.error("Could not create transcript file: %s" % e)
+    
+    def _remove_transcript(self):
+        if self._transcript:
+            self._transcript.close()
+            try:
+                os.remove(self._transcript.name)
+            except OSError:
+                pass
+            self._transcript = None
+    
+    def on_destroy(self, widget, data=None):
+        if self._flush_id:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = 0
+        self._remove_transcript()
+        self._remove_last_output_file()
+        # files still being loaded are removed once the loads are cancelled
+        for loader in list(self._loaders):
+            loader.cancel()
+    
+    def on_flush_timeout(self):
+        self._flush_id = 0
+        self.flush()
+        return False
+
+
+class BufferLoader(object):
+    """
+    Load a file into a gtk.TextBuffer incrementally using Gio asynchronous
+    reads, inserting one chunk per main loop iteration so that large files
+    never end up in memory as a single string. 
+    
+    Call start() to begin loading and cancel() to stop. The callback, if given,
+    is called with the loader and an error message (or None) when done.
+    """
+    def __init__(self, filename, buff, callback=None):
+        self._file = Gio.File.new_for_path(filename)
+        self._buff = buff
+        self._callback = callback
+        self._cancellable = Gio.Cancellable()
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self._stream = None
+    
+    def cancel(self):
+        self._cancellable.cancel()
+    
+    def get_buffer(self):
+        return self._buff
+    
+    def start(self):
+        self._file.read_async(GLib.PRIORITY_DEFAULT, self._cancellable,
+                              self.on_read_ready, None)
+    
+    def on_read_ready(self, source, result, data=None):
+        try:
+            self._stream = source.read_finish(result)
+        except GLib.GError as e:
+            self._finish(str(e))
+            return
+        self._read_next()
+    
+    def _read_next(self):
+        self._stream.read_bytes_async(LOAD_CHUNK_SIZE, GLib.PRIORITY_DEFAULT, 
+                                      self._cancellable, self.on_bytes_ready,
+                                      None)
+    
+    def on_bytes_ready(self, stream, result, data=None):
+        try:
+            data = stream.read_bytes_finish(result).get_data()
+        except GLib.GError as e:
+            self._finish(str(e))
+            return
+        text = self._decoder.decode(data or b'', not data)
+        if text:
+            self._buff.insert(self._buff.get_end_iter(), text)
+        if data:
+            self._read_next()
+        else:
+            self._finish(None)
+    
+    def _finish(self, error):
+        if self._stream:
+            self._stream.close(None)
+            self._stream = None
+        if self._callback:
+            self._callback(self, error)
+
+
+def benchmark(lines=100000):
+    """ 
+    Push lines through an OutputBox one insert() at a time and report how long 
+    it takes until they have all been flushed to the buffer.
+    
+        python djangoproject/output.py [lines]
+    """
+    import time
+    window = Gtk.Window()
+    output = OutputBox()
+    window.add(output)
+    window.set_default_size(600, 400)
+    window.show_all()
+    
+    start = time.time()
+    for i in range(lines):
+        output.insert("%d: The quick brown fox jumps over the lazy dog\n" % i,
+                      'error' if i % 10 == 0 else None)
+    queued = time.time()
+    while output._pending or Gtk.events_pending():
+        Gtk.main_iteration()
+    done = time.time()
+    
+    buff = output._view.get_buffer()
+    print("%d lines queued in %.3fs, flushed in %.3fs, total %.3fs (%d lines/s)"
+          % (lines, queued - start, done - queued, done - start,
+             lines / (done - start)))
+    print("buffer: %d lines, %d chars" % (buff.get_line_count(), 
+                                          buff.get_char_count()))
+    window.destroy()
+
+
+if __name__ == "__main__":
+    import sys
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
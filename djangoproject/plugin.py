@@ -1,11 +1,33 @@
 import os
+import time
+import shlex
+import pipes
 import logging
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+from distutils.spawn import find_executable
 from gi.repository import GObject, Gtk, Gedit, Gio, GdkPixbuf
 from project import DjangoProject
 from server import DjangoServer
 from output import OutputBox
 from shell import Shell
 from appselector import AppSelector
+from worker import DjangoWorker
+from interpreter import set_configured_interpreter
+from pool import ProjectPool, ProjectContext
+from process import Process, HelperProcess, ProcessGroup, HELPERS_DIR
+from resultcache import ResultCache, CachedResult
+from backends import load_backends, save_backends
+from profileview import ProfileView
+from queries import QueryPanel
+from explain import PlanView, is_read_only
+from migrationview import MigrationView
+from importview import ImportView
+from testpanel import TestPanel
+from testhistory import TestHistory, changed_files, affected_labels
+from cache import cache_path, project_key, load_json
 
 logging.basicConfig()
 LOG_LEVEL = logging.DEBUG
@@ -16,6 +38,10 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 STOCK_DBSHELL = "dbshell"
 STOCK_SERVER = "server"
 STOCK_PYTHON = "python"
+SNAPSHOT_OTHER_SESSIONS = 3 # exit status of djp_snapshot.py
+# read-only commands whose output only changes with the settings and models
+CACHED_COMMANDS = ('diffsettings', 'sqlall', 'sqlindexes', 'inspectdb', 
+                   'validate')
 
 class Plugin(GObject.Object, Gedit.WindowActivatable):
     __gtype_name__ = "GeditDjangoProjectPlugin"
@@ -28,20 +54,52 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
         self._output = None
         self._shell = None
         self._dbshell = None
+        self._worker = None
+        self._use_worker = False
+        self._pool = ProjectPool(max_size=4)
+        self._keep_shells_warm = True
+        self._standby_shells = True # a second, started shell takes over on exit
+        self._enhanced_shell = False
+        self._recent_merge_id = 0
+        self._recent_actions = None
+        self._parallel_apps = False
+        self._max_parallel_jobs = None # defaults to the number of CPUs
+        self._fixture_batch_size = 0 # objects per batch, 0 loads whole files
+        self._result_cache = ResultCache(max_size=10485760)
+        self._use_result_cache = True
+        self._last_cached_command = None
+        self._server_backends = load_backends()
+        self._server_backend = 'runserver'
+        self._load_test_concurrency = 10
+        self._load_test_duration = 10 # seconds
+        self._load_test_url = "/"
+        self._profile = None
+        self._queries = None
+        self._plan = None
+        self._migrations = None
+        self._imports = None
+        self._tests = None
+        self._explain_analyze = False # runs the statement, then rolls back
+        self._use_sampling_profiler = True # py-spy when it is installed
         self._install_stock_icons()
         self._admin_cmd = "django-admin.py" 
         self._manage_cmd = "python manage.py"
         self._font = "monospace 10"
     
-    def _add_dbshell_panel(self):
-        """ Adds a database shell to the bottom pane. """
+    def _add_dbshell_panel(self, dbshell=None):
+        """ 
+        Adds a database shell to the bottom pane. An already running dbshell
+        can be given to use instead of a new one.
+        """
         logger.debug("Adding database shell panel.")
-        self._dbshell = Shell()
+        self._dbshell = dbshell or Shell()
         self._dbshell.set_font(self._font)
+        self._dbshell.standby = self._standby_shells
         panel = self.window.get_bottom_panel()
         panel.add_item_with_stock_icon(self._dbshell, "DjangoDbShell", 
                                        "Database Shell", STOCK_DBSHELL)
-        self._setup_dbshell_panel()
+        if not dbshell:
+            self._setup_dbshell_panel()
         panel.activate_item(self._dbshell)
                                        
     def _add_output_panel(self):
@@ -62,20 +120,81 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             self._server.cwd = cwd
         self._server.connect("server-started", self.on_server_started)
         self._server.connect("server-stopped", self.on_server_stopped)
+        self._server.connect("server-ready", self.on_server_ready)
         panel = self.window.get_bottom_panel()
         panel.add_item_with_stock_icon(self._server, "DjangoServer", 
                                        "Django Server", STOCK_SERVER)
         self._setup_server_panel()
     
-    def _add_shell_panel(self):
-        """ Adds a python shell to the bottom pane. """
+    def _add_profile_panel(self):
+        """ Adds the profile hotspots table to the bottom pane. """
+        logger.debug("Adding profile panel.")
+        self._profile = ProfileView()
+        self._profile.connect("open-location", self.on_open_location)
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._profile, "DjangoProfile", 
+                                       "Django Profile", 
+                                       Gtk.STOCK_SORT_DESCENDING)
+    
+    def _add_explain_panel(self):
+        """ Adds the query plan tree to the bottom pane. """
+        logger.debug("Adding query plan panel.")
+        self._plan = PlanView()
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._plan, "DjangoQueryPlan", 
+                                       "Query Plan", STOCK_DBSHELL)
+    
+    def _add_migrations_panel(self):
+        """ Adds the pending migrations analysis to the bottom pane. """
+        logger.debug("Adding migrations panel.")
+        self._migrations = MigrationView()
+        self._migrations.connect("open-location", self.on_open_location)
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._migrations, "DjangoMigrations", 
+                                       "Migrations", STOCK_DBSHELL)
+    
+    def _add_imports_panel(self):
+        """ Adds the start up import times to the bottom pane. """
+        logger.debug("Adding import times panel.")
+        self._imports = ImportView()
+        self._imports.connect("open-location", self.on_open_location)
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._imports, "DjangoImports", 
+                                       "Start Up Imports", 
+                                       Gtk.STOCK_SORT_DESCENDING)
+    
+    def _add_tests_panel(self):
+        """ Adds the test results to the bottom pane. """
+        logger.debug("Adding tests panel.")
+        self._tests = TestPanel()
+        self._tests.connect("run-tests", self.on_run_tests)
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._tests, "DjangoTests", 
+                                       "Tests", Gtk.STOCK_APPLY)
+    
+    def _add_queries_panel(self):
+        """ Adds the SQL queries captured from the server to the bottom pane. """
+        logger.debug("Adding SQL queries panel.")
+        self._queries = QueryPanel()
+        self._queries.connect("open-location", self.on_open_location)
+        panel = self.window.get_bottom_panel()
+        panel.add_item_with_stock_icon(self._queries, "DjangoQueries", 
+                                       "SQL Queries", STOCK_DBSHELL)
+    
+    def _add_shell_panel(self, shell=None):
+        """ 
+        Adds a python shell to the bottom pane. An already running shell can 
+        be given to use instead of a new one.
+        """
         logger.debug("Adding shell.")
-        self._shell = Shell()
+        self._shell = shell or Shell()
         self._shell.set_font(self._font)
+        self._shell.standby = self._standby_shells
         panel = self.window.get_bottom_panel()
         panel.add_item_with_stock_icon(self._shell, "DjangoShell", 
                                        "Python Shell", STOCK_PYTHON)
-        self._setup_shell_panel()
+        if not shell:
+            self._setup_shell_panel()
         panel.activate_item(self._shell)
                                        
     def _add_ui(self):
@@ -93,10 +212,21 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             ('OpenProject', Gtk.STOCK_OPEN, "_Open Project", 
                 "<Shift><Control>O", "Open an existing Django project.", 
                 self.on_open_project_activate),
+            ('SwitchProject', None, "_Switch Project", None, None, None),
             ('NewApp', Gtk.STOCK_NEW, "New _App...", 
                 "<Shift><Control>A", "Start a new Django application.", 
                 self.on_new_app_activate),
+            ('ServerBackend', None, "Server _Backend", None, None, None),
+            ('ServerSettings', None, "Server _Settings...", None, 
+                "Set the address, workers and reloading of the server backend.", 
+                self.on_server_settings_activate),
         ])
+        names = list(self._server_backends.keys())
+        self._global_actions.add_radio_actions([
+            ('ServerBackend_%s' % name, None, backend.label, None, 
+                "Serve the project with %s." % name, i) 
+            for i, (name, backend) in enumerate(self._server_backends.items())
+        ], names.index(self._server_backend), self.on_server_backend_changed)
         self._global_actions.add_toggle_actions([
             ('ViewServerPanel', None, "Django _Server", 
                 None, "Add the Django development server to the bottom panel.", 
@@ -107,6 +237,9 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             ('ViewDbShell', None, "_Database Shell", 
                 None, "Add a Database shell to the bottom panel.", 
                 self.on_view_db_shell_panel_activate, False),
+            ('ViewQueries', None, "SQL _Queries", 
+                None, "Capture the SQL queries of each request to the server in the bottom panel.", 
+                self.on_view_queries_panel_activate, False),
         ])
         manager.insert_action_group(self._global_actions)       
         
@@ -116,6 +249,9 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             ('CloseProject', Gtk.STOCK_CLOSE, "_Close Project...", 
                 "", "Close the current Django project.", 
                 self.on_close_project_activate),
+            ('SelectInterpreter', None, "Select _Interpreter...", 
+                None, "Select the Python interpreter used for the project.", 
+                self.on_select_interpreter_activate),
             ('Manage', None, "_Manage", None, None, None),
             ('SyncDb', Gtk.STOCK_REFRESH, "_Synchronize Database", None, 
                 "Creates the database tables for all apps whose tables have not already been created.", 
@@ -157,26 +293,92 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             ('Validate', None, "_Validate", None, 
                 "Validates all installed models.", 
                 self.on_manage_command_activate),
+            ('ShowMigrations', None, "Show _Migrations", None, 
+                "Lists the migrations of each app and whether they are applied.", 
+                self.on_manage_command_activate),
+            ('Migrate', None, "Mi_grate", None, 
+                "Applies the pending migrations to the database.", 
+                self.on_manage_command_activate),
+            ('SqlMigrate', None, "SQL for Migratio_n...", None, 
+                "Prints the SQL statements for the named migration.", 
+                self.on_sql_migrate_activate),
+            ('AnalyzeMigrations', None, "_Analyze Pending Migrations", None, 
+                "Shows the SQL of the pending migrations and flags statements which rewrite or lock tables.", 
+                self.on_analyze_migrations_activate),
+            ('TimeMigrations', None, "_Time Pending Migrations", None, 
+                "Analyzes the pending migrations and times each one on a copy of the database.", 
+                self.on_analyze_migrations_activate),
+            ('SaveSnapshot', None, "_Save DB Snapshot...", None, 
+                "Saves a named snapshot of the database to restore it from later.", 
+                self.on_save_snapshot_activate),
+            ('RestoreSnapshot', None, "_Restore DB Snapshot...", None, 
+                "Replaces the database with a snapshot saved earlier.", 
+                self.on_restore_snapshot_activate),
             ('LoadData', None, "_Load Data...", None, 
                 "Loads the contents of fixtures into the database.", 
                 self.on_manage_load_data_activate),
             ('DumpData', None, "_Dump Data...", None, 
                 "Outputs all data in the database associated with the named application(s).", 
                 self.on_manage_app_select_command_activate),
+            ('DumpDataToFile', None, "Dump Data to _File...", None, 
+                "Writes the data of the named application(s) to a fixture file, compressed by its extension.", 
+                self.on_manage_dump_data_to_file_activate),
+            ('RestartServer', None, "Re_start Development Server", 
+                "<Control><Shift>F5", "Restart the Django development server as soon as its port is free.", 
+                self.on_manage_restart_server_activate),
+            ('LoadTest', None, "_Load Test...", None, 
+                "Send concurrent requests to the running server and report the request rate and latency.", 
+                self.on_load_test_activate),
+            ('RunTests', None, "Run _Tests", None, 
+                "Runs the tests in parallel, showing each result and its time as it completes.", 
+                self.on_run_tests_activate),
+            ('ProfileCommand', None, "_Profile Command...", None, 
+                "Profile a management command or a request and show the hotspots.", 
+                self.on_profile_command_activate),
+            ('ProfileStartup', None, "Profile _Startup", None, 
+                "Time the module imports of setting up Django, grouped by app and package.", 
+                self.on_profile_startup_activate),
+            ('ExplainSql', None, "_Explain Selected SQL", None, 
+                "Show the query plan of the SQL selected in a document or the output.", 
+                self.on_explain_sql_activate),
+            ('RefreshCachedCommand', None, "Re_fresh Cached Command", None, 
+                "Run the last cached command again, replacing its cached output.", 
+                self.on_refresh_cached_command_activate),
         ])
         self._project_actions.add_toggle_actions([
             ('RunServer', None, "_Run Development Server", 
                 "<Shift>F5", "Start/Stop the Django development server.", 
                 self.on_manage_runserver_activate, False),
+            ('UseWorker', None, "Use _Warm Worker", None, 
+                "Run management commands in a long-lived Django process.", 
+                self.on_use_worker_activate, False),
+            ('ParallelApps', None, "Run SQL Per App in _Parallel", None, 
+                "Run SQL commands for several apps as one process per app in parallel.", 
+                self.on_parallel_apps_activate, False),
+            ('UseResultCache', None, "_Cache Command Results", None, 
+                "Show the cached output of read-only commands when settings and models are unchanged.", 
+                self.on_use_result_cache_activate, True),
+            ('EnhancedShell', None, "_Enhanced Python Shell", None, 
+                "Start the Python shell with all models imported and a breakdown of the start up time.", 
+                self.on_enhanced_shell_activate, False),
+            ('ExplainAnalyze', None, "E_xplain Analyze", None, 
+                "Run the statement being explained to get actual rows and times, rolling back its changes.", 
+                self.on_explain_analyze_activate, False),
         ])
         self._project_actions.set_sensitive(False)
         manager.insert_action_group(self._project_actions)   
         
         self._ui_merge_id = manager.add_ui_from_file(ui_file)
         manager.ensure_update()
+        self._update_recent_projects_menu()
     
     def close_project(self):
+        self._output.get_progress().finish()
+        if self._project:
+            self._project.close_project()
         self._project = None
+        self._output.env = None
+        self._stop_worker()
         self._server.stop()
         self._server.cwd = None
         self._server.refresh_ui()
@@ -211,11 +413,19 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
 
     def do_deactivate(self):
         logger.debug("Deactivating plugin.")
+        self._stop_worker()
+        self._pool.clear()
         self._remove_ui()
         self._remove_output_panel()
         self._remove_server_panel()
         self._remove_shell_panel()
         self._remove_dbshell_panel()
+        self._remove_profile_panel()
+        self._remove_queries_panel()
+        self._remove_explain_panel()
+        self._remove_migrations_panel()
+        self._remove_imports_panel()
+        self._remove_tests_panel()
 
     def do_update_state(self):
         pass
@@ -247,7 +457,8 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
     def new_app(self, path, name):
         """ Runs the 'startapp' Django command. """ 
         try:
-            self.run_admin_command("startapp %s" % name, path)
+            self.run_admin_command("startapp %s" % name, path, 
+                                   self.on_command_finished)
         except Exception as e:
             self.error_dialog(str(e))
             
@@ -279,13 +490,15 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
     
     def new_project(self, path, name):
         """ Runs the 'startproject' Django command and opens the project. """ 
+        def finished(returncode, error):
+            if returncode == 0:
+                self.open_project(os.path.join(path, name))
+            else:
+                self.on_command_finished(returncode, error)
         try:
-            self.run_admin_command("startproject %s" % name, path)
+            self.run_admin_command("startproject %s" % name, path, finished)
         except Exception as e:
             self.error_dialog(str(e))
-            return
-        
-        self.open_project(os.path.join(path, name))
     
     def new_tab_from_output(self):
         message = "Do you want to create a new document with the output?"
@@ -293,27 +506,51 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             return
         tab = self.window.create_tab(False)
         buff = tab.get_view().get_buffer()
-        end_iter = buff.get_end_iter()
-        buff.insert(end_iter, self._output.get_last_output())
+        if self._output.get_last_output_filename():
+            # large output was spilled to disk, load it in chunks
+            buff.begin_not_undoable_action()
+            self._output.load_last_output(buff, self.on_output_loaded)
+        else:
+            end_iter = buff.get_end_iter()
+            buff.insert(end_iter, self._output.get_last_output())
         self.window.set_active_tab(tab)
             
+    def on_output_loaded(self, loader, error):
+        """ Called by BufferLoader when output has been loaded into a tab. """
+        loader.get_buffer().end_not_undoable_action()
+        if error:
+            self.error_dialog("Could not load output: %s" % error)
+            
     def on_close_project_activate(self, action, data=None):
         self.close_project()
+    
+    def on_command_finished(self, returncode, error):
+        """ Show an error dialog for a command which failed with an error. """
+        if error and returncode != 0:
+            self.error_dialog(error)
+    
+    def on_command_output_finished(self, returncode, error):
+        """ Offer the output of a successful command in a new document. """
+        if returncode == 0 and self._output.has_last_output():
+            self.new_tab_from_output()
    
     def on_manage_command_activate(self, action, data=None):
         """ Handles simple manage.py actions. """
         command = action.get_name().lower()
-        if command in ('syncdb', 'flush'):
+        if command in ('syncdb', 'flush', 'migrate'):
             command += ' --noinput'
-        try:
-            self.run_management_command(command)
-        except:
-            pass # errors show up in output
-        
+        callback = None # errors show up in output
         if command in ('inspectdb', 'sqlflush', 'diffsettings'):
-            self.new_tab_from_output()
+            callback = self.on_command_output_finished
+        if command in CACHED_COMMANDS:
+            self.run_cached_management_command(command, callback)
+        else:
+            self.run_management_command(command, callback)
     
     def on_manage_app_select_command_activate(self, action, data=None):
+        if not self._project.is_loaded():
+            self.error_dialog("The project is still loading, try again shortly.")
+            return
         dialog = Gtk.Dialog("Select apps...",
                             self.window,
                             Gtk.DialogFlags.MODAL | 
@@ -324,7 +561,7 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
         selector = AppSelector()
         selector.show_all()
         try:
-            selector.load_from_settings(self._project.get_settings_module())
+            selector.load_apps(self._project.get_installed_apps())
         except Exception as e:
             self.error_dialog("Error getting app list: %s" % str(e))
         box = dialog.get_content_area()
@@ -335,17 +572,191 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             files = selector.get_selected()
             command = action.get_name().lower()
             full_command = "%s %s" % (command, " ".join([f for f in files]) )
-            try:
-                self.run_management_command(full_command)
-            except Exception as e:
-                self.error_dialog(str(e))
+            # the new tab prompt only comes once the command has finished
+            if command[:3] == "sql" or command in ('dumpdata'):
+                callback = self.on_command_output_finished
+            else:
+                callback = self.on_command_finished
+            if self._parallel_apps and command[:3] == "sql" and len(files) > 1:
+                run = lambda callback: self.run_management_command_per_app(
+                                                    command, files, callback)
+            else:
+                run = lambda callback: self.run_management_command(
+                                                    full_command, callback)
+            if command in CACHED_COMMANDS:
+                self.run_cached_management_command(full_command, callback, 
+                                                   files, run)
+            else:
+                run(callback)
         dialog.destroy()
         
-        # only after the dialog is destroyed do we prompt them for a new tab
+    def on_sql_migrate_activate(self, action, data=None):
+        """ Prompt the user for an app and migration to print the SQL of. """
+        if not self._project.is_loaded():
+            self.error_dialog("The project is still loading, try again shortly.")
+            return
+        dialog = Gtk.Dialog("SQL for Migration",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_OK, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        grid = Gtk.Grid()
+        grid.set_row_spacing(6)
+        grid.set_column_spacing(12)
+        app = Gtk.ComboBoxText()
+        for config in self._project.get_info('apps', []):
+            app.append_text(config['label'])
+        app.set_active(0)
+        name = Gtk.Entry()
+        name.set_placeholder_text("0001 or 0001_initial")
+        name.set_activates_default(True)
+        backwards = Gtk.CheckButton.new_with_mnemonic("_Backwards")
+        for row, (text, widget) in enumerate((("_App:", app), 
+                                              ("_Migration:", name))):
+            label = Gtk.Label.new_with_mnemonic(text)
+            label.set_alignment(0.0, 0.5)
+            label.set_mnemonic_widget(widget)
+            grid.attach(label, 0, row, 1, 1)
+            grid.attach(widget, 1, row, 1, 1)
+        grid.attach(backwards, 1, 2, 1, 1)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.pack_start(grid, True, True, 0)
+        grid.show_all()
+        response = dialog.run()
+        app_label = app.get_active_text()
+        migration = name.get_text().strip()
+        command = "sqlmigrate %s %s" % (app_label, migration)
+        if backwards.get_active():
+            command += " --backwards"
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK and app_label and migration:
+            self.run_management_command(command, 
+                                        self.on_command_output_finished)
+    
+    def on_analyze_migrations_activate(self, action, data=None):
+        """ 
+        Analyze the pending migrations and, for TimeMigrations, time them on a
+        copy of the database.
+        """
+        args = ['--time'] if action.get_name() == 'TimeMigrations' else []
+        def on_result(process, migrations):
+            if not self._migrations:
+                self._add_migrations_panel()
+            self._migrations.load(migrations)
+            self.window.get_bottom_panel().activate_item(self._migrations)
+        self.run_helper('djp_migrations.py', args, 
+                        "%s migrations" % ("time" if args else "analyze"), 
+                        self.on_command_finished, on_result)
+    
+    def _get_snapshot_dir(self):
+        """ Return the directory of the open project's database snapshots. """
+        return os.path.dirname(cache_path('snapshots', 
+                               project_key(self._project.get_path()), 'index'))
+    
+    def on_save_snapshot_activate(self, action, data=None):
+        """ Prompt the user for a name to save a database snapshot as. """
+        dialog = Gtk.Dialog("Save DB Snapshot",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        label = Gtk.Label.new_with_mnemonic("Snapshot _name:")
+        label.set_alignment(0.0, 0.5)
+        entry = Gtk.Entry()
+        entry.set_text(time.strftime("%Y%m%d-%H%M%S"))
+        entry.set_activates_default(True)
+        label.set_mnemonic_widget(entry)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.set_spacing(6)
+        for widget in (label, entry):
+            box.pack_start(widget, False, False, 0)
+            widget.show()
+        response = dialog.run()
+        name = entry.get_text().strip()
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK and name:
+            self.run_snapshot('save', name)
+    
+    def run_snapshot(self, action, name, terminate=False):
+        """ 
+        Save or restore the snapshot name. If other sessions are connected to
+        a PostgreSQL database being copied, the user is asked whether to
+        close them and try again.
+        """
+        args = [action, name, self._get_snapshot_dir()]
+        if terminate:
+            args.append('--terminate')
+        def finished(returncode, error):
+            if returncode == SNAPSHOT_OTHER_SESSIONS:
+                if self.confirmation_dialog("%s\nClose these sessions and "
+                                            "%s the snapshot anyway?" % (
+                                            error.strip(), action)):
+                    self.run_snapshot(action, name, True)
+            else:
+                self.on_command_finished(returncode, error)
+        self.run_helper('djp_snapshot.py', args, 
+                        "%s snapshot %s" % (action, name), finished)
+    
+    def on_restore_snapshot_activate(self, action, data=None):
+        """ Prompt the user for a database snapshot to restore or delete. """
+        directory = self._get_snapshot_dir()
+        snapshots = load_json(os.path.join(directory, 'snapshots.json'), {})
+        if not snapshots:
+            self.error_dialog("There are no snapshots of this project's "
+                              "database yet.")
+            return
+        dialog = Gtk.Dialog("Restore DB Snapshot",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_DELETE, Gtk.ResponseType.REJECT,
+                            Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_REVERT_TO_SAVED, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        dialog.set_default_size(400, 250)
+        model = Gtk.ListStore(str, str, str)
+        for name, snapshot in sorted(snapshots.items(), 
+                                     key=lambda item: item[1].get('created'), 
+                                     reverse=True):
+            size = snapshot.get('size')
+            model.append((name, time.strftime("%Y-%m-%d %H:%M:%S", 
+                          time.localtime(snapshot.get('created', 0))),
+                          "%.1f MB" % (size / 1048576.0) if size else ""))
+        view = Gtk.TreeView.new_with_model(model)
+        for i, title in enumerate(("Name", "Saved", "Size")):
+            view.append_column(Gtk.TreeViewColumn(title, 
+                               Gtk.CellRendererText(), text=i))
+        view.connect("row-activated", lambda view, path, column: 
+                     dialog.response(Gtk.ResponseType.OK))
+        view.get_selection().select_path(0)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(view)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.pack_start(scrolled, True, True, 0)
+        scrolled.show_all()
+        response = dialog.run()
+        model, it = view.get_selection().get_selected()
+        name = model.get_value(it, 0) if it else None
+        dialog.destroy()
+        if not name:
+            return
         if response == Gtk.ResponseType.OK:
-            if command[:3] == "sql" or command in ('dumpdata'):
-                self.new_tab_from_output()
-        
+            self.run_snapshot('restore', name)
+        elif response == Gtk.ResponseType.REJECT and \
+             self.confirmation_dialog("Delete the snapshot %s?" % name):
+            self.run_helper('djp_snapshot.py', ['delete', name, directory], 
+                            "delete snapshot %s" % name, 
+                            self.on_command_finished)
+    
     def on_manage_load_data_activate(self, action, data=None):
         """ Prompt user for fixtures to load into database. """
         dialog = Gtk.FileChooserDialog("Select fixtures...",
@@ -358,14 +769,56 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             dialog.set_filename(self._project.get_path())
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            files = dialog.get_files()
-            command = "loaddata "+" ".join([f.get_path() for f in files]) 
-            try:
-                self.run_management_command(command)
-            except Exception as e:
-                self.error_dialog(str(e))
+            files = [f.get_path() for f in dialog.get_files()]
+            args = ['load', '--batch-size', str(self._fixture_batch_size)]
+            self.run_helper('djp_fixtures.py', args + files, 
+                            "loaddata %s" % " ".join(files), 
+                            self.on_command_finished)
             
         dialog.destroy()
+    
+    def on_manage_dump_data_to_file_activate(self, action, data=None):
+        """ Prompt user for apps and a fixture file to dump data into. """
+        if not self._project.is_loaded():
+            self.error_dialog("The project is still loading, try again shortly.")
+            return
+        dialog = Gtk.Dialog("Select apps...",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_OK, Gtk.ResponseType.OK))
+        dialog.set_default_size(300, 200)
+        selector = AppSelector()
+        selector.show_all()
+        try:
+            selector.load_apps(self._project.get_installed_apps())
+        except Exception as e:
+            self.error_dialog("Error getting app list: %s" % str(e))
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.pack_start(selector, True, True, 0)
+        response = dialog.run()
+        apps = selector.get_selected()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+        
+        dialog = Gtk.FileChooserDialog("Save fixture as...",
+                                       self.window,
+                                       Gtk.FileChooserAction.SAVE,
+                                       (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                                       Gtk.STOCK_SAVE, Gtk.ResponseType.OK))
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_folder(self._project.get_path())
+        dialog.set_current_name("fixture.json.gz")
+        response = dialog.run()
+        filename = dialog.get_filename()
+        dialog.destroy()
+        if response == Gtk.ResponseType.OK and filename:
+            self.run_helper('djp_fixtures.py', ['dump', filename] + apps, 
+                            "dumpdata %s > %s" % (" ".join(apps), filename),
+                            self.on_command_finished)
          
     def on_manage_runserver_activate(self, action, data=None):
         """ Run Django development server. """
@@ -380,6 +833,259 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             self.error_dialog(str(e))
             return
         
+    def on_manage_restart_server_activate(self, action, data=None):
+        """ Restart Django development server. """
+        if not self._server:
+            return
+        try:
+            self._server.restart()
+        except Exception as e:
+            self.error_dialog(str(e))
+        
+    def on_load_test_activate(self, action, data=None):
+        """ Prompt the user for a URL and load test the running server. """
+        if not self._server or not self._server.is_running():
+            self.error_dialog("Start the development server to load test it.")
+            return
+        host, port = self._server.get_address()
+        host = {'0.0.0.0': '127.0.0.1', '::': '::1'}.get(host, host)
+        allowed = ('localhost', '127.0.0.1', '::1', host.lower())
+        if ':' in host:
+            host = "[%s]" % host
+        dialog = Gtk.Dialog("Load Test",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_EXECUTE, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        grid = Gtk.Grid(row_spacing=6, column_spacing=12)
+        url = Gtk.Entry()
+        url.set_width_chars(40)
+        url.set_text("http://%s:%d%s" % (host, port, self._load_test_url))
+        url.set_activates_default(True)
+        concurrency = Gtk.SpinButton.new_with_range(1, 1000, 1)
+        concurrency.set_value(self._load_test_concurrency)
+        duration = Gtk.SpinButton.new_with_range(1, 3600, 1)
+        duration.set_value(self._load_test_duration)
+        for row, (label, widget) in enumerate((("_URL:", url), 
+                                               ("_Concurrency:", concurrency),
+                                               ("_Duration (s):", duration))):
+            label = Gtk.Label.new_with_mnemonic(label)
+            label.set_mnemonic_widget(widget)
+            label.set_alignment(0.0, 0.5)
+            grid.attach(label, 0, row, 1, 1)
+            grid.attach(widget, 1, row, 1, 1)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.pack_start(grid, True, True, 0)
+        grid.show_all()
+        while True:
+            response = dialog.run()
+            target = url.get_text().strip()
+            if response != Gtk.ResponseType.OK or not target:
+                dialog.destroy()
+                return
+            parts = urlsplit(target)
+            if parts.scheme in ('http', 'https') and \
+               (parts.hostname or '').lower() in allowed:
+                break
+            self.error_dialog("Only the development server can be load "
+                              "tested, enter a URL on %s." % host)
+        self._load_test_concurrency = concurrency.get_value_as_int()
+        self._load_test_duration = duration.get_value_as_int()
+        dialog.destroy()
+        self._load_test_url = "/" + target.split("://", 1)[-1].partition("/")[2]
+        args = [target, '--concurrency', str(self._load_test_concurrency), 
+                '--duration', str(self._load_test_duration),
+                '--allow-host', allowed[-1]]
+        self.run_helper('djp_loadtest.py', args, "load test %s" % target, 
+                        self.on_command_finished)
+        
+    def on_profile_command_activate(self, action, data=None):
+        """ Prompt the user for a command or URL to profile. """
+        if not self._project.is_loaded():
+            self.error_dialog("The project is still loading, try again shortly.")
+            return
+        dialog = Gtk.Dialog("Profile Command",
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_EXECUTE, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        label = Gtk.Label.new_with_mnemonic(
+                        "_Management command, or a URL path such as /polls/:")
+        label.set_alignment(0.0, 0.5)
+        entry = Gtk.Entry()
+        entry.set_width_chars(40)
+        entry.set_activates_default(True)
+        label.set_mnemonic_widget(entry)
+        sampler = Gtk.CheckButton.new_with_mnemonic(
+                        "Use the _sampling profiler (py-spy) when installed")
+        sampler.set_active(self._use_sampling_profiler)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.set_spacing(6)
+        for widget in (label, entry, sampler):
+            box.pack_start(widget, False, False, 0)
+            widget.show()
+        response = dialog.run()
+        command = entry.get_text().strip()
+        self._use_sampling_profiler = sampler.get_active()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK or not command:
+            return
+        self.profile_command(command)
+    
+    def profile_command(self, command):
+        """ 
+        Profile a manage.py command, or request a URL path, and show the 
+        hotspots in the profile panel. 
+        """
+        args = shlex.split(command)
+        name = "".join(c if c.isalnum() else "-" for c in args[0].strip("/"))
+        filename = cache_path('profiles', "%s-%s.prof" % (name or "root",
+                              time.strftime("%Y%m%d-%H%M%S")))
+        sampler = 'auto' if self._use_sampling_profiler else 'cprofile'
+        def on_result(process, profile):
+            if not self._profile:
+                self._add_profile_panel()
+            self._profile.cwd = self._project.get_path()
+            self._profile.load(profile)
+            self._output.insert("Profile saved to: ", 'info')
+            self._output.insert("%s\n" % profile.get('filename'), 'bold')
+            self.window.get_bottom_panel().activate_item(self._profile)
+        self.run_helper('djp_profile.py', [filename, '--sampler', sampler] + args,
+                        "profile %s" % command, self.on_command_finished, 
+                        on_result)
+    
+    def on_explain_sql_activate(self, action, data=None):
+        """ 
+        Explain the SQL selected in the active document or, failing that, in
+        the output panel.
+        """
+        sql = None
+        doc = self.window.get_active_document()
+        if doc and doc.get_has_selection():
+            start, end = doc.get_selection_bounds()
+            sql = doc.get_text(start, end, False)
+        if not sql or not sql.strip():
+            sql = self._output.get_selected_text()
+        if not sql or not sql.strip():
+            self.error_dialog("Select the SQL statement to explain in a document "
+                              "or the output first.")
+            return
+        self.explain_sql(sql.strip())
+    
+    def on_explain_analyze_activate(self, action, data=None):
+        self._explain_analyze = action.get_active()
+    
+    def explain_sql(self, sql):
+        """ Explain a SQL statement and show its plan in the plan panel. """
+        args = []
+        if self._explain_analyze:
+            args.append('--analyze')
+            if not is_read_only(sql):
+                message = ("Explain Analyze runs the statement. Its changes "
+                           "are rolled back, but sequences, triggers and "
+                           "the time it takes are not. Run it anyway?")
+                if not self.confirmation_dialog(message):
+                    return
+                args.append('--allow-writes')
+        def on_result(process, plan):
+            if not self._plan:
+                self._add_explain_panel()
+            self._plan.load(plan)
+            self.window.get_bottom_panel().activate_item(self._plan)
+        self.run_helper('djp_explain.py', args + [sql], 
+                        "explain %s" % " ".join(sql.split())[:60], 
+                        self.on_command_finished, on_result)
+    
+    def on_run_tests_activate(self, action, data=None):
+        if not self._tests:
+            self._add_tests_panel()
+        self.on_run_tests(self._tests, 'all')
+    
+    def on_run_tests(self, panel, mode):
+        """ Run all tests, the failed tests or the tests affected by changes. """
+        if not self._project:
+            return
+        if not self._project.is_loaded():
+            self.error_dialog("The project is still loading, try again shortly.")
+            return
+        path = self._project.get_path()
+        history = TestHistory(cache_path('tests', project_key(path) + '.sqlite3'))
+        labels = []
+        if mode == 'failed':
+            labels = history.last_failed()
+            if not labels:
+                history.close()
+                self.error_dialog("No tests failed in the last run.")
+                return
+        elif mode == 'affected' and history.last_started():
+            files = changed_files(path, history.last_started())
+            if not files:
+                history.close()
+                self.error_dialog("No files changed since the last run.")
+                return
+            labels = affected_labels(path, self._project.get_info('apps', []), 
+                                     files) or []
+        self.run_tests(labels, history)
+    
+    def run_tests(self, labels, history):
+        """ Run the tests labels, all tests for [], recording them in history. """
+        parallel = self._tests.get_parallel()
+        args = ['--parallel', str(parallel)]
+        if self._tests.get_keepdb():
+            args.append('--keepdb')
+        run = history.start_run(labels, parallel)
+        averages = history.averages(run)
+        results = []
+        self._tests.start(labels)
+        def on_event(process, name, record):
+            if name == 'test':
+                history.add(run, record['test'], record['status'], 
+                            record.get('time'), record.get('message'))
+                self._tests.add(record, averages.get(record['test']))
+        def on_result(process, data):
+            history.finish_run(run, data['time'], data['failed'])
+            results.append(data)
+        def finished(returncode, error):
+            self._tests.finish(results[0] if results else None)
+            history.close()
+        process = self.run_helper('djp_test.py', args + labels, 
+                                  "test %s" % " ".join(labels), finished, 
+                                  on_result)
+        process.connect("event", on_event)
+        self.window.get_bottom_panel().activate_item(self._tests)
+    
+    def on_profile_startup_activate(self, action, data=None):
+        """ Time the imports of setting up Django for the project. """
+        def on_result(process, imports):
+            if not self._imports:
+                self._add_imports_panel()
+            self._imports.load(imports)
+            self.window.get_bottom_panel().activate_item(self._imports)
+        self.run_helper('djp_importtime.py', [], "profile startup", 
+                        self.on_command_finished, on_result)
+    
+    def on_open_location(self, widget, filename, line):
+        self.open_location(filename, line)
+    
+    def open_location(self, filename, line=0):
+        """ Open filename in a tab, or switch to it, and go to line. """
+        location = Gio.File.new_for_path(filename)
+        tab = self.window.get_tab_from_location(location)
+        if tab:
+            self.window.set_active_tab(tab)
+            if line:
+                tab.get_document().goto_line(line - 1)
+                tab.get_view().scroll_to_cursor()
+        else:
+            self.window.create_tab_from_location(location, None, line, 0, 
+                                                 False, True)
+        
     def on_new_app_activate(self, action, data=None):
         """ Prompt user for new app name and directory """
         name, path = self.new_dialog("New Django App")
@@ -406,16 +1112,132 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
         if path:
             self.open_project(path)
     
+    def on_select_interpreter_activate(self, action, data=None):
+        """ Prompt the user for the project's Python interpreter. """
+        dialog = Gtk.FileChooserDialog("Select Python interpreter...", 
+                                       self.window,
+                                       Gtk.FileChooserAction.OPEN,
+                                       ("_Automatic", Gtk.ResponseType.REJECT,
+                                        Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                                        Gtk.STOCK_OPEN, Gtk.ResponseType.OK))
+        dialog.set_filename(self._project.get_python())
+        response = dialog.run()
+        python = dialog.get_filename()
+        dialog.destroy()
+        path = self._project.get_path()
+        if response == Gtk.ResponseType.OK and python:
+            set_configured_interpreter(path, python)
+        elif response == Gtk.ResponseType.REJECT:
+            set_configured_interpreter(path, None)
+        else:
+            return
+        # reload the project rather than switching back to it warm
+        self.close_project()
+        self.open_project(path)
+    
     def on_server_started(self, server, pid, data=None):
         self._project_actions.get_action("RunServer").set_active(True)
         panel = self.window.get_bottom_panel()
         panel.activate_item(self._server)
                 
+    def on_server_backend_changed(self, action, current, data=None):
+        """ Serve the project with another backend, restarting the server. """
+        self._server_backend = list(self._server_backends.keys())[
+                                                        current.get_current_value()]
+        self._update_server()
+    
+    def on_server_settings_activate(self, action, data=None):
+        """ Prompt the user for the settings of the current server backend. """
+        backend = self._server_backends[self._server_backend]
+        dialog = Gtk.Dialog("%s settings" % backend.name,
+                            self.window,
+                            Gtk.DialogFlags.MODAL | 
+                            Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, 
+                            Gtk.STOCK_OK, Gtk.ResponseType.OK))
+        dialog.set_default_response(Gtk.ResponseType.OK)
+        grid = Gtk.Grid(row_spacing=6, column_spacing=12)
+        host = Gtk.Entry()
+        host.set_text(backend.host)
+        host.set_activates_default(True)
+        port = Gtk.SpinButton.new_with_range(1, 65535, 1)
+        port.set_value(backend.port)
+        workers = Gtk.SpinButton.new_with_range(1, 64, 1)
+        workers.set_value(backend.workers)
+        workers.set_sensitive(backend.supports_workers)
+        reload = Gtk.CheckButton.new_with_mnemonic("_Reload when code changes")
+        reload.set_active(backend.reload)
+        reload.set_sensitive(backend.supports_reload)
+        for row, (label, widget) in enumerate((("_Host:", host), ("_Port:", port),
+                                               ("_Workers:", workers))):
+            label = Gtk.Label.new_with_mnemonic(label)
+            label.set_mnemonic_widget(widget)
+            label.set_alignment(0.0, 0.5)
+            grid.attach(label, 0, row, 1, 1)
+            grid.attach(widget, 1, row, 1, 1)
+        grid.attach(reload, 0, 3, 2, 1)
+        box = dialog.get_content_area()
+        box.set_border_width(10)
+        box.pack_start(grid, True, True, 0)
+        grid.show_all()
+        response = dialog.run()
+        if response == Gtk.ResponseType.OK:
+            backend.host = host.get_text().strip() or backend.host
+            backend.port = port.get_value_as_int()
+            backend.workers = workers.get_value_as_int()
+            backend.reload = reload.get_active()
+            save_backends(self._server_backends)
+            self._update_server()
+        dialog.destroy()
+    
+    def _update_server(self):
+        """ Apply the server backend to the server panel. """
+        if not self._server:
+            return
+        running = self._server.is_running()
+        self._setup_server_panel()
+        if running:
+            self._server.restart()
+    
+    def on_server_ready(self, server, elapsed, data=None):
+        logger.debug("Development server ready after %.2fs" % elapsed)
+                
     def on_server_stopped(self, server, pid, data=None):
         self._project_actions.get_action("RunServer").set_active(False)
         panel = self.window.get_bottom_panel()
         panel.activate_item(self._server)
     
+    def on_enhanced_shell_activate(self, action, data=None):
+        """ Restart the Python shell in the enhanced or the plain mode. """
+        self._enhanced_shell = action.get_active()
+        self._setup_shell_panel()
+    
+    def on_use_worker_activate(self, action, data=None):
+        """ Start/Stop the warm Django worker used for management commands. """
+        self._use_worker = action.get_active()
+        if not self._use_worker:
+            self._stop_worker()
+        elif self._project and self._project.is_loaded():
+            try:
+                self._get_worker().start()
+            except OSError as e:
+                self.error_dialog("Could not start Django worker: %s" % str(e))
+    
+    def on_parallel_apps_activate(self, action, data=None):
+        self._parallel_apps = action.get_active()
+    
+    def on_use_result_cache_activate(self, action, data=None):
+        self._use_result_cache = action.get_active()
+    
+    def on_refresh_cached_command_activate(self, action, data=None):
+        """ Run the last cached command again bypassing the cache. """
+        if not self._last_cached_command:
+            self.error_dialog("No cached command has been run yet.")
+            return
+        command, callback, apps, run = self._last_cached_command
+        self.run_cached_management_command(command, callback, apps, run, 
+                                           refresh=True)
+    
     def on_view_db_shell_panel_activate(self, action, data=None):
         """ Show/Hide database shell from main menu. """
         if action.get_active():
@@ -423,6 +1245,14 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
         else:
             self._remove_dbshell_panel()
         
+    def on_view_queries_panel_activate(self, action, data=None):
+        """ Show/Hide SQL queries from main menu, restarting the server. """
+        if action.get_active():
+            self._add_queries_panel()
+        else:
+            self._remove_queries_panel()
+        self._update_server()
+        
     def on_view_python_shell_panel_activate(self, action, data=None):
         """ Show/Hide python shell from main menu. """
         if action.get_active():
@@ -439,9 +1269,22 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
         self._update_run_server_action()
         
     def open_project(self, path):
+        """
+        Open the project at path. The panels come up as soon as the path has
+        been validated, the settings are loaded and the Django version is 
+        checked in the background with progress shown in the output panel.
+        
+        The project which was open is kept warm in the project pool, as is the
+        project being opened if it was in the pool.
+        """
         logger.debug("Opening Django project: %s" % path)
+        path = os.path.abspath(path)
         if self._project:
-            self.close_project()
+            self._park_project()
+        if path in self._pool:
+            self._restore_project(self._pool.take(path))
+            self._update_recent_projects_menu()
+            return
         try:
             self._project = DjangoProject(path)
         except IOError as e:
@@ -449,35 +1292,161 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             return
 
         self._output.cwd = self._project.get_path()
+        self._output.env = self._project.get_environ()
         self._setup_server_panel()
         self._setup_shell_panel()
         self._setup_dbshell_panel()
         self._project_actions.set_sensitive(True)
         self._update_run_server_action()
         
+        progress = self._output.get_progress()
+        progress.start("Loading Django project %s..." % os.path.basename(path),
+                       self.on_open_project_cancelled)
+        self._project.load(self.on_project_loaded)
+    
+    def on_open_project_cancelled(self):
+        logger.debug("Opening Django project cancelled.")
+        self.close_project()
+    
+    def on_project_loaded(self, project, error):
+        """ Finish opening a project once its settings have been loaded. """
+        if project is not self._project:
+            return
+        progress = self._output.get_progress()
+        if error:
+            progress.finish()
+            self.close_project()
+            self.error_dialog("Could not open project: %s" % error)
+            return
+        
+        # commands now get DJANGO_SETTINGS_MODULE from the loaded settings
+        self._output.env = project.get_environ()
+        self._setup_server_panel()
+        if self._use_worker:
+            try:
+                self._get_worker().start()
+            except OSError as e:
+                logger.warn("Could not start Django worker: %s" % str(e))
+        
         # print version as it may have changed due to virtualenv
+        progress.set_text("Checking Django version...")
+        def finished(returncode, error):
+            if project is self._project:
+                progress.finish()
         try:
-            #command = "%s --version" % (self._admin_cmd)
-            #self._output.run(command)
-            self.run_admin_command("--version" , path)
+            self.run_admin_command("--version", project.get_path(), finished)
         except:
-            pass
+            progress.finish()
 
+    def _park_project(self):
+        """ 
+        Move the open project and its warm shells and worker into the pool 
+        and reset the panels.
+        """
+        context = ProjectContext(self._project, worker=self._worker)
+        self._project = None
+        self._worker = None
+        if self._keep_shells_warm and self._shell:
+            context.shell = self._shell
+            self._remove_panel(self._shell)
+            self._add_shell_panel()
+        if self._keep_shells_warm and self._dbshell:
+            context.dbshell = self._dbshell
+            self._remove_panel(self._dbshell)
+            self._add_dbshell_panel()
+        logger.debug("Parking Django project: %s" % context.get_path())
+        self._pool.add(context)
+        self.close_project()
+        self._update_recent_projects_menu()
+    
+    def _restore_project(self, context):
+        """ Make a project from the pool the open project again. """
+        logger.debug("Restoring Django project: %s" % context.get_path())
+        self._project = context.project
+        self._output.cwd = self._project.get_path()
+        self._output.env = self._project.get_environ()
+        if self._use_worker:
+            self._worker = context.worker
+        elif context.worker:
+            context.worker.stop()
+        # use the warm shells if their panels are shown, otherwise start them
+        if self._shell and context.shell:
+            self._remove_panel(self._shell)
+            self._add_shell_panel(context.shell)
+        else:
+            self._setup_shell_panel()
+        if self._dbshell and context.dbshell:
+            self._remove_panel(self._dbshell)
+            self._add_dbshell_panel(context.dbshell)
+        else:
+            self._setup_dbshell_panel()
+        for shell in (context.shell, context.dbshell):
+            if shell and shell not in (self._shell, self._dbshell):
+                shell.kill()
+                shell.destroy()
+        self._setup_server_panel()
+        self._project_actions.set_sensitive(True)
+        self._update_run_server_action()
+        self._output.insert("Switched to project: ", 'info')
+        self._output.insert("%s\n\n" % self._project.get_path(), 'bold')
+    
+    def _update_recent_projects_menu(self):
+        """ Rebuild the Switch Project menu from the project pool. """
+        manager = self.window.get_ui_manager()
+        if self._recent_merge_id:
+            manager.remove_ui(self._recent_merge_id)
+            manager.remove_action_group(self._recent_actions)
+        self._recent_actions = Gtk.ActionGroup("DjangoRecentProjects")
+        self._recent_merge_id = manager.new_merge_id()
+        for i, path in enumerate(self._pool.get_paths()):
+            name = "SwitchProject%d" % i
+            action = Gtk.Action(name, os.path.basename(path).replace("_", "__"), 
+                                path, None)
+            action.connect("activate", self.on_switch_project_activate, path)
+            self._recent_actions.add_action(action)
+            manager.add_ui(self._recent_merge_id, 
+                           "/MenuBar/ExtraMenu_1/DjangoMenu/SwitchProject/RecentProjects",
+                           name, name, Gtk.UIManagerItemType.MENUITEM, False)
+        manager.insert_action_group(self._recent_actions, -1)
+        self._global_actions.get_action("SwitchProject").set_sensitive(
+                                                        len(self._pool) > 0)
+        manager.ensure_update()
+    
+    def on_switch_project_activate(self, action, path):
+        self.open_project(path)
+    
     def _setup_dbshell_panel(self):
         if self._dbshell and self._project:
             self._dbshell.cwd = self._project.get_path()
-            self._dbshell.command = "%s dbshell" % self._manage_cmd
+            self._dbshell.env = self._project.get_environ()
+            self._dbshell.command = "%s dbshell" % self._get_manage_cmd()
             self._dbshell.run()
     
     def _setup_server_panel(self):
         if self._server and self._project:
             self._server.cwd = self._project.get_path()
+            env = self._project.get_environ()
+            backend = self._server_backends[self._server_backend]
+            backend.wrapper = None
+            if self._queries:
+                # run the server through the query capture helper
+                backend.wrapper = os.path.join(HELPERS_DIR, 'djp_serve.py')
+                env['DJP_QUERY_LOG'] = self._queries.get_log_filename()
+            self._server.env = env
+            self._server.command = backend.get_command(self._project)
+            self._server.address = backend.get_address()
             self._server.refresh_ui()
         
     def _setup_shell_panel(self):
         if self._shell and self._project:
             self._shell.cwd = self._project.get_path()
-            self._shell.command = "%s shell" % self._manage_cmd
+            self._shell.env = self._project.get_environ()
+            if self._enhanced_shell:
+                self._shell.command = "%s %s" % (
+                    pipes.quote(self._project.get_python()),
+                    pipes.quote(os.path.join(HELPERS_DIR, 'djp_shell.py')))
+            else:
+                self._shell.command = "%s shell" % self._get_manage_cmd()
             self._shell.run()
         
     def _remove_output_panel(self):
@@ -500,6 +1469,48 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             self._server = None
             
     
+    def _remove_tests_panel(self):
+        """ Remove the test results from the bottom panel. """
+        if self._tests:
+            logger.debug("Removing tests panel.")
+            self._remove_panel(self._tests)
+            self._tests = None
+    
+    def _remove_imports_panel(self):
+        """ Remove the start up import times from the bottom panel. """
+        if self._imports:
+            logger.debug("Removing import times panel.")
+            self._remove_panel(self._imports)
+            self._imports = None
+    
+    def _remove_migrations_panel(self):
+        """ Remove the pending migrations analysis from the bottom panel. """
+        if self._migrations:
+            logger.debug("Removing migrations panel.")
+            self._remove_panel(self._migrations)
+            self._migrations = None
+    
+    def _remove_explain_panel(self):
+        """ Remove the query plan from the bottom panel. """
+        if self._plan:
+            logger.debug("Removing query plan panel.")
+            self._remove_panel(self._plan)
+            self._plan = None
+    
+    def _remove_profile_panel(self):
+        """ Remove the profile hotspots from the bottom panel. """
+        if self._profile:
+            logger.debug("Removing profile panel.")
+            self._remove_panel(self._profile)
+            self._profile = None
+    
+    def _remove_queries_panel(self):
+        """ Remove the SQL queries from the bottom panel. """
+        if self._queries:
+            logger.debug("Removing SQL queries panel.")
+            self._remove_panel(self._queries)
+            self._queries = None
+    
     def _remove_shell_panel(self):
         """ Remove python shell from bottom panel. """
         if self._shell:
@@ -514,43 +1525,156 @@ class Plugin(GObject.Object, Gedit.WindowActivatable):
             self._remove_panel(self._dbshell)
             self._dbshell = None
             
+    def _get_manage_cmd(self):
+        """ Return the manage.py command using the project's interpreter. """
+        if self._project:
+            return "%s manage.py" % pipes.quote(self._project.get_python())
+        return self._manage_cmd
+    
+    def _get_worker(self):
+        """ Return the worker for the open project, creating it if needed. """
+        if not self._worker:
+            self._worker = DjangoWorker(self._project.get_python(), 
+                                        self._project.get_path(),
+                                        self._project.get_environ())
+        return self._worker
+    
+    def _stop_worker(self):
+        if self._worker:
+            self._worker.stop()
+            self._worker = None
+    
     def _remove_ui(self):
         """ Remove the 'Django' menu from the the Gedit menubar. """
         manager = self.window.get_ui_manager()
         manager.remove_ui(self._ui_merge_id)
         manager.remove_action_group(self._global_actions)
         manager.remove_action_group(self._project_actions)
+        if self._recent_merge_id:
+            manager.remove_ui(self._recent_merge_id)
+            manager.remove_action_group(self._recent_actions)
+            self._recent_merge_id = 0
         manager.ensure_update()
     
-    def run_admin_command(self, command, path=None):
-        """ Run a django-admin.py command in the output panel. """
-        self.window.get_bottom_panel().activate_item(self._output)
-        full_command = "%s %s" % (self._admin_cmd, command)
-        deb_command =  "%s %s" % (self._admin_cmd[0:-3], command)
-        original_cwd = self._output.cwd
-        self._output.cwd = path
-        try:
-            self._output.run(full_command)
-        except OSError:
-            try: 
-                # try without ".py" for debian/ubuntu system installs
-                print(deb_command)
-                self._output.run(deb_command)
-            except:
+    def run_admin_command(self, command, path=None, callback=None):
+        """ 
+        Run a django-admin.py command in the output panel. The command runs
+        asynchronously, callback(returncode, error) is called when it exits.
+        """
+        # look in the project's virtual environment first
+        search_path = None
+        if self._output.env:
+            search_path = self._output.env.get('PATH')
+        admin_cmd = find_executable(self._admin_cmd, search_path)
+        if not admin_cmd:
+            # try without ".py" for debian/ubuntu system installs
+            admin_cmd = find_executable(self._admin_cmd[0:-3], search_path)
+            if not admin_cmd:
                 raise Exception("Could not execute django-admin.py command.\nIs Django installed?")
-        finally:
-            self._output.cwd = original_cwd
+        self.window.get_bottom_panel().activate_item(self._output)
+        full_command = "%s %s" % (pipes.quote(admin_cmd), command)
+        self._output.run(full_command, path, callback)
             
-    def run_management_command(self, command):
-        """ Run a manage.py command in the output panel. """
+    def run_management_command(self, command, callback=None):
+        """ 
+        Run a manage.py command in the output panel. The command runs
+        asynchronously, callback(returncode, error) is called when it exits.
+        """
+        self.window.get_bottom_panel().activate_item(self._output)
+        full_command = "%s %s" % (self._get_manage_cmd(), command)
+        if self._use_worker and self._project and self._project.is_loaded():
+            process = self._get_worker().command(shlex.split(command))
+            self._output.run_process(process, "%s (worker)" % full_command, 
+                                     callback)
+        else:
+            self._output.run(full_command, callback=callback)
+    
+    def run_cached_management_command(self, command, callback=None, apps=None,
+                                      run=None, refresh=False):
+        """ 
+        Run a read-only manage.py command like run_management_command() but 
+        show its cached output instead if it was run before with the same 
+        interpreter, settings and models of apps (all apps when None). 
+        run(callback) runs the command when it is not cached and refresh 
+        runs it regardless, replacing the cached output.
+        """
+        if run is None:
+            run = lambda callback: self.run_management_command(command, callback)
+        self._last_cached_command = (command, callback, apps, run)
+        if not self._use_result_cache or not self._project.is_loaded():
+            run(callback)
+            return
+        files = self._project.get_watch_files(apps)
+        databases = []
+        if command.split()[0] == 'inspectdb':
+            databases = self._project.get_database_files()
+        key = self._result_cache.key(command, self._project.get_python(), files,
+                                     databases)
+        entry = None if refresh else self._result_cache.get(key)
+        if entry:
+            self.window.get_bottom_panel().activate_item(self._output)
+            title = "%s %s (cached)" % (self._get_manage_cmd(), command)
+            self._output.run_process(CachedResult(entry), title, callback)
+            return
+        def finished(returncode, error):
+            if returncode == 0 and not self._output.get_last_output_filename():
+                self._result_cache.set(key, command, 
+                                       self._output.get_last_output() or "")
+            if callback:
+                callback(returncode, error)
+        run(finished)
+    
+    def run_management_command_per_app(self, command, apps, callback=None):
+        """ 
+        Run a manage.py command once for each app in parallel in the output 
+        panel, with the output of each app in its own section in app order.
+        """
+        self.window.get_bottom_panel().activate_item(self._output)
+        jobs = []
+        for app in apps:
+            full_command = "%s %s %s" % (self._get_manage_cmd(), command, app)
+            process = Process(shlex.split(full_command), self._output.cwd, 
+                              self._output.env)
+            jobs.append((app, process))
+        group = ProcessGroup(jobs, self._max_parallel_jobs)
+        title = "%s %s %s (%d at a time)" % (self._get_manage_cmd(), command, 
+                                             " ".join(apps), group.max_jobs)
+        self._output.run_process(group, title, callback)
+    
+    def run_helper(self, helper, args, title, callback=None, 
+                   result_callback=None):
+        """ 
+        Run a helper script with the project's interpreter in the output 
+        panel, showing the progress it reports with a Cancel button. 
+        callback(returncode, error) is called when it exits and 
+        result_callback(process, data) with the result it sends, if any.
+        Returns the HelperProcess, to connect to its "event" signal.
+        """
         self.window.get_bottom_panel().activate_item(self._output)
-        full_command = "%s %s" % (self._manage_cmd, command)
-        self._output.run(full_command)
+        process = HelperProcess(self._project.get_python(), helper, args,
+                                self._output.cwd, self._output.env)
+        progress = self._output.get_progress()
+        def on_progress(process, fraction, text):
+            if not progress.is_active():
+                progress.start(title, process.kill)
+            progress.set_text(text)
+            progress.set_fraction(fraction)
+        def finished(returncode, error):
+            progress.finish()
+            if callback:
+                callback(returncode, error)
+        process.connect("progress", on_progress)
+        if result_callback:
+            process.connect("result", result_callback)
+        self._output.run_process(process, title, finished)
+        return process
     
     def _update_run_server_action(self):
         if not self._server or not self._project:
             self._project_actions.get_action("RunServer").set_sensitive(False)
+            self._project_actions.get_action("RestartServer").set_sensitive(False)
         else:
             self._project_actions.get_action("RunServer").set_sensitive(True)
+            self._project_actions.get_action("RestartServer").set_sensitive(True)
   
         
@@ -0,0 +1,87 @@
+import logging
+from collections import OrderedDict
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+class ProjectContext(object):
+    """
+    A loaded DjangoProject together with the things which are slow to set up
+    again for it: its Python shell, database shell and worker. The shells are
+    suspended while the context is parked in a ProjectPool.
+    """
+    def __init__(self, project, shell=None, dbshell=None, worker=None):
+        self.project = project
+        self.shell = shell
+        self.dbshell = dbshell
+        self.worker = worker
+
+    def get_path(self):
+        return self.project.get_path()
+
+    def suspend(self):
+        for shell in (self.shell, self.dbshell):
+            if shell:
+                shell.suspend()
+
+    def resume(self):
+        for shell in (self.shell, self.dbshell):
+            if shell:
+                shell.resume()
+
+    def destroy(self):
+        """ Kill the shells, stop the worker and close the project. """
+        for shell in (self.shell, self.dbshell):
+            if shell:
+                shell.kill()
+                shell.destroy()
+        if self.worker:
+            self.worker.stop()
+        self.project.close_project()
+        self.shell = self.dbshell = self.worker = None
+
+
+class ProjectPool(object):
+    """
+    The most recently used projects kept warm in the background, so switching
+    back to one of them does not have to load it again. The least recently
+    used context is destroyed when more than max_size are parked.
+    """
+    def __init__(self, max_size=4):
+        self.max_size = max_size
+        self._contexts = OrderedDict()
+
+    def __contains__(self, path):
+        return path in self._contexts
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def add(self, context):
+        """ Suspend and park context, evicting the least recently used. """
+        path = context.get_path()
+        if path in self._contexts:
+            self._contexts.pop(path).destroy()
+        context.suspend()
+        self._contexts[path] = context
+        while len(self._contexts) > max(0, self.max_size):
+            path, evicted = self._contexts.popitem(last=False)
+            logger.debug("Evicting warm project: %s" % path)
+            evicted.destroy()
+
+    def take(self, path):
+        """ Remove and resume the context for path, or return None. """
+        context = self._contexts.pop(path, None)
+        if context:
+            context.resume()
+        return context
+
+    def get_paths(self):
+        """ Return the paths of the parked projects, most recent first. """
+        return list(reversed(self._contexts.keys()))
+
+    def clear(self):
+        while self._contexts:
+            self._contexts.popitem()[1].destroy()
@@ -0,0 +1,321 @@
+import os
+import json
+import time
+import signal
+import codecs
+import multiprocessing
+import subprocess
+import logging
+from gi.repository import GObject, GLib
+
+logging.basicConfig()
+LOG_LEVEL = logging.ERROR
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+READ_SIZE = 65536
+POLL_INTERVAL = 50 # ms
+HELPERS_DIR = os.path.join(os.path.dirname(__file__), 'helpers')
+
+class Process(GObject.Object):
+    """
+    A child process whose stdout and stderr are read as they arrive using GLib
+    IO watches, so the Gtk main loop keeps running while the process does.
+
+    Connect to the "output" signal to receive decoded chunks of text along with
+    the name of the stream ('stdout' or 'stderr') they were read from, and to
+    the "exited" signal to receive the return code once both pipes are closed
+    and the child has been reaped. If stdin is True, data can be sent to the 
+    process with write().
+    """
+    __gtype_name__ = "DjangoProjectProcess"
+    __gsignals__ = {
+        "output":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+        "exited":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, args, cwd=None, env=None, stdin=False):
+        GObject.Object.__init__(self)
+        self.args = args
+        self.cwd = cwd
+        self.env = env
+        self.stdin = stdin
+        self.returncode = None
+        self._popen = None
+        self._watches = {}
+        self._decoders = {}
+
+    def get_pid(self):
+        if self._popen:
+            return self._popen.pid
+
+    def is_running(self):
+        return self._popen is not None and self.returncode is None
+
+    def kill(self, sig=signal.SIGTERM):
+        """ Send a signal to the process if it is still running. """
+        if self.is_running():
+            try:
+                os.kill(self._popen.pid, sig)
+            except OSError:
+                pass
+
+    def start(self):
+        """
+        Start the process or raise OSError if the command cannot be executed.
+        """
+        logger.debug("Starting %s in %s" % (self.args, self.cwd))
+        self._popen = subprocess.Popen(self.args, 0,
+                                       shell=False,
+                                       stdin=subprocess.PIPE if self.stdin else None,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       cwd=self.cwd,
+                                       env=self.env,
+                                       close_fds=True)
+        for name, pipe in (('stdout', self._popen.stdout),
+                           ('stderr', self._popen.stderr)):
+            fd = pipe.fileno()
+            self._decoders[fd] = codecs.getincrementaldecoder('utf-8')('replace')
+            self._watches[fd] = GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT,
+                                                  GLib.IO_IN | GLib.IO_HUP |
+                                                  GLib.IO_ERR,
+                                                  self._on_readable, name)
+
+    def write(self, data):
+        """ Write data to the stdin of the process. """
+        if not self.is_running() or not self._popen.stdin:
+            raise IOError("Process is not accepting input")
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._popen.stdin.write(data)
+        self._popen.stdin.flush()
+    
+    def _on_readable(self, fd, condition, name):
+        data = b''
+        if condition & GLib.IO_IN:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except OSError:
+                data = b''
+        if data:
+            text = self._decoders[fd].decode(data)
+            if text:
+                self._output(text, name)
+            return True
+
+        # EOF: flush whatever the decoder still holds and stop watching
+        text = self._decoders.pop(fd).decode(b'', True)
+        if text:
+            self._output(text, name)
+        self._close_stream(name)
+        del self._watches[fd]
+        if not self._watches:
+            if self._popen.stdin:
+                self._popen.stdin.close()
+            self._popen.stdout.close()
+            self._popen.stderr.close()
+            GLib.timeout_add(POLL_INTERVAL, self._on_poll)
+        return False
+
+    def _output(self, text, stream):
+        self.emit("output", text, stream)
+    
+    def _close_stream(self, stream):
+        """ Called when a stream reaches EOF, after its last output. """
+        pass
+
+    def _on_poll(self):
+        """ Wait for the child to exit once its pipes have been closed. """
+        if self._popen.poll() is None:
+            return True
+        self.returncode = self._popen.returncode
+        logger.debug("Process %s exited: %s" % (self._popen.pid, self.returncode))
+        self.emit("exited", self.returncode)
+        return False
+
+
+class HelperProcess(Process):
+    """
+    A Process running one of the plugin's helper scripts with a project's
+    Python interpreter. Lines of JSON the helper writes to stdout are events:
+
+        {"event": "progress", "fraction": 0.5, "text": "Loading..."}
+        {"event": "message", "text": "Done.\n", "tag": "info"}
+        {"event": "result", "data": {...}}
+
+    which are emitted as the "progress" (fraction or None, text), "output"
+    (text, tag) and "result" (data) signals. Events of other names are
+    emitted as the "event" (name, data) signal. Any other output is passed
+    on as usual.
+    """
+    __gtype_name__ = "DjangoProjectHelperProcess"
+    __gsignals__ = {
+        "progress":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+        "result":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+        "event":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, python, helper, args=(), cwd=None, env=None):
+        Process.__init__(self, [python, os.path.join(HELPERS_DIR, helper)] + 
+                         list(args), cwd, env)
+        self._buffer = ""
+
+    def _output(self, text, stream):
+        if stream != 'stdout':
+            Process._output(self, text, stream)
+            return
+        lines = (self._buffer + text).split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self._handle_line(line)
+
+    def _close_stream(self, stream):
+        if stream == 'stdout' and self._buffer:
+            line, self._buffer = self._buffer, ""
+            self._handle_line(line)
+
+    def _handle_line(self, line):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict) or "event" not in event:
+            Process._output(self, line + "\n", 'stdout')
+        elif event["event"] == "progress":
+            self.emit("progress", event.get("fraction"), event.get("text", ""))
+        elif event["event"] == "message":
+            Process._output(self, event.get("text", ""), event.get("tag", 'info'))
+        elif event["event"] == "result":
+            self.emit("result", event.get("data"))
+        else:
+            self.emit("event", event["event"], event.get("data"))
+
+
+class ProcessGroup(GObject.Object):
+    """
+    Runs a list of (label, Process) jobs at most max_jobs at a time, by 
+    default one per CPU. Output is collected per job and reported in list 
+    order, each job in its own section headed by its label and run time, as
+    soon as it and all the jobs before it have finished.
+
+    It has the same "output" and "exited" signals and start() method as a
+    Process, so it can be run in an OutputBox. Section headers and timings
+    are emitted as output of the 'info' stream. The return code is that of
+    the first job which failed, or 0.
+    """
+    __gtype_name__ = "DjangoProjectProcessGroup"
+    __gsignals__ = {
+        "output":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+        "exited":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, jobs, max_jobs=None):
+        GObject.Object.__init__(self)
+        if not max_jobs:
+            try:
+                max_jobs = multiprocessing.cpu_count()
+            except NotImplementedError:
+                max_jobs = 2
+        self.max_jobs = max_jobs
+        self.returncode = None
+        self._jobs = [GroupJob(label, process) for label, process in jobs]
+        self._pending = list(range(len(self._jobs)))
+        self._running = 0
+        self._reported = 0
+        self._started = None
+
+    def kill(self, sig=signal.SIGTERM):
+        """ 
+        Stop starting new jobs and send sig to the running ones. The jobs
+        which were never started are reported as not run, so the group still
+        exits once the running jobs have.
+        """
+        pending, self._pending = self._pending, []
+        for job in self._jobs:
+            job.process.kill(sig)
+        now = time.time()
+        for index in pending:
+            job = self._jobs[index]
+            job.started = job.finished = now
+            job.output.append(("Not run, the jobs were stopped.\n", 'stderr'))
+        if pending and self._started is not None:
+            self._report()
+
+    def start(self):
+        self._started = time.time()
+        self._start_jobs()
+        if not self._jobs:
+            self._report()
+
+    def _start_jobs(self):
+        while self._pending and self._running < self.max_jobs:
+            index = self._pending.pop(0)
+            job = self._jobs[index]
+            job.process.connect("output", self.on_job_output, job)
+            job.process.connect("exited", self.on_job_exited, job)
+            job.started = time.time()
+            self._running += 1
+            try:
+                job.process.start()
+            except OSError as e:
+                job.output.append(("%s\n" % e, 'stderr'))
+                self.on_job_exited(job.process, None, job)
+
+    def on_job_output(self, process, text, stream, job):
+        job.output.append((text, stream))
+
+    def on_job_exited(self, process, returncode, job):
+        job.returncode = returncode
+        job.finished = time.time()
+        self._running -= 1
+        self._start_jobs()
+        self._report()
+
+    def _report(self):
+        """ Emit the output of finished jobs not preceded by running ones. """
+        while (self._reported < len(self._jobs) and 
+               self._jobs[self._reported].finished is not None):
+            job = self._jobs[self._reported]
+            self._reported += 1
+            self.emit("output", "--- %s (%.2fs, exit %s) ---\n" % (job.label, 
+                      job.finished - job.started, job.returncode), 'info')
+            for text, stream in job.output:
+                self.emit("output", text, stream)
+            job.output = []
+            if job.returncode != 0 and self.returncode is None:
+                self.returncode = job.returncode if job.returncode else 1
+        if self._reported == len(self._jobs):
+            elapsed = time.time() - self._started
+            serial = sum([job.finished - job.started for job in self._jobs])
+            self.emit("output", "\n%d jobs finished in %.2fs "
+                      "(%.2fs of run time, %d at a time)\n" % (len(self._jobs),
+                      elapsed, serial, self.max_jobs), 'info')
+            if self.returncode is None:
+                self.returncode = 0
+            self.emit("exited", self.returncode)
+
+
+class GroupJob(object):
+    """ A process run by a ProcessGroup and the output collected from it. """
+    def __init__(self, label, process):
+        self.label = label
+        self.process = process
+        self.output = []
+        self.returncode = None
+        self.started = None
+        self.finished = None
@@ -0,0 +1,114 @@
+import os
+from gi.repository import GObject, Gtk
+
+(COL_FUNCTION, COL_LOCATION, COL_CALLS, COL_OWN, COL_CUMULATIVE, COL_FILE,
+ COL_LINE) = range(7)
+
+class ProfileView(Gtk.VBox):
+    """
+    A table of the functions in a profile by own and cumulative time, which
+    can be sorted by clicking the column headers and filtered by function or
+    file name.
+
+    Connect to the "open-location" signal to be notified with the filename and
+    line number of a function which was double-clicked.
+    """
+    __gtype_name__ = "DjangoProjectProfileView"
+    __gsignals__ = {
+        "open-location":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self.cwd = None # relative file names are relative to this
+        self._total = 0.0
+        self._model = Gtk.ListStore(str, str, GObject.TYPE_INT64, float, float,
+                                    str, int)
+        self._filter = self._model.filter_new()
+        self._filter.set_visible_func(self._is_visible, None)
+        self._sorted = Gtk.TreeModelSort(model=self._filter)
+        self._sorted.set_sort_column_id(COL_CUMULATIVE, Gtk.SortType.DESCENDING)
+
+        hbox = Gtk.HBox(homogeneous=False, spacing=6)
+        hbox.set_border_width(3)
+        self._entry = Gtk.Entry()
+        self._entry.set_placeholder_text("Filter functions and files")
+        self._entry.connect("changed", self.on_filter_changed)
+        hbox.pack_start(self._entry, False, False, 0)
+        self._label = Gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        self._label.set_selectable(True)
+        hbox.pack_start(self._label, True, True, 0)
+        self.pack_start(hbox, False, False, 0)
+
+        self._view = Gtk.TreeView.new_with_model(self._sorted)
+        self._view.set_rules_hint(True)
+        self._view.connect("row-activated", self.on_row_activated)
+        self._calls_column = None
+        for title, index in (("Function", COL_FUNCTION),
+                             ("Location", COL_LOCATION), ("Calls", COL_CALLS),
+                             ("Own (s)", COL_OWN),
+                             ("Cumulative (s)", COL_CUMULATIVE)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index)
+            if index in (COL_OWN, COL_CUMULATIVE):
+                cell.set_alignment(1.0, 0.5)
+                column.set_cell_data_func(cell, self._format_time, index)
+            elif index == COL_CALLS:
+                cell.set_alignment(1.0, 0.5)
+                self._calls_column = column
+            column.set_sort_column_id(index)
+            column.set_resizable(True)
+            self._view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(self._view)
+        self.pack_start(scrolled, True, True, 0)
+        self.show_all()
+
+    def load(self, profile):
+        """ Show a profile as sent by the djp_profile.py helper. """
+        self._total = profile.get('total') or 0.0
+        sampled = profile.get('profiler') == 'py-spy'
+        self._calls_column.set_title("Samples" if sampled else "Calls")
+        self._label.set_text("%s, %.3fs total, saved to %s" % (
+                             profile.get('profiler'), self._total,
+                             profile.get('filename')))
+        self._view.set_model(None)
+        self._model.clear()
+        for f in profile.get('functions', []):
+            filename = f['file']
+            location = "%s:%d" % (filename, f['line']) if f['line'] else filename
+            self._model.append((f['function'], location, f['calls'], f['own'],
+                                f['cumulative'], filename, f['line']))
+        self._view.set_model(self._sorted)
+
+    def _format_time(self, column, cell, model, it, index):
+        seconds = model.get_value(it, index)
+        if self._total:
+            cell.set_property("text", "%.4f  %5.1f%%" % (seconds,
+                              100.0 * seconds / self._total))
+        else:
+            cell.set_property("text", "%.4f" % seconds)
+
+    def _is_visible(self, model, it, data=None):
+        text = self._entry.get_text().lower()
+        if not text:
+            return True
+        return (text in (model.get_value(it, COL_FUNCTION) or "").lower() or
+                text in (model.get_value(it, COL_LOCATION) or "").lower())
+
+    def on_filter_changed(self, entry, data=None):
+        self._filter.refilter()
+
+    def on_row_activated(self, view, path, column, data=None):
+        model = view.get_model()
+        filename = model[path][COL_FILE]
+        line = model[path][COL_LINE]
+        if self.cwd and not os.path.isabs(filename):
+            filename = os.path.join(self.cwd, filename)
+        if os.path.isfile(filename):
+            self.emit("open-location", filename, line)
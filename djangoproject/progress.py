@@ -0,0 +1,89 @@
+import logging
+from gi.repository import Gtk, GLib
+
+logging.basicConfig()
+LOG_LEVEL = logging.ERROR
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+PULSE_INTERVAL = 100 # ms
+
+class ProgressBar(Gtk.InfoBar):
+    """
+    An info bar showing the progress of a background task with a message, a
+    progress bar and a Cancel button. It is hidden until start() is called
+    and shows one task at a time, starting another task replaces the first.
+    """
+    __gtype_name__ = "DjangoProjectProgressBar"
+
+    def __init__(self):
+        Gtk.InfoBar.__init__(self)
+        self.set_message_type(Gtk.MessageType.INFO)
+        self._label = Gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        self._bar = Gtk.ProgressBar()
+        self._bar.set_size_request(150, -1)
+        box = self.get_content_area()
+        box.pack_start(self._label, True, True, 0)
+        box.pack_start(self._bar, False, False, 0)
+        self._cancel = self.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        self.connect("response", self.on_response)
+        self.connect("destroy", self.on_destroy)
+        self._pulse_id = 0
+        self._cancel_callback = None
+        box.show_all()
+
+    def is_active(self):
+        return self.get_visible()
+
+    def start(self, text, cancel_callback=None):
+        """
+        Show the bar with text, pulsing until set_fraction() is called. The
+        Cancel button calls cancel_callback() or is insensitive if it is None.
+        """
+        self._label.set_text(text)
+        self._cancel_callback = cancel_callback
+        self._cancel.set_sensitive(cancel_callback is not None)
+        self.set_fraction(None)
+        self.show()
+
+    def set_text(self, text):
+        self._label.set_text(text)
+
+    def set_fraction(self, fraction, text=None):
+        """ Set the progress from 0.0 to 1.0 or None when it is unknown. """
+        if fraction is None:
+            if not self._pulse_id:
+                self._pulse_id = GLib.timeout_add(PULSE_INTERVAL, self.on_pulse)
+            self._bar.set_show_text(False)
+            return
+        self._stop_pulse()
+        self._bar.set_fraction(max(0.0, min(1.0, fraction)))
+        if text is not None:
+            self._bar.set_text(text)
+            self._bar.set_show_text(True)
+
+    def finish(self):
+        """ Hide the bar. """
+        self._cancel_callback = None
+        self._stop_pulse()
+        self.hide()
+
+    def _stop_pulse(self):
+        if self._pulse_id:
+            GLib.source_remove(self._pulse_id)
+            self._pulse_id = 0
+
+    def on_pulse(self):
+        self._bar.pulse()
+        return True
+
+    def on_destroy(self, widget, data=None):
+        self._stop_pulse()
+
+    def on_response(self, infobar, response_id):
+        if response_id == Gtk.ResponseType.CANCEL:
+            callback = self._cancel_callback
+            self.finish()
+            if callback:
+                callback()
@@ -1,7 +1,10 @@
 import os
-import imp
-import sys
+import json
 import logging
+from gi.repository import GLib
+from cache import cache_path, project_key, load_json, save_json
+from process import Process, HELPERS_DIR
+import interpreter
 
 logging.basicConfig()
 LOG_LEVEL = logging.DEBUG
@@ -9,39 +12,26 @@ logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
 class DjangoProject(object):
-    
-    def __init__(self, path):
+    """
+    A Django project on disk. Creating a project only validates its path and
+    finds its Python interpreter, call load() to load the project description.
+    The project is introspected by a helper process running in the project's 
+    own Python interpreter, nothing from the project is imported into Gedit. 
+    The result is cached on disk for as long as the settings file does not 
+    change.
+    """
+    def __init__(self, path, python=None):
+        self._python = python
+        self._info = {}
+        self._process = None
+        self._callback = None
         self.set_path(path)
         
     def close_project(self):
-        sys.path.remove(self._path)
-        try:
-            del os.environ['DJANGO_SETTINGS_MODULE']
-        except:
-            pass
-
-    def activate_virtualenv(self, path):
-        """
-        Activates the virtualenv if necessary. Traverses the projects path up
-        to the file system root and checks if 'bin/activate_this.py' exists
-        in the directories. If this file is found, it gets loaded.
-        """
-        parent_path = os.path.dirname(path)
-        
-        if parent_path == path:
-            logger.debug("Virtual environment not found.")
-            return
+        logger.debug("Closed Django project: %s" % self._path)
+        self.cancel()
+        self._info = {}
 
-        for dirname in os.listdir(path):
-            venv = os.path.join(path, dirname)
-            activate_this = os.path.join(venv, 'bin', 'activate_this.py')
-            if os.path.isfile(activate_this):
-                imp.load_source('activate_this', activate_this)
-                logger.debug("Activated virtual environment: %s" % venv)
-                return
-                
-        self.activate_virtualenv(parent_path)
-        
     def get_path(self):
         """
         Return the path to the django project (where settings.py and manage.py 
@@ -57,8 +47,6 @@ class DjangoProject(object):
         or raise IOError if the path does not exist or if settings.py or manage.py
         cannot be found in the path.
         """
-        self.activate_virtualenv(path)
-        
         if not os.path.exists(path):
             raise IOError("Django project directory does not exist: %s" % path)
         
@@ -67,63 +55,151 @@ class DjangoProject(object):
         if not os.path.isfile(manage):
             raise IOError("Django manage file does not exist: %s" % manage)
         
-        orig_cwd = os.getcwd()
-        os.chdir(path)
-        sys.path.append(path)
-        
-        # Load the manage module, so the DJANGO_SETTINGS_MODULE environment
-        # variable gets set. Loading may fail, but setting DJANGO_SETTINGS_MODULE
-        # hopefully don't.
-        try:
-            orig_sys_argv = sys.argv
-            sys.argv = ['manage.py', '--version']
-
-            imp.load_source('__main__', manage)
-            logger.debug("Loaded manage module: %s" % manage)
-
-            sys.argv = orig_sys_argv
-        except:
-            raise IOError("Django manage module could not get loaded")
-        
-        # set DJANGO_SETTINGS_MODULE environment variable to 'settings' if it
-        # was not already set by the user or manage.py.
-        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
-
-        # Now we try to load the settings module and get the file path.
-        try:
-            __import__(os.environ['DJANGO_SETTINGS_MODULE'], globals(), locals(), [], -1)
-            mod_settings = sys.modules[os.environ['DJANGO_SETTINGS_MODULE']]
-            settings = mod_settings.__file__
-            logger.debug("Loaded settings module: %s" % settings)
-        except:
-            raise IOError("Django settings could not get loaded")
-
         self._path = path
-        self._settings = settings
-        self._mod_settings = mod_settings
         self._manage = manage
-
-        os.chdir(orig_cwd)
-        
+        if not self._python:
+            self._python = interpreter.find_interpreter(path)
+        self._info = {}
+    
+    def cancel(self):
+        """ Stop loading the project. The load() callback is not called. """
+        self._callback = None
+        if self._process:
+            self._process.kill()
+            self._process = None
+    
+    def is_loaded(self):
+        return bool(self._info)
+    
+    def load(self, callback):
         """
-        # find settings.py in Django >= 1.4
-        settings = os.path.join(path, os.path.basename(path), 'settings.py')
-        if not os.path.isfile(settings):
-            # find settings.py in Django < 1.4
-            settings = os.path.join(path, 'settings.py')
-            if not os.path.isfile(settings):
-                raise IOError("Django settings file does not exist: %s" % settings)
-        
-        self._path = path
-        self._settings = settings
-        self._manage = manage
+        Load the project description in the background. It is read from the
+        cache if the settings file has not changed since it was written, 
+        otherwise the project is introspected. callback(project, error) is
+        called from the main loop when done, error is None on success.
+        """
+        self._callback = callback
+        info = self._load_cached_info()
+        if info:
+            GLib.idle_add(self._finish_load, info, None)
+            return
+        args = [self._python, os.path.join(HELPERS_DIR, 'djp_introspect.py'),
+                self._manage]
+        self._stdout = []
+        self._stderr = []
+        self._process = Process(args, self._path, 
+                                interpreter.get_environ(self._python))
+        self._process.connect("output", self.on_process_output)
+        self._process.connect("exited", self.on_process_exited)
+        try:
+            self._process.start()
+        except OSError as e:
+            self._process = None
+            GLib.idle_add(self._finish_load, None, 
+                          "Could not run %s: %s" % (self._python, e))
+    
+    def _cache_file(self):
+        return cache_path('projects', project_key(self._path) + '.json')
+    
+    def _load_cached_info(self):
+        """
+        Return the project description from the cache if the settings file has
+        not changed since it was written, otherwise None.
         """
+        cached = load_json(self._cache_file(), {})
+        info = cached.get('info', {})
+        try:
+            mtime = os.stat(info.get('settings_file', '')).st_mtime
+        except OSError:
+            return None
+        if cached.get('mtime') == mtime and cached.get('python') == self._python:
+            logger.debug("Using cached project info: %s" % self._cache_file())
+            return info
+    
+    def on_process_output(self, process, text, stream):
+        if stream == 'stdout':
+            self._stdout.append(text)
+        else:
+            self._stderr.append(text)
+    
+    def on_process_exited(self, process, returncode):
+        if process is not self._process:
+            return
+        self._process = None
+        if returncode != 0:
+            logger.error("".join(self._stderr))
+            self._finish_load(None, "Django settings could not get loaded")
+            return
+        try:
+            info = json.loads("".join(self._stdout).strip().splitlines()[-1])
+            mtime = os.stat(info['settings_file']).st_mtime
+        except (ValueError, IndexError, KeyError, OSError):
+            self._finish_load(None, "Django project could not be introspected")
+            return
+        if info.get('setup_error'):
+            logger.warn("Django setup failed: %s" % info['setup_error'])
+        save_json(self._cache_file(), {'python': self._python, 'mtime': mtime,
+                                       'info': info})
+        self._finish_load(info, None)
+    
+    def _finish_load(self, info, error):
+        if info:
+            self._info = info
+            logger.debug("Loaded settings module: %s" % info['settings_file'])
+        callback = self._callback
+        self._callback = None
+        if callback:
+            callback(self, error)
+        return False
+    
+    def get_environ(self):
+        """ Return the environment for commands run in the project. """
+        env = interpreter.get_environ(self._python)
+        if self.is_loaded():
+            env['DJANGO_SETTINGS_MODULE'] = self.get_settings_module_name()
+        return env
+    
+    def get_info(self, key, default=None):
+        """ Return a value from the project description. """
+        return self._info.get(key, default)
+    
+    def get_installed_apps(self):
+        return self._info.get('installed_apps', [])
+    
+    def get_watch_files(self, apps=None):
+        """ 
+        Return the settings file and the models files of the named apps, or 
+        of all apps if apps is None. Apps are matched by name or label. All
+        the files are returned when the apps aren't known, as before 1.7.
+        """
+        watch = self._info.get('watch', [])
+        if apps is None or not self._info.get('apps'):
+            return list(watch)
+        paths = [app['path'] for app in self._info.get('apps', []) 
+                 if app['name'] in apps or app['label'] in apps]
+        files = [self._info.get('settings_file')]
+        for filename in watch:
+            for path in paths:
+                if filename == path or filename.startswith(path + os.sep):
+                    files.append(filename)
+        return [f for f in files if f]
+    
+    def get_database_files(self):
+        """ Return the database files of the SQLite databases. """
+        files = []
+        for database in self._info.get('databases', {}).values():
+            if 'sqlite' in database.get('engine', '') and database.get('name'):
+                files.append(os.path.join(self._path, database['name']))
+        return files
+    
+    def get_python(self):
+        return self._python
     
-    def get_settings_module(self):
-        return self._mod_settings
+    def get_settings_module_name(self):
+        return self._info['settings_module']
         
     def get_settings_filename(self):
-        return self._settings
+        return self._info['settings_file']
     
     def get_manage_filename(self):
         return self._manage
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import logging
+import tempfile
+from collections import OrderedDict
+from gi.repository import GObject, Gtk, GLib, Pango
+
+logging.basicConfig()
+LOG_LEVEL = logging.ERROR
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+POLL_INTERVAL = 250 # ms
+SQL_DISPLAY_LENGTH = 300
+N_PLUS_ONE_COLOR = '#C00000'
+
+(COL_TEXT, COL_COUNT, COL_TIME, COL_FLAG, COL_LOCATION, COL_FILE, COL_LINE,
+ COL_WEIGHT, COL_FOREGROUND) = range(9)
+
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_re = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_space_re = re.compile(r"\s+")
+
+def fingerprint(sql):
+    """
+    Return sql with literals and IN lists replaced by placeholders, so that
+    the same statement run with different parameters compares equal.
+    """
+    sql = _space_re.sub(" ", sql.strip())
+    sql = _literal_re.sub("?", sql)
+    return _in_re.sub("IN (...)", sql)
+
+
+class QueryPanel(Gtk.VBox):
+    """
+    The SQL queries run by each request to the development server, read from
+    the log file written by the djp_serve.py helper, see get_log_filename().
+
+    The queries of a request are grouped by statement and calling code, and a
+    group of at least n_plus_one_threshold queries is flagged as a possible
+    N+1 query. Connect to the "open-location" signal to be notified with the
+    filename and line number of the code which ran the double-clicked query.
+    """
+    __gtype_name__ = "DjangoProjectQueryPanel"
+    __gsignals__ = {
+        "open-location":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        # configurable options
+        self.max_requests = 200
+        self.n_plus_one_threshold = 3
+        self._log = tempfile.NamedTemporaryFile(prefix="django-queries-",
+                                                suffix=".jsonl", delete=False)
+        self._log.close()
+        self._offset = 0
+        self._partial = b""
+        self._requests = self._queries = self._candidates = 0
+        self._model = Gtk.TreeStore(str, int, float, str, str, str, int, int,
+                                    str)
+
+        hbox = Gtk.HBox(homogeneous=False, spacing=6)
+        hbox.set_border_width(3)
+        button = Gtk.Button.new_from_stock(Gtk.STOCK_CLEAR)
+        button.connect("clicked", self.on_clear_clicked)
+        hbox.pack_start(button, False, False, 0)
+        self._summary = Gtk.Label()
+        self._summary.set_alignment(0.0, 0.5)
+        hbox.pack_start(self._summary, True, True, 0)
+        self.pack_start(hbox, False, False, 0)
+
+        view = Gtk.TreeView.new_with_model(self._model)
+        view.set_rules_hint(True)
+        view.connect("row-activated", self.on_row_activated)
+        for title, index in (("Request / Query", COL_TEXT),
+                             ("Count", COL_COUNT), ("Time (ms)", COL_TIME),
+                             ("", COL_FLAG), ("Called From", COL_LOCATION)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index,
+                                        weight=COL_WEIGHT,
+                                        foreground=COL_FOREGROUND)
+            if index == COL_TEXT:
+                cell.set_property("ellipsize", Pango.EllipsizeMode.END)
+                column.set_expand(True)
+            elif index == COL_TIME:
+                column.set_cell_data_func(cell, self._format_time, index)
+            column.set_resizable(True)
+            view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(view)
+        self.pack_start(scrolled, True, True, 0)
+        self._update_summary()
+        self._poll_id = GLib.timeout_add(POLL_INTERVAL, self.on_poll)
+        self.connect("destroy", self.on_destroy)
+        self.show_all()
+
+    def get_log_filename(self):
+        """ Return the file to pass to djp_serve.py as $DJP_QUERY_LOG. """
+        return self._log.name
+
+    def add_request(self, record):
+        """ Add the queries of a request as logged by djp_serve.py. """
+        groups = OrderedDict()
+        for query in record.get('queries', []):
+            where = tuple(query.get('where') or ('', 0, ''))
+            key = (fingerprint(query['sql']), where)
+            groups.setdefault(key, []).append(query)
+        queries = record.get('queries', [])
+        candidates = [key for key, group in groups.items()
+                      if len(group) >= self.n_plus_one_threshold]
+        weight = Pango.Weight.BOLD if candidates else Pango.Weight.NORMAL
+        parent = self._model.prepend(None, (
+            "%s %s" % (record.get('method', ''), record.get('path', '')),
+            len(queries), sum(q['time'] for q in queries) * 1000,
+            "%d N+1" % len(candidates) if candidates else "", "", "", 0,
+            weight, N_PLUS_ONE_COLOR if candidates else None))
+        for key, group in groups.items():
+            sql, (filename, line, function) = key
+            flagged = key in candidates
+            location = ""
+            if filename:
+                location = "%s:%d in %s" % (filename, line, function)
+            self._model.append(parent, (
+                _space_re.sub(" ", group[0]['sql'])[:SQL_DISPLAY_LENGTH],
+                len(group), sum(q['time'] for q in group) * 1000,
+                "N+1?" if flagged else "", location, filename, line,
+                Pango.Weight.BOLD if flagged else Pango.Weight.NORMAL,
+                N_PLUS_ONE_COLOR if flagged else None))
+        self._requests += 1
+        self._queries += len(queries)
+        self._candidates += len(candidates)
+        while self._model.iter_n_children(None) > self.max_requests:
+            last = self._model.iter_nth_child(None, self.max_requests)
+            self._model.remove(last)
+        self._update_summary()
+
+    def clear(self):
+        """ Remove the requests shown and empty the log they were read from. """
+        try:
+            open(self._log.name, 'wb').close()
+        except (IOError, OSError) as e:
+            logger.warn("Could not empty the query log: %s" % e)
+        self._offset = 0
+        self._partial = b""
+        self._model.clear()
+        self._requests = self._queries = self._candidates = 0
+        self._update_summary()
+
+    def _format_time(self, column, cell, model, it, index):
+        cell.set_property("text", "%.1f" % model.get_value(it, index))
+
+    def _update_summary(self):
+        self._summary.set_text("%d requests, %d queries, %d possible N+1 "
+                               "queries" % (self._requests, self._queries,
+                                            self._candidates))
+
+    def on_clear_clicked(self, button, data=None):
+        self.clear()
+
+    def on_destroy(self, widget, data=None):
+        if self._poll_id:
+            GLib.source_remove(self._poll_id)
+            self._poll_id = 0
+        try:
+            os.remove(self._log.name)
+        except OSError:
+            pass
+
+    def on_poll(self):
+        """ Read the requests appended to the log since the last poll. """
+        try:
+            size = os.path.getsize(self._log.name)
+        except OSError:
+            return True
+        if size < self._offset:
+            # the log was truncated
+            self._offset = 0
+            self._partial = b""
+        if size == self._offset:
+            return True
+        with open(self._log.name, 'rb') as f:
+            f.seek(self._offset)
+            data = self._partial + f.read()
+            self._offset = f.tell()
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            try:
+                self.add_request(json.loads(line.decode('utf-8')))
+            except (ValueError, KeyError) as e:
+                logger.warn("Invalid query log line: %s" % e)
+        return True
+
+    def on_row_activated(self, view, path, column, data=None):
+        filename = self._model[path][COL_FILE]
+        if filename and os.path.isfile(filename):
+            self.emit("open-location", filename, self._model[path][COL_LINE])
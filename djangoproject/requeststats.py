@@ -0,0 +1,99 @@
+import re
+from gi.repository import GObject, Gtk
+
+# request logs, eg. [18/Oct/2026 10:00:00] "GET / HTTP/1.1" 200 1234, the size
+# is missing from uvicorn's and the protocol from daphne's
+REQUEST_RE = re.compile(r'"(?P<method>[A-Z]+) (?P<path>\S+)(?: [A-Z]+/[\d.]+)?" '
+                        r'(?P<status>\d{3})(?: (?P<size>\d+|-))?')
+
+(COL_METHOD, COL_PATH, COL_COUNT, COL_2XX, COL_3XX, COL_4XX, COL_5XX,
+ COL_LAST, COL_MIN_SIZE, COL_AVG_SIZE, COL_MAX_SIZE, COL_TOTAL_SIZE) = range(12)
+
+def parse_request(line):
+    """
+    Return (method, path, status, size) for a request log line or None. The
+    query string is dropped from the path so requests are grouped per URL.
+    """
+    match = REQUEST_RE.search(line)
+    if not match:
+        return None
+    size = match.group('size')
+    if size in (None, '-'):
+        size = 0
+    return (match.group('method'), match.group('path').split('?', 1)[0],
+            int(match.group('status')), int(size))
+
+
+class RequestStats(Gtk.VBox):
+    """
+    A live table of the requests served by the development server with the
+    number of requests, responses per status class and response sizes for
+    each method and URL. Columns are sortable by clicking their headers.
+    """
+    __gtype_name__ = "DjangoProjectRequestStats"
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self._model = Gtk.ListStore(str, str, int, int, int, int, int, int,
+                                    int, int, int, GObject.TYPE_INT64)
+        self._rows = {}
+        treeview = Gtk.TreeView.new_with_model(self._model)
+        treeview.set_rules_hint(True)
+        columns = (("Method", COL_METHOD), ("URL", COL_PATH),
+                   ("Count", COL_COUNT), ("2xx", COL_2XX), ("3xx", COL_3XX),
+                   ("4xx", COL_4XX), ("5xx", COL_5XX), ("Last", COL_LAST),
+                   ("Min Size", COL_MIN_SIZE), ("Avg Size", COL_AVG_SIZE),
+                   ("Max Size", COL_MAX_SIZE), ("Total", COL_TOTAL_SIZE))
+        for title, index in columns:
+            cell = Gtk.CellRendererText()
+            if index not in (COL_METHOD, COL_PATH):
+                cell.set_alignment(1.0, 0.5)
+            column = Gtk.TreeViewColumn(title, cell, text=index)
+            column.set_sort_column_id(index)
+            column.set_resizable(True)
+            treeview.append_column(column)
+        self._model.set_sort_column_id(COL_COUNT, Gtk.SortType.DESCENDING)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(treeview)
+        self.pack_start(scrolled, True, True, 0)
+        self._summary = Gtk.Label()
+        self._summary.set_alignment(0.0, 0.5)
+        self.pack_start(self._summary, False, False, 2)
+        self._total = 0
+        self._errors = 0
+        self._update_summary()
+        self.show_all()
+
+    def add(self, method, path, status, size):
+        """ Count a request to path answered with status and size bytes. """
+        key = (method, path)
+        if key not in self._rows:
+            self._rows[key] = self._model.append((method, path, 0, 0, 0, 0, 0,
+                                                  0, size, 0, 0, 0))
+        row = self._model[self._rows[key]]
+        row[COL_COUNT] += 1
+        status_col = {2: COL_2XX, 3: COL_3XX, 4: COL_4XX, 5: COL_5XX}.get(
+                                                            status // 100)
+        if status_col is not None:
+            row[status_col] += 1
+        row[COL_LAST] = status
+        row[COL_MIN_SIZE] = min(row[COL_MIN_SIZE], size)
+        row[COL_MAX_SIZE] = max(row[COL_MAX_SIZE], size)
+        row[COL_TOTAL_SIZE] += size
+        row[COL_AVG_SIZE] = row[COL_TOTAL_SIZE] // row[COL_COUNT]
+        self._total += 1
+        if status >= 500:
+            self._errors += 1
+        self._update_summary()
+
+    def clear(self):
+        self._model.clear()
+        self._rows = {}
+        self._total = self._errors = 0
+        self._update_summary()
+
+    def _update_summary(self):
+        self._summary.set_text("%d requests to %d URLs, %d server errors" %
+                               (self._total, len(self._rows), self._errors))
@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from gi.repository import GObject, GLib
+from cache import cache_path, load_json, save_json
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+def hash_files(filenames):
+    """
+    Return a hash of the sizes and modification times of filenames, which
+    is cheap enough to compute on every click. Directories are hashed by the
+    Python files within them and missing files by their name alone.
+    """
+    digest = hashlib.sha1()
+    for filename in sorted(filenames):
+        digest.update(filename.encode('utf-8'))
+        paths = [filename]
+        if os.path.isdir(filename):
+            paths = []
+            for root, dirs, files in os.walk(filename):
+                dirs.sort()
+                paths += [os.path.join(root, f) for f in sorted(files)
+                          if f.endswith('.py')]
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            digest.update(("%s:%d:%r" % (path, stat.st_size,
+                                         stat.st_mtime)).encode('utf-8'))
+    return digest.hexdigest()
+
+def hash_schemas(filenames):
+    """
+    Return a hash of the schemas of the SQLite databases filenames, which
+    unlike their contents don't change as the project writes to them. A
+    database which can't be read is hashed by its size and modification time.
+    """
+    digest = hashlib.sha1()
+    for filename in sorted(filenames):
+        digest.update(filename.encode('utf-8'))
+        if not os.path.isfile(filename):
+            continue
+        try:
+            db = sqlite3.connect(filename, timeout=1.0)
+            try:
+                rows = db.execute("SELECT type, name, sql FROM sqlite_master "
+                                  "ORDER BY type, name").fetchall()
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            logger.debug("Could not read the schema of %s: %s" % (filename, e))
+            digest.update(hash_files([filename]).encode('utf-8'))
+            continue
+        for row in rows:
+            digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    The output of read-only management commands, kept on disk under the user
+    cache directory. Entries are keyed by the command, the interpreter and a
+    hash of the files the output depends on. The least recently used entries
+    are removed once the cache grows past max_size bytes.
+    """
+    def __init__(self, max_size=10485760):
+        self.max_size = max_size
+        self._dir = os.path.dirname(cache_path('results', 'index'))
+
+    def key(self, command, python, filenames, databases=()):
+        """ 
+        Return the key for command run with python given the files and the
+        schemas of the SQLite databases it depends on.
+        """
+        digest = hashlib.sha1()
+        for part in (command, python, hash_files(filenames), 
+                     hash_schemas(databases)):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """ Return the entry dict for key or None, marking it recently used. """
+        filename = os.path.join(self._dir, key + '.json')
+        entry = load_json(filename)
+        if entry is None:
+            return None
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, command, output):
+        """ Store the output of command and evict the least recently used. """
+        if len(output) > self.max_size:
+            return
+        save_json(os.path.join(self._dir, key + '.json'),
+                  {'command': command, 'output': output, 'time': time.time()})
+        self._evict()
+
+    def clear(self):
+        for name in os.listdir(self._dir):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self._dir, name))
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self._dir):
+            if not name.endswith('.json'):
+                continue
+            filename = os.path.join(self._dir, name)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            total += stat.st_size
+        entries.sort()
+        while entries and total > self.max_size:
+            mtime, size, filename = entries.pop(0)
+            logger.debug("Evicting cached result: %s" % filename)
+            self._remove(filename)
+            total -= size
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class CachedResult(GObject.Object):
+    """
+    Replays a cached command output with the "output" and "exited" signals and
+    start() method of a Process, so it can be passed to OutputBox.run_process().
+    """
+    __gtype_name__ = "DjangoProjectCachedResult"
+    __gsignals__ = {
+        "output":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+        "exited":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, entry):
+        GObject.Object.__init__(self)
+        self.entry = entry
+
+    def start(self):
+        GLib.idle_add(self.on_idle)
+
+    def on_idle(self):
+        cached = time.strftime("%Y-%m-%d %H:%M:%S",
+                               time.localtime(self.entry.get('time', 0)))
+        self.emit("output", "Cached output from %s, use Refresh Cached "
+                  "Command to run it again.\n" % cached, 'info')
+        self.emit("output", self.entry.get('output', ''), 'stdout')
+        self.emit("exited", 0)
+        return False
@@ -1,25 +1,98 @@
 import os
+import re
+import time
+import errno
 import signal
+import socket
 import subprocess
 import shlex
 import logging
 from gi.repository import GObject, Gtk, Vte, GLib
+from requeststats import RequestStats, parse_request
 
 logging.basicConfig()
 LOG_LEVEL = logging.DEBUG
 logger = logging.getLogger(__name__)
 logger.setLevel(LOG_LEVEL)
 
+DEFAULT_ADDRESS = ('127.0.0.1', 8000)
+PORT_POLL_INTERVAL = 50 # ms
+READY_POLL_INTERVAL = 50 # ms
+# the address in the start up message of runserver, gunicorn or uvicorn
+STARTING_RE = re.compile(r'(?:Starting development server at|Listening at:|'
+                         r'running on) \w+://([^\s/]+)')
+
+def envv(env):
+    """ Return an environment dict as the list fork_command_full() expects. """
+    if env is None:
+        return None
+    return ["%s=%s" % item for item in env.items()]
+
+def parse_address(args):
+    """ 
+    Return the (host, port) a runserver command line listens on, parsing the
+    optional addrport argument such as 8080, 0.0.0.0:8080 or [::1]:8080.
+    """
+    if 'runserver' not in args:
+        return DEFAULT_ADDRESS
+    for arg in args[args.index('runserver') + 1:]:
+        if arg.startswith('-'):
+            continue
+        host, sep, port = arg.rpartition(':')
+        host = host.strip('[]') or DEFAULT_ADDRESS[0]
+        try:
+            return (host, int(port))
+        except ValueError:
+            return DEFAULT_ADDRESS
+    return DEFAULT_ADDRESS
+
+def port_is_free(address):
+    """ Return True if address can be bound, ie. nothing is listening on it. """
+    family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        # runserver sets SO_REUSEADDR too, so TIME_WAIT does not block it
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(address)
+        return True
+    except socket.error as e:
+        return e.errno != errno.EADDRINUSE
+    finally:
+        sock.close()
+
+def is_listening(address):
+    """ Return True if a connection to address is accepted. """
+    host, port = address
+    # a server listening on all interfaces is reached through loopback
+    host = {'0.0.0.0': '127.0.0.1', '::': '::1', '': '127.0.0.1'}.get(host, host)
+    try:
+        sock = socket.create_connection((host, port), 0.05)
+    except (socket.error, socket.timeout):
+        return False
+    sock.close()
+    return True
+
 class DjangoServer(Gtk.HBox):
     """
     A terminal widget setup to run the Django development server management
-    command providing Start/Stop button.
+    command providing Start/Stop button. Another server such as gunicorn can
+    be run by setting command, and address to the (host, port) it listens on
+    if that is not given as a runserver addrport.
     
-    Start and stop the server by calling start() and stop() methods.
+    Start and stop the server by calling start() and stop() methods, or
+    restart() it once the port it listens on is free again. stop() interrupts
+    the server's process group as <CTRL+C> would, so runserver's autoreloader
+    child exits with it, and kills the group if it is still running after 
+    stop_timeout milliseconds.
     
     Connect to the "server-started" and "server-stopped" signals to update UI as
     the server may stop for any number of reasons, including errors in Django
-    code, pressing <CTRL+C>, or the stop button on the widget.
+    code, pressing <CTRL+C>, or the stop button on the widget. The 
+    "server-ready" signal is emitted with the seconds it took from start() 
+    until the server accepted connections.
+    
+    The request log lines the server writes are counted per URL in a table
+    beside the terminal, see get_request_stats().
     """
     __gtype_name__ = "DjangoProjectServer"
     __gsignals__ = {
@@ -29,28 +102,62 @@ class DjangoServer(Gtk.HBox):
         "server-stopped": 
             (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, 
             (GObject.TYPE_PYOBJECT,)),
+        "server-ready": 
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE, 
+            (GObject.TYPE_PYOBJECT,)),
     }
     
     def __init__(self):
         Gtk.HBox.__init__(self, homogeneous=False, spacing=0)  
         self.command = "python manage.py runserver"
         self.cwd = None
+        self.env = None
+        self.address = None
+        self.stop_timeout = 2000 # ms before SIGINT is followed by SIGKILL
+        self.port_timeout = 10.0 # seconds to wait for the port on restart
+        self.ready_timeout = 60.0 # seconds to wait for the server to listen
         self._pid = None
+        self._stop_id = 0
+        self._port_id = 0
+        self._restart_started = None
+        self._restart_from = None
+        self._started = None
+        self._ready = False
+        self._ready_id = 0
+        self._address = None
+        self._row = 0
         self._vte = Vte.Terminal()
         self._vte.set_size(self._vte.get_column_count(), 5)
         self._vte.set_size_request(200, 50)
         self._vte.set_font_from_string("monospace 10")
         self._vte.connect("child-exited", self.on_child_exited)
-        self.pack_start(self._vte, True, True, 0)
+        self._vte.connect("contents-changed", self.on_contents_changed)
+        terminal = Gtk.HBox(homogeneous=False, spacing=0)
+        terminal.pack_start(self._vte, True, True, 0)
         scrollbar = Gtk.Scrollbar.new(Gtk.Orientation.VERTICAL, self._vte.get_vadjustment())
-        self.pack_start(scrollbar, False, False, 0)
+        terminal.pack_start(scrollbar, False, False, 0)
+        self._stats = RequestStats()
+        paned = Gtk.HPaned()
+        paned.pack1(terminal, True, False)
+        paned.pack2(self._stats, False, True)
+        self.pack_start(paned, True, True, 0)
         self._button = Gtk.Button()
         self._button.connect("clicked", self.on_button_clicked)
         box = Gtk.VButtonBox()
         box.set_border_width(5)
         box.set_layout(Gtk.ButtonBoxStyle.START)
         box.add(self._button)
-        self.pack_start(box, False, False, 0)
+        self._restart_button = Gtk.Button.new_with_mnemonic("_Restart")
+        self._restart_button.set_image(Gtk.Image.new_from_stock(Gtk.STOCK_REFRESH, 
+                                                             Gtk.IconSize.BUTTON))
+        self._restart_button.connect("clicked", self.on_restart_clicked)
+        box.add(self._restart_button)
+        self._status = Gtk.Label()
+        self._status.set_alignment(0.5, 0.0)
+        vbox = Gtk.VBox(homogeneous=False, spacing=0)
+        vbox.pack_start(box, False, False, 0)
+        vbox.pack_start(self._status, False, False, 5)
+        self.pack_start(vbox, False, False, 0)
         self._start_icon = Gtk.Image.new_from_stock(Gtk.STOCK_EXECUTE, Gtk.IconSize.BUTTON)
         self._stop_icon = Gtk.Image.new_from_stock(Gtk.STOCK_STOP, Gtk.IconSize.BUTTON)
         self.refresh_ui()
@@ -62,40 +169,204 @@ class DjangoServer(Gtk.HBox):
         else:
             return False
     
+    def is_ready(self):
+        """ Return True once the running server accepts connections. """
+        return self._ready
+    
+    def get_address(self):
+        """ Return the (host, port) the server listens on. """
+        if self._address:
+            return self._address
+        if self.address:
+            return self.address
+        return parse_address(shlex.split(self.command))
+    
+    def get_request_stats(self):
+        """ Return the RequestStats table of the requests served. """
+        return self._stats
+    
     def on_button_clicked(self, widget=None, data=None):
         if self.is_running():
             self.stop()
         else:
             self.start()
+    
+    def on_restart_clicked(self, widget=None, data=None):
+        self.restart()
             
     def on_child_exited(self, vte, data=None):
         pid = self._pid
         self._pid = None
+        if self._stop_id:
+            GLib.source_remove(self._stop_id)
+            self._stop_id = 0
+        self._stop_ready_probe()
+        self._ready = False
+        self._address = None
+        # anything the server left behind in its group, like the reloader
+        self._signal_group(pid, signal.SIGKILL)
+        if self._restart_started is None:
+            self._status.set_text("")
         self.refresh_ui()
         self.emit("server-stopped", pid)
         logger.debug("Development server stopped (pid %s)" % pid)
+        if self._restart_started is not None:
+            self._wait_for_port()
     
     def set_font(self, font_name):
         self._vte.set_font_from_string(font_name)
         
+    def restart(self):
+        """ 
+        Stop the server and start it again as soon as its port is free, the
+        time this took is shown in the panel.
+        """
+        if self._restart_started is not None:
+            return
+        self._restart_started = time.time()
+        self._status.set_text("Restarting...")
+        self.refresh_ui()
+        if self.is_running():
+            self._interrupt()
+        else:
+            self._wait_for_port()
+    
+    def _wait_for_port(self):
+        if not self._port_id:
+            self._port_id = GLib.timeout_add(PORT_POLL_INTERVAL, 
+                                             self.on_port_poll)
+    
+    def on_port_poll(self):
+        if self._restart_started is None:
+            self._port_id = 0
+            return False
+        waited = time.time() - self._restart_started
+        if not port_is_free(self.get_address()) and waited < self.port_timeout:
+            return True
+        self._port_id = 0
+        started, self._restart_started = self._restart_started, None
+        self.start()
+        # the restart is timed until the server is ready again
+        self._restart_from = started
+        return False
+    
+    def _stop_ready_probe(self):
+        if self._ready_id:
+            GLib.source_remove(self._ready_id)
+            self._ready_id = 0
+    
+    def on_ready_poll(self):
+        if not self.is_running():
+            self._ready_id = 0
+            return False
+        elapsed = time.time() - self._started
+        if elapsed > self.ready_timeout:
+            logger.debug("Development server did not start listening.")
+            self._status.set_text("")
+            self._ready_id = 0
+            return False
+        if not is_listening(self.get_address()):
+            return True
+        self._ready_id = 0
+        self._ready = True
+        if self._restart_from is not None:
+            restarted = time.time() - self._restart_from
+            self._restart_from = None
+            self._status.set_text("Restarted in\n%.2fs" % restarted)
+            logger.debug("Development server restarted in %.3fs" % restarted)
+        else:
+            self._status.set_text("Ready in\n%.2fs" % elapsed)
+        logger.debug("Development server ready in %.3fs" % elapsed)
+        self.emit("server-ready", elapsed)
+        return False
+    
+    def on_contents_changed(self, vte, data=None):
+        """ Read the lines the server has finished writing since last time. """
+        col, row = vte.get_cursor_position()
+        if row < self._row:
+            # the terminal was reset
+            self._row = row
+        if row == self._row:
+            return
+        text = vte.get_text_range(self._row, 0, row - 1, 
+                                  vte.get_column_count(), 
+                                  lambda *args: True, None)
+        if isinstance(text, tuple):
+            text = text[0]
+        self._row = row
+        for line in (text or "").splitlines():
+            self._handle_line(line)
+    
+    def _handle_line(self, line):
+        match = STARTING_RE.search(line)
+        if match:
+            self._address = parse_address(['runserver', match.group(1)])
+            return
+        request = parse_request(line)
+        if request:
+            self._stats.add(*request)
+    
     def start(self):
         if self.is_running():
+            if self._stop_id:
+                # still stopping, start again once it has
+                self.restart()
             return
         args = shlex.split(self.command)
         self._pid = self._vte.fork_command_full(Vte.PtyFlags.DEFAULT, 
                                                 self.cwd,
                                                 args,
-                                                None,
+                                                envv(self.env),
                                                 GLib.SpawnFlags.SEARCH_PATH,
                                                 None, 
                                                 None)[1]  
+        self._started = time.time()
+        self._ready = False
+        self._address = None
+        self._row = self._vte.get_cursor_position()[1]
+        self._stats.clear()
+        self._status.set_text("Starting...")
+        self._stop_ready_probe()
+        self._ready_id = GLib.timeout_add(READY_POLL_INTERVAL, self.on_ready_poll)
         self.refresh_ui()                        
         self.emit("server-started", self._pid)
         logger.debug("Development server started (pid %s)" % self._pid)
         
     def stop(self):
-        if self.is_running():
-            os.kill(self._pid, signal.SIGKILL)
+        """ 
+        Interrupt the server's process group, killing it if it is still 
+        running after stop_timeout. The "server-stopped" signal is emitted 
+        once the server has exited. A pending restart is cancelled.
+        """
+        if self._restart_started is not None:
+            self._restart_started = None
+            self._status.set_text("")
+        self._restart_from = None
+        self._interrupt()
+    
+    def _interrupt(self):
+        if not self.is_running() or self._stop_id:
+            return
+        self._signal_group(self._pid, signal.SIGINT)
+        self._stop_id = GLib.timeout_add(self.stop_timeout, self.on_stop_timeout,
+                                         self._pid)
+        self.refresh_ui()
+    
+    def on_stop_timeout(self, pid):
+        self._stop_id = 0
+        if pid == self._pid:
+            logger.debug("Development server did not stop, killing it.")
+            self._signal_group(pid, signal.SIGKILL)
+        return False
+    
+    def _signal_group(self, pid, sig):
+        # the child is a session leader, so this reaches the reloader as well
+        if pid:
+            try:
+                os.killpg(pid, sig)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    logger.debug("Could not signal %s: %s" % (pid, e))
     
     def refresh_ui(self):
         if self.is_running():
@@ -105,5 +376,7 @@ class DjangoServer(Gtk.HBox):
             self._button.set_image(self._start_icon)
             self._button.set_label("Start")
         
-        self._button.set_sensitive(bool(self.cwd))
+        self._button.set_sensitive(bool(self.cwd) and not self._stop_id)
+        self._restart_button.set_sensitive(bool(self.cwd) and 
+                                           self._restart_started is None)
             
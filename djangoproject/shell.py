@@ -1,9 +1,10 @@
 import os
+import time
 import signal
-import subprocess
 import shlex
 import logging
 from gi.repository import GObject, Gtk, Vte, GLib
+from server import envv
 
 logging.basicConfig()
 LOG_LEVEL = logging.DEBUG
@@ -14,6 +15,11 @@ class Shell(Gtk.HBox):
     """
     A terminal widget setup to run as shell. The command will automatically
     re-start when it is killed.
+    
+    A standby child is kept already started on a second, hidden terminal so
+    that it can take over at once when the live child exits. A command which
+    keeps exiting within crash_time of starting is re-started with an
+    exponential backoff rather than in a tight loop.
     """
     __gtype_name__ = "DjangoProjectShell"
     
@@ -21,40 +27,141 @@ class Shell(Gtk.HBox):
         Gtk.HBox.__init__(self, homogeneous=False, spacing=0)  
         self.command = None
         self.cwd = None
+        self.env = None
+        # configurable options
+        self.standby = True
+        self.crash_time = 3.0 # seconds, exits sooner count as crashes
+        self.backoff_initial = 0.5 # seconds
+        self.backoff_max = 30.0
+        self._running = False
         self._pid = None
-        self._vte = Vte.Terminal()
-        self._vte.set_size(self._vte.get_column_count(), 5)
-        self._vte.set_size_request(200, 50)
-        self._vte.set_font_from_string("monospace 10")
-        self._vte.connect("child-exited", self.on_child_exited)
-        self.pack_start(self._vte, True, True, 0)
-        scrollbar = Gtk.Scrollbar.new(Gtk.Orientation.VERTICAL, self._vte.get_vadjustment())
-        self.pack_start(scrollbar, False, False, 0)
+        self._crashes = {} # quick exits in a row, per terminal
+        self._pids = {}
+        self._started = {}
+        self._respawn_ids = {}
+        self._terminals = []
+        for i in range(2):
+            vte = Vte.Terminal()
+            vte.set_size(vte.get_column_count(), 5)
+            vte.set_size_request(200, 50)
+            vte.set_font_from_string("monospace 10")
+            vte.connect("child-exited", self.on_child_exited)
+            self.pack_start(vte, True, True, 0)
+            self._terminals.append(vte)
+        self._vte, self._standby_vte = self._terminals
+        self._scrollbar = Gtk.Scrollbar.new(Gtk.Orientation.VERTICAL, 
+                                            self._vte.get_vadjustment())
+        self.pack_start(self._scrollbar, False, False, 0)
         self.show_all()
+        self._standby_vte.hide()
             
     def on_child_exited(self, vte, data=None):
-        logger.debug("Child exited: %s" % self._pid);
+        pid = self._pids.pop(vte, None)
+        logger.debug("Child exited: %s" % pid);
+        if not self._running or pid is None:
+            return
+        if time.time() - self._started.get(vte, 0) < self.crash_time:
+            self._crashes[vte] = self._crashes.get(vte, 0) + 1
+        else:
+            self._crashes[vte] = 0
+        if vte is self._vte and self._pids.get(self._standby_vte):
+            self._swap()
+            vte = self._standby_vte
+        self._respawn(vte)
+    
+    def _swap(self):
+        """ Show the standby terminal in place of the live one. """
+        focused = self._vte.has_focus()
+        self._vte, self._standby_vte = self._standby_vte, self._vte
+        self._pid = self._pids.get(self._vte)
+        self._scrollbar.set_adjustment(self._vte.get_vadjustment())
+        self._vte.show()
+        self._standby_vte.hide()
+        if focused:
+            self._vte.grab_focus()
+        logger.debug("Swapped in standby (pid %s)" % self._pid)
+    
+    def _respawn(self, vte):
+        """ Start the command on vte again, backing off if it is crashing. """
+        if vte is self._standby_vte and not self.standby:
+            return
+        delay = 0
+        crashes = self._crashes.get(vte, 0)
+        if crashes:
+            delay = min(self.backoff_initial * 2 ** (crashes - 1), 
+                        self.backoff_max)
+            logger.debug("Command crashed %d times, restarting in %.1fs" % (
+                         crashes, delay))
+        self._cancel_respawn(vte)
+        self._respawn_ids[vte] = GLib.timeout_add(int(delay * 1000), 
+                                                  self.on_respawn_timeout, vte)
+    
+    def _cancel_respawn(self, vte):
+        source_id = self._respawn_ids.pop(vte, 0)
+        if source_id:
+            GLib.source_remove(source_id)
+    
+    def on_respawn_timeout(self, vte):
+        self._respawn_ids.pop(vte, None)
         if self._running:
-            self.run()
+            if vte is self._standby_vte:
+                vte.reset(False, True)
+            self._spawn(vte)
+        return False
+    
+    def _spawn(self, vte):
+        args = shlex.split(self.command)
+        pid = vte.fork_command_full(Vte.PtyFlags.DEFAULT, 
+                                    self.cwd,
+                                    args,
+                                    envv(self.env),
+                                    GLib.SpawnFlags.SEARCH_PATH,
+                                    None, 
+                                    None)[1]
+        self._pids[vte] = pid
+        self._started[vte] = time.time()
+        if vte is self._vte:
+            self._pid = pid
+        logger.debug("Running %s (pid %s)" % (self.command, pid))
 
     def run(self):
+        if self._pids:
+            self.kill()
         self._running = True
-        args = shlex.split(self.command)
-        self._pid = self._vte.fork_command_full(Vte.PtyFlags.DEFAULT, 
-                                                self.cwd,
-                                                args,
-                                                None,
-                                                GLib.SpawnFlags.SEARCH_PATH,
-                                                None, 
-                                                None)[1]                         
-        logger.debug("Running %s (pid %s)" % (self.command, self._pid))
+        self._crashes = {}
+        self._spawn(self._vte)
+        if self.standby:
+            self._spawn(self._standby_vte)
+    
+    def suspend(self):
+        """ Stop the shell's processes until resume() is called. """
+        self._signal_group(signal.SIGSTOP)
+    
+    def resume(self):
+        self._signal_group(signal.SIGCONT)
+    
+    def _signal_group(self, sig):
+        # the children are session leaders, so this reaches anything they started
+        for pid in list(self._pids.values()):
+            try:
+                os.killpg(pid, sig)
+            except OSError as e:
+                logger.debug("Could not signal %s: %s" % (pid, e))
     
     def kill(self):
         self._running = False
-        if self._pid:
-            os.kill(self._pid, signal.SIGKILL)
-        self._vte.reset(False, True)
+        for vte in self._terminals:
+            self._cancel_respawn(vte)
+            pid = self._pids.pop(vte, None)
+            if pid:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError as e:
+                    logger.debug("Could not kill %s: %s" % (pid, e))
+            vte.reset(False, True)
+        self._pid = None
         
     def set_font(self, font_name):
-        self._vte.set_font_from_string(font_name)
+        for vte in self._terminals:
+            vte.set_font_from_string(font_name)
         
@@ -0,0 +1,149 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    labels TEXT NOT NULL,
+    parallel INTEGER NOT NULL,
+    duration REAL,
+    failed INTEGER
+);
+CREATE TABLE IF NOT EXISTS results (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    test TEXT NOT NULL,
+    status TEXT NOT NULL,
+    duration REAL,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS results_test ON results (test, run);
+CREATE INDEX IF NOT EXISTS results_run ON results (run);
+"""
+FAILED = ('fail', 'error', 'xpass')
+SKIPPED_DIRS = ('node_modules', 'site-packages', 'venv', 'env', '__pycache__')
+
+_holder_re = re.compile(r'^\w+ \((.+)\)$')
+
+def test_label(test):
+    """
+    Return the label to run test again with, the test case for errors in
+    setUpClass and the like which are reported as "setUpClass (module.Case)".
+    """
+    match = _holder_re.match(test)
+    return match.group(1) if match else test
+
+def changed_files(path, since):
+    """ Return the Python files under path modified after since. """
+    changed = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith('.') and
+                   d not in SKIPPED_DIRS]
+        for name in files:
+            if name.endswith('.py'):
+                filename = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(filename) > since:
+                        changed.append(filename)
+                except OSError:
+                    pass
+    return changed
+
+def affected_labels(path, apps, filenames):
+    """
+    Return the test labels affected by changes to filenames in the project at
+    path, given the apps as dicts of 'name' and 'path': a changed test module
+    is run on its own and any other change to an app runs the app's tests.
+    Returns None when a file outside the apps changed, as that can affect
+    any test.
+    """
+    app_labels = set()
+    modules = set()
+    for filename in filenames:
+        app = None
+        for config in apps:
+            if filename.startswith(config['path'] + os.sep):
+                app = config
+                break
+        if app is None:
+            return None
+        name = os.path.basename(filename)
+        module = os.path.relpath(filename, path)[:-3].replace(os.sep, '.')
+        if name.startswith('test'):
+            modules.add(module)
+        else:
+            app_labels.add(app['name'])
+    return sorted(app_labels | set(module for module in modules if not
+                  any(module.startswith(app + '.') for app in app_labels)))
+
+
+class TestHistory(object):
+    """
+    The results and durations of the tests of a project across runs, kept in
+    a SQLite database so that durations can be compared with earlier runs and
+    the failed tests of the last run run again.
+    """
+    def __init__(self, filename, max_runs=200):
+        self.filename = filename
+        self.max_runs = max_runs
+        self._db = sqlite3.connect(filename)
+        self._db.executescript(SCHEMA)
+        self._db.execute("PRAGMA foreign_keys = ON")
+
+    def close(self):
+        self._db.close()
+
+    def start_run(self, labels, parallel):
+        """ Record the start of a run, returning its id. """
+        with self._db:
+            cursor = self._db.execute("INSERT INTO runs (started, labels, "
+                                      "parallel) VALUES (?, ?, ?)",
+                                      (time.time(), " ".join(labels), parallel))
+            self._db.execute("DELETE FROM runs WHERE id <= ?",
+                             (cursor.lastrowid - self.max_runs,))
+        return cursor.lastrowid
+
+    def add(self, run, test, status, duration, message=None):
+        """ Add the result of a test, committed by finish_run(). """
+        self._db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+                         (run, test, status, duration, message))
+
+    def finish_run(self, run, duration, failed):
+        with self._db:
+            self._db.execute("UPDATE runs SET duration = ?, failed = ? "
+                             "WHERE id = ?", (duration, failed, run))
+
+    def last_started(self):
+        """ Return when the last finished run started, or None. """
+        row = self._db.execute("SELECT MAX(started) FROM runs WHERE "
+                               "duration IS NOT NULL").fetchone()
+        return row[0]
+
+    def last_failed(self):
+        """ Return the labels of the tests which failed in the last run. """
+        row = self._db.execute("SELECT MAX(id) FROM runs WHERE duration IS "
+                               "NOT NULL").fetchone()
+        if row[0] is None:
+            return []
+        rows = self._db.execute("SELECT test FROM results WHERE run = ? AND "
+                                "status IN (?, ?, ?)", (row[0],) + FAILED)
+        return sorted(set(test_label(test) for test, in rows))
+
+    def averages(self, before_run, runs=10):
+        """
+        Return the average duration of each test which passed in the last
+        runs before the run before_run, by test.
+        """
+        rows = self._db.execute("SELECT test, AVG(duration) FROM results "
+                                "WHERE status = 'pass' AND run IN (SELECT id "
+                                "FROM runs WHERE id < ? ORDER BY id DESC "
+                                "LIMIT ?) GROUP BY test", (before_run, runs))
+        return dict(rows)
@@ -0,0 +1,149 @@
+import multiprocessing
+from gi.repository import GObject, Gtk, Pango
+
+SLOWEST_TESTS = 5
+SLOWER_FACTOR = 1.5 # than the average of earlier runs, to be highlighted
+STATUS_COLORS = {'fail': '#C00000', 'error': '#C00000', 'xpass': '#C00000',
+                 'skip': '#7F7F7F', 'slower': '#C06000'}
+
+(COL_STATUS, COL_TEST, COL_TIME, COL_AVERAGE, COL_MESSAGE, COL_WEIGHT,
+ COL_FOREGROUND) = range(7)
+
+class TestPanel(Gtk.VBox):
+    """
+    The results of a test run as they arrive from the djp_test.py helper, with
+    the time each test took next to its average in earlier runs. Tests are
+    listed slowest first by default and can be sorted by clicking the column
+    headers. Failed tests are shown in red and tests much slower than their
+    average in orange.
+
+    The buttons emit the "run-tests" signal with 'all', 'failed' or 'affected'
+    for the tests to run, see get_parallel() and get_keepdb() for the options
+    to run them with.
+    """
+    __gtype_name__ = "DjangoProjectTestPanel"
+    __gsignals__ = {
+        "run-tests":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self):
+        Gtk.VBox.__init__(self, homogeneous=False, spacing=0)
+        self._counts = {}
+        self._total_time = 0.0
+        self._model = Gtk.ListStore(str, str, float, float, str, int, str)
+        self._sorted = Gtk.TreeModelSort(model=self._model)
+        self._sorted.set_sort_column_id(COL_TIME, Gtk.SortType.DESCENDING)
+
+        hbox = Gtk.HBox(homogeneous=False, spacing=6)
+        hbox.set_border_width(3)
+        self._buttons = []
+        for text, mode in (("Run _All", 'all'), ("Rerun _Failed", 'failed'),
+                           ("Run Affecte_d", 'affected')):
+            button = Gtk.Button.new_with_mnemonic(text)
+            button.connect("clicked", self.on_run_clicked, mode)
+            hbox.pack_start(button, False, False, 0)
+            self._buttons.append(button)
+        label = Gtk.Label.new_with_mnemonic("_Parallel:")
+        hbox.pack_start(label, False, False, 0)
+        try:
+            cpus = multiprocessing.cpu_count()
+        except NotImplementedError:
+            cpus = 1
+        self._parallel = Gtk.SpinButton.new_with_range(1, 256, 1)
+        self._parallel.set_value(cpus)
+        label.set_mnemonic_widget(self._parallel)
+        hbox.pack_start(self._parallel, False, False, 0)
+        self._keepdb = Gtk.CheckButton.new_with_mnemonic("_Keep database")
+        self._keepdb.set_active(True)
+        hbox.pack_start(self._keepdb, False, False, 0)
+        self._summary = Gtk.Label()
+        self._summary.set_alignment(0.0, 0.5)
+        self._summary.set_ellipsize(Pango.EllipsizeMode.END)
+        self._summary.set_selectable(True)
+        hbox.pack_start(self._summary, True, True, 0)
+        self.pack_start(hbox, False, False, 0)
+
+        view = Gtk.TreeView.new_with_model(self._sorted)
+        view.set_rules_hint(True)
+        for title, index in (("Status", COL_STATUS), ("Test", COL_TEST),
+                             ("Time (s)", COL_TIME),
+                             ("Average (s)", COL_AVERAGE),
+                             ("Message", COL_MESSAGE)):
+            cell = Gtk.CellRendererText()
+            column = Gtk.TreeViewColumn(title, cell, text=index,
+                                        weight=COL_WEIGHT,
+                                        foreground=COL_FOREGROUND)
+            if index in (COL_TIME, COL_AVERAGE):
+                cell.set_alignment(1.0, 0.5)
+                column.set_cell_data_func(cell, self._format_time, index)
+            elif index in (COL_TEST, COL_MESSAGE):
+                cell.set_property("ellipsize", Pango.EllipsizeMode.END)
+                column.set_expand(True)
+            column.set_sort_column_id(index)
+            column.set_resizable(True)
+            view.append_column(column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(view)
+        self.pack_start(scrolled, True, True, 0)
+        self.show_all()
+
+    def get_parallel(self):
+        return self._parallel.get_value_as_int()
+
+    def get_keepdb(self):
+        return self._keepdb.get_active()
+
+    def start(self, labels):
+        """ Clear the results for a run of the tests labels, [] for all. """
+        self._model.clear()
+        self._counts = {}
+        self._total_time = 0.0
+        for button in self._buttons:
+            button.set_sensitive(False)
+        self._summary.set_text("Running %s..." % (" ".join(labels) or
+                                                  "all tests"))
+
+    def add(self, record, average=None):
+        """ Add a test result sent by djp_test.py, with its average time. """
+        status = record['status']
+        seconds = record.get('time') or 0.0
+        color = STATUS_COLORS.get(status)
+        if not color and average and seconds > average * SLOWER_FACTOR:
+            color = STATUS_COLORS['slower']
+        self._model.append((status, record['test'], seconds,
+                            average if average is not None else -1.0,
+                            record.get('message') or "",
+                            Pango.Weight.BOLD if color else Pango.Weight.NORMAL,
+                            color))
+        self._counts[status] = self._counts.get(status, 0) + 1
+        self._total_time += seconds
+        self._summary.set_text(self._format_counts())
+
+    def finish(self, data=None):
+        """ Show the totals and the slowest tests once the run is over. """
+        for button in self._buttons:
+            button.set_sensitive(True)
+        if data is None:
+            self._summary.set_text(self._format_counts() + ", cancelled")
+            return
+        slowest = sorted(((row[COL_TIME], row[COL_TEST]) for row in
+                          self._model), reverse=True)[:SLOWEST_TESTS]
+        self._summary.set_text("%s in %.1fs, slowest: %s" % (
+                               self._format_counts(), data.get('time') or 0.0,
+                               ", ".join("%s %.2fs" % (test.split('.')[-1],
+                                         seconds) for seconds, test in slowest)))
+
+    def _format_counts(self):
+        return ", ".join("%d %s" % (count, status) for status, count in
+                         sorted(self._counts.items()))
+
+    def _format_time(self, column, cell, model, it, index):
+        seconds = model.get_value(it, index)
+        cell.set_property("text", "%.3f" % seconds if seconds >= 0 else "")
+
+    def on_run_clicked(self, button, mode):
+        self.emit("run-tests", mode)
@@ -0,0 +1,231 @@
+import os
+import json
+import logging
+from gi.repository import GObject, GLib, Gio
+from process import Process, HELPERS_DIR
+
+logging.basicConfig()
+LOG_LEVEL = logging.DEBUG
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+
+RESTART_DELAY = 500 # ms, lets editors finish writing files before restarting
+
+class DjangoWorker(GObject.Object):
+    """
+    A long-lived process which bootstraps Django for a project once and then
+    runs management commands through call_command, saving the start up cost of
+    'python manage.py' on every command.
+
+    Get a command to run with command(), it has the same "output" and "exited"
+    signals as a Process and can be passed to OutputBox.run_process(). The
+    worker starts on demand and restarts itself when the settings module or
+    the models of any installed app change.
+
+    Connect to the "ready" signal to be notified when Django has been set up
+    and to the "stopped" signal to be notified when the worker process exits.
+    """
+    __gtype_name__ = "DjangoProjectWorker"
+    __gsignals__ = {
+        "ready":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+        "stopped":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, python, cwd, env=None):
+        GObject.Object.__init__(self)
+        self.python = python
+        self.cwd = cwd
+        self.env = env
+        self._process = None
+        self._ready = False
+        self._buffer = ""
+        self._errors = []
+        self._next_id = 1
+        self._commands = {}
+        self._monitors = []
+        self._restart_id = 0
+        self._restart_pending = False
+
+    def command(self, args):
+        """ Return a WorkerCommand which runs args (a list) in the worker. """
+        return WorkerCommand(self, args)
+
+    def is_ready(self):
+        return self._ready
+
+    def is_running(self):
+        return self._process is not None
+
+    def restart(self):
+        """ Restart now or, if commands are running, once they have finished. """
+        if self._commands:
+            self._restart_pending = True
+            return
+        logger.debug("Restarting Django worker for %s" % self.cwd)
+        self.stop()
+        self.start()
+
+    def start(self):
+        """ Start the worker or raise OSError if it cannot be executed. """
+        if self.is_running():
+            return
+        args = [self.python, os.path.join(HELPERS_DIR, 'djp_worker.py')]
+        process = Process(args, self.cwd, self.env, stdin=True)
+        process.connect("output", self.on_process_output)
+        process.connect("exited", self.on_process_exited)
+        process.start()
+        self._process = process
+        self._ready = False
+        self._buffer = ""
+        self._errors = []
+        self._restart_pending = False
+        logger.debug("Started Django worker (pid %s)" % process.get_pid())
+
+    def stop(self):
+        """ Stop the worker, commands which are still running will fail. """
+        self._cancel_monitors()
+        if self._restart_id:
+            GLib.source_remove(self._restart_id)
+            self._restart_id = 0
+        process = self._process
+        if process:
+            self._process = None
+            self._ready = False
+            process.kill()
+            self._fail_commands("Django worker stopped.\n", None)
+            self.emit("stopped", None)
+
+    def _send(self, command):
+        if not self.is_running():
+            self.start()
+        command.id = self._next_id
+        self._next_id += 1
+        self._commands[command.id] = command
+        request = {"id": command.id, "args": command.args}
+        try:
+            self._process.write(json.dumps(request) + "\n")
+        except EnvironmentError as e:
+            # the worker died and its exit hasn't been noticed yet
+            del self._commands[command.id]
+            self.stop()
+            raise OSError("Could not send the command to the Django worker: "
+                          "%s" % e)
+
+    def _fail_commands(self, message, returncode):
+        commands, self._commands = self._commands, {}
+        for command_id in sorted(commands):
+            commands[command_id].emit("output", message, 'stderr')
+            commands[command_id].emit("exited", returncode)
+
+    def _handle(self, message):
+        if message.get("ready"):
+            self._ready = True
+            self._add_monitors(message.get("watch", []))
+            self.emit("ready", message.get("watch", []))
+            return
+        command = self._commands.get(message.get("id"))
+        if not command:
+            return
+        if "exit" in message:
+            del self._commands[command.id]
+            command.emit("exited", message["exit"])
+            if self._restart_pending and not self._commands:
+                self.restart()
+        else:
+            command.emit("output", message["data"], message["stream"])
+
+    def on_process_output(self, process, text, stream):
+        if process is not self._process:
+            return
+        if stream == 'stderr':
+            # start up errors and warnings, pass them on to a running command
+            self._errors.append(text)
+            if self._commands:
+                command = self._commands[min(self._commands)]
+                command.emit("output", text, 'stderr')
+            return
+        self._buffer += text
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warn("Unexpected worker output: %s" % line)
+                continue
+            self._handle(message)
+
+    def on_process_exited(self, process, returncode):
+        if process is not self._process:
+            return
+        logger.debug("Django worker exited: %s" % returncode)
+        self._process = None
+        self._ready = False
+        self._cancel_monitors()
+        if self._commands:
+            # errors were already passed on to the commands as they came in
+            self._fail_commands("\nDjango worker exited unexpectedly.\n",
+                                returncode)
+        self.emit("stopped", returncode)
+
+    def _add_monitors(self, filenames):
+        self._cancel_monitors()
+        for filename in filenames:
+            try:
+                monitor = Gio.File.new_for_path(filename).monitor(
+                                    Gio.FileMonitorFlags.NONE, None)
+            except GLib.GError as e:
+                logger.warn("Cannot monitor %s: %s" % (filename, e))
+                continue
+            monitor.connect("changed", self.on_file_changed)
+            self._monitors.append(monitor)
+
+    def _cancel_monitors(self):
+        for monitor in self._monitors:
+            monitor.cancel()
+        self._monitors = []
+
+    def on_file_changed(self, monitor, file, other_file, event_type):
+        if event_type not in (Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+                              Gio.FileMonitorEvent.CREATED,
+                              Gio.FileMonitorEvent.DELETED):
+            return
+        logger.debug("%s changed, restarting worker." % file.get_path())
+        if not self._restart_id:
+            self._restart_id = GLib.timeout_add(RESTART_DELAY,
+                                                self.on_restart_timeout)
+
+    def on_restart_timeout(self):
+        self._restart_id = 0
+        self.restart()
+        return False
+
+
+class WorkerCommand(GObject.Object):
+    """
+    A management command run by a DjangoWorker. It has the same "output" and
+    "exited" signals and start() method as a Process.
+    """
+    __gtype_name__ = "DjangoProjectWorkerCommand"
+    __gsignals__ = {
+        "output":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT,)),
+        "exited":
+            (GObject.SIGNAL_RUN_FIRST, GObject.TYPE_NONE,
+            (GObject.TYPE_PYOBJECT,)),
+    }
+
+    def __init__(self, worker, args):
+        GObject.Object.__init__(self)
+        self.args = args
+        self.id = None
+        self._worker = worker
+
+    def start(self):
+        """ Send the command to the worker or raise OSError if it can't start. """
+        self._worker._send(self)